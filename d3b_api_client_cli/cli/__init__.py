@@ -5,6 +5,8 @@ All commands are initialized here
 """
 
 import click
+from d3b_api_client_cli.config import config
+from d3b_api_client_cli.utils.retry import log_retry_counters
 from d3b_api_client_cli.cli.dewrangle import *
 from d3b_api_client_cli.cli.postgres import *
 from d3b_api_client_cli.cli.faker import *
@@ -25,11 +27,39 @@ def postgres():
 
 
 @click.group()
-def dewrangle():
+@click.option(
+    "--use-cache",
+    is_flag=True,
+    help="Look up entities in the persistent entity cache before querying"
+    " Dewrangle. Changes made outside this CLI are only seen once a cached"
+    " entity expires. Same as setting DEWRANGLE_ENTITY_CACHE=true",
+)
+def dewrangle(use_cache):
     """
     Group of lower level CLI commands relating to working directly with the
     Dewrangle API
     """
+    if use_cache:
+        config["dewrangle"]["cache"]["enabled"] = True
+
+
+@dewrangle.result_callback()
+def report_retries(result, **kwargs):
+    """
+    Log how many requests were retried while the command ran
+    """
+    log_retry_counters()
+    return result
+
+
+@click.group()
+def cache():
+    """
+    Group of commands to manage the local cache of Dewrangle entities
+
+    These commands always operate on the cache, so it is enabled for them
+    """
+    config["dewrangle"]["cache"]["enabled"] = True
 
 
 @click.group()
@@ -54,6 +84,7 @@ dewrangle.add_command(upsert_organization)
 dewrangle.add_command(delete_organization)
 dewrangle.add_command(read_organizations)
 dewrangle.add_command(upsert_study)
+dewrangle.add_command(upsert_studies)
 dewrangle.add_command(delete_study)
 dewrangle.add_command(read_studies)
 dewrangle.add_command(upsert_credential)
@@ -68,10 +99,17 @@ dewrangle.add_command(read_job)
 dewrangle.add_command(create_billing_group)
 dewrangle.add_command(delete_billing_group)
 dewrangle.add_command(read_billing_groups)
+dewrangle.add_command(read_snapshot)
 dewrangle.add_command(upsert_global_descriptors)
 dewrangle.add_command(download_global_descriptors)
 dewrangle.add_command(upsert_and_download_global_descriptors)
 dewrangle.add_command(upsert_and_download_global_descriptor)
+dewrangle.add_command(refresh_schema)
+dewrangle.add_command(cache)
+
+# Dewrangle entity cache commands
+cache.add_command(sync_cache)
+cache.add_command(clear_cache)
 
 # Add command groups to the root CLI
 main.add_command(dewrangle)
@@ -10,4 +10,7 @@ from d3b_api_client_cli.cli.dewrangle.credential_commands import *
 from d3b_api_client_cli.cli.dewrangle.volume_commands import *
 from d3b_api_client_cli.cli.dewrangle.job_commands import *
 from d3b_api_client_cli.cli.dewrangle.billing_group_commands import *
+from d3b_api_client_cli.cli.dewrangle.snapshot_commands import *
+from d3b_api_client_cli.cli.dewrangle.cache_commands import *
 from d3b_api_client_cli.cli.dewrangle.global_id_commands import *
+from d3b_api_client_cli.cli.dewrangle.schema_commands import *
@@ -8,7 +8,9 @@ import click
 
 from d3b_api_client_cli.config import config
 from d3b_api_client_cli.config.log import init_logger
+from d3b_api_client_cli.utils import OUTPUT_FORMATS
 from d3b_api_client_cli.dewrangle import graphql as gql_client
+from d3b_api_client_cli.dewrangle.graphql.projection import parse_fields
 
 logger = logging.getLogger(__name__)
 DEWRANGLE_DIR = config["dewrangle"]["output_dir"]
@@ -68,13 +70,37 @@ def delete_billing_group(billing_group_id, disable_delete_safety_check):
     type=click.Path(exists=False, file_okay=False, dir_okay=True),
     help="The path to the data dir where billing_groups will be written",
 )
-def read_billing_groups(output_dir):
+@click.option(
+    "--fields",
+    help="Comma separated list of fields to fetch, i.e."
+    " id,name,cavaticaBillingGroupId. All fields are fetched by default",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Checkpoint the listing in the output dir and continue an"
+    " interrupted listing from its checkpoint instead of starting over",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="json",
+    show_default=True,
+    help="json writes the whole listing at once. ndjson and csv write each"
+    " entity as its page arrives, which keeps memory flat for large tenants",
+)
+def read_billing_groups(output_dir, fields, resume, output_format):
     """
     Fetch billing_groups from Dewrangle
     """
     init_logger()
 
-    return gql_client.read_billing_groups(output_dir)
+    return gql_client.read_billing_groups(
+        output_dir,
+        fields=parse_fields(fields),
+        output_format=output_format,
+        resume=resume,
+    )
 
 
 @click.command()
@@ -0,0 +1,43 @@
+"""
+Dewrangle entity cache commands
+"""
+
+import logging
+
+import click
+
+from d3b_api_client_cli.config.log import init_logger
+from d3b_api_client_cli.dewrangle import graphql as gql_client
+from d3b_api_client_cli.dewrangle.graphql.cache import (
+    ENTITY_TYPES,
+    clear_cache as _clear_cache,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@click.command("sync")
+def sync_cache():
+    """
+    Replace the local cache of Dewrangle entities with a snapshot of all
+    organizations, studies, volumes, credentials and billing groups
+    """
+    init_logger()
+
+    return gql_client.sync_cache()
+
+
+@click.command("clear")
+@click.option(
+    "--entity-type",
+    type=click.Choice(ENTITY_TYPES),
+    help="Only remove cached entities of this type",
+)
+def clear_cache(entity_type):
+    """
+    Remove the locally cached Dewrangle entities so that the next lookups
+    go to Dewrangle
+    """
+    init_logger()
+
+    return _clear_cache(entity_type)
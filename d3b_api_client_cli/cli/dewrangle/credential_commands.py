@@ -8,8 +8,9 @@ import click
 
 from d3b_api_client_cli.config import config
 from d3b_api_client_cli.config.log import init_logger
-from d3b_api_client_cli.utils import read_json
+from d3b_api_client_cli.utils import read_json, OUTPUT_FORMATS
 from d3b_api_client_cli.dewrangle import graphql as gql_client
+from d3b_api_client_cli.dewrangle.graphql.projection import parse_fields
 
 logger = logging.getLogger(__name__)
 DEWRANGLE_DIR = config["dewrangle"]["output_dir"]
@@ -128,7 +129,28 @@ def delete_credential(
     "--study-global-id",
     help="Global ID of the study to filter credentials by",
 )
-def read_credentials(output_dir, study_global_id):
+@click.option(
+    "--fields",
+    help="Comma separated list of fields to fetch, i.e."
+    " id,key,name. All fields are fetched by default",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Checkpoint the listing in the output dir and continue an"
+    " interrupted listing from its checkpoint instead of starting over",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="json",
+    show_default=True,
+    help="json writes the whole listing at once. ndjson and csv write each"
+    " entity as its page arrives, which keeps memory flat for large tenants",
+)
+def read_credentials(
+    output_dir, study_global_id, fields, resume, output_format
+):
     """
     Fetch credentials from Dewrangle
     """
@@ -137,6 +159,9 @@ def read_credentials(output_dir, study_global_id):
     return gql_client.read_credentials(
         study_global_id,
         output_dir,
+        fields=parse_fields(fields),
+        output_format=output_format,
+        resume=resume,
     )
 
 
@@ -10,8 +10,9 @@ import click
 
 from d3b_api_client_cli.config import config
 from d3b_api_client_cli.config.log import init_logger
-from d3b_api_client_cli.utils import read_json
+from d3b_api_client_cli.utils import read_json, OUTPUT_FORMATS
 from d3b_api_client_cli.dewrangle import graphql as gql_client
+from d3b_api_client_cli.dewrangle.graphql.projection import parse_fields
 
 from pprint import pprint
 
@@ -79,10 +80,25 @@ def delete_organization(
     type=click.Path(exists=False, file_okay=False, dir_okay=True),
     help="The path to the data dir where organizations will be written",
 )
-def read_organizations(output_dir):
+@click.option(
+    "--fields",
+    help="Comma separated list of fields to fetch, i.e."
+    " id,name,website. All fields are fetched by default",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="json",
+    show_default=True,
+    help="json writes the whole listing at once. ndjson and csv write each"
+    " entity as its page arrives, which keeps memory flat for large tenants",
+)
+def read_organizations(output_dir, fields, output_format):
     """
     Fetch organizations from Dewrangle. Used in integration testing
     """
     init_logger()
 
-    return gql_client.read_organizations(output_dir)
+    return gql_client.read_organizations(
+        output_dir, fields=parse_fields(fields), output_format=output_format
+    )
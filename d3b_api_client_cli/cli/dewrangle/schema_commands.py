@@ -0,0 +1,26 @@
+"""
+Dewrangle GraphQL schema commands
+"""
+
+import logging
+
+import click
+
+from d3b_api_client_cli.config.log import init_logger
+from d3b_api_client_cli.dewrangle.graphql.common import refresh_graphql_schema
+
+logger = logging.getLogger(__name__)
+
+
+@click.command()
+def refresh_schema():
+    """
+    Discard the cached Dewrangle GraphQL schema and fetch it again from
+    Dewrangle
+    """
+    init_logger()
+
+    filepath = refresh_graphql_schema()
+    logger.info("✅ Refreshed Dewrangle GraphQL schema: %s", filepath)
+
+    return filepath
@@ -0,0 +1,31 @@
+"""
+Dewrangle snapshot commands
+"""
+
+import logging
+
+import click
+
+from d3b_api_client_cli.config import config
+from d3b_api_client_cli.config.log import init_logger
+from d3b_api_client_cli.dewrangle import graphql as gql_client
+
+logger = logging.getLogger(__name__)
+DEWRANGLE_DIR = config["dewrangle"]["output_dir"]
+
+
+@click.command()
+@click.option(
+    "--output-dir",
+    default=DEWRANGLE_DIR,
+    type=click.Path(exists=False, file_okay=False, dir_okay=True),
+    help="The path to the data dir where the entities will be written",
+)
+def read_snapshot(output_dir):
+    """
+    Fetch all organizations, studies, volumes, credentials and billing
+    groups from Dewrangle with as few requests as possible
+    """
+    init_logger()
+
+    return gql_client.read_snapshot(output_dir)
@@ -2,14 +2,20 @@
 Dewrangle study commands
 """
 
+import csv
 import logging
 
 import click
 
 from d3b_api_client_cli.config import config
 from d3b_api_client_cli.config.log import init_logger
-from d3b_api_client_cli.utils import read_json
+from d3b_api_client_cli.utils import (
+    read_json,
+    get_file_extension,
+    OUTPUT_FORMATS,
+)
 from d3b_api_client_cli.dewrangle import graphql as gql_client
+from d3b_api_client_cli.dewrangle.graphql.projection import parse_fields
 
 logger = logging.getLogger(__name__)
 DEWRANGLE_DIR = config["dewrangle"]["output_dir"]
@@ -48,6 +54,81 @@ def upsert_study(filepath, organization_id, study_id):
     return gql_client.upsert_study(data, organization_id, study_id=kf_id)
 
 
+def _read_manifest(filepath: str, organization_id: str = None) -> list[dict]:
+    """
+    Read the rows of a study manifest from a CSV file or a JSON list
+
+    Empty CSV values are dropped. Rows without an organization_id belong to
+    organization_id
+    """
+    if get_file_extension(filepath).lower() == ".csv":
+        with open(filepath, newline="") as csv_file:
+            rows = [
+                {k: v for k, v in row.items() if v not in (None, "")}
+                for row in csv.DictReader(csv_file)
+            ]
+    else:
+        rows = read_json(filepath)
+
+    if organization_id:
+        for row in rows:
+            row.setdefault("organization_id", organization_id)
+
+    return rows
+
+
+@click.command()
+@click.option(
+    "--organization-id",
+    help="ID of the Dewrangle org of the studies that do not have an"
+    " organization_id in the manifest",
+)
+@click.option(
+    "--output-dir",
+    default=DEWRANGLE_DIR,
+    type=click.Path(exists=False, file_okay=False, dir_okay=True),
+    help="The path to the data dir where the result of each row is written",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="csv",
+    show_default=True,
+    help="Format of the result file",
+)
+@click.option(
+    "--max-concurrency",
+    type=click.IntRange(min=1),
+    help="Max number of studies upserted at the same time. Defaults to the"
+    " max number of GraphQL requests in flight",
+)
+@click.argument(
+    "manifest",
+    type=click.Path(exists=True, file_okay=True, dir_okay=False),
+)
+def upsert_studies(
+    manifest, organization_id, output_dir, output_format, max_concurrency
+):
+    """
+    Upsert many studies in Dewrangle
+
+    \b
+    Arguments:
+      \b
+      manifest - Path to a CSV file or JSON list of studies. Each row has
+      the Dewrangle study attributes, the organization_id of the study and
+      optionally its kf_id
+    """
+    init_logger()
+
+    return gql_client.upsert_studies(
+        _read_manifest(manifest, organization_id=organization_id),
+        output_dir=output_dir,
+        output_format=output_format,
+        max_concurrency=max_concurrency,
+    )
+
+
 @click.command()
 @click.argument(
     "study_id",
@@ -78,13 +159,37 @@ def delete_study(study_id, disable_delete_safety_check):
     type=click.Path(exists=False, file_okay=False, dir_okay=True),
     help="The path to the data dir where studies will be written",
 )
-def read_studies(output_dir):
+@click.option(
+    "--fields",
+    help="Comma separated list of fields to fetch, i.e."
+    " id,globalId,name. All fields are fetched by default",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help="Checkpoint the listing in the output dir and continue an"
+    " interrupted listing from its checkpoint instead of starting over",
+)
+@click.option(
+    "--output-format",
+    type=click.Choice(OUTPUT_FORMATS),
+    default="json",
+    show_default=True,
+    help="json writes the whole listing at once. ndjson and csv write each"
+    " entity as its page arrives, which keeps memory flat for large tenants",
+)
+def read_studies(output_dir, fields, resume, output_format):
     """
     Fetch studies from Dewrangle
     """
     init_logger()
 
-    return gql_client.read_studies(output_dir)
+    return gql_client.read_studies(
+        output_dir,
+        fields=parse_fields(fields),
+        output_format=output_format,
+        resume=resume,
+    )
 
 
 @click.command()
@@ -20,6 +20,13 @@ if DOTENV_PATH:
 # Dewrangle
 DEWRANGLE_DEV_PAT = os.environ.get("DEWRANGLE_DEV_PAT")
 DEWRANGLE_BASE_URL = os.environ.get("DEWRANGLE_BASE_URL")
+# Opt in to the persistent cache of Dewrangle entities
+DEWRANGLE_ENTITY_CACHE = os.environ.get(
+    "DEWRANGLE_ENTITY_CACHE", ""
+).lower() in ("1", "true", "yes")
+# Opt in to client-side rate limiting, i.e. DEWRANGLE_RATE_LIMIT=10
+DEWRANGLE_RATE_LIMIT = os.environ.get("DEWRANGLE_RATE_LIMIT")
+DEWRANGLE_RATE_LIMIT_BURST = os.environ.get("DEWRANGLE_RATE_LIMIT_BURST")
 
 # DB
 DB_HOST = os.environ.get("DB_HOST")
@@ -75,8 +82,98 @@ config = {
     },
     "dewrangle": {
         "base_url": DEWRANGLE_BASE_URL,
-        "pagination": {"max_page_size": 10},
-        "client": {"execution_timeout": 30},  # seconds
+        "pagination": {
+            # Page size of connections that are not in page_sizes
+            "max_page_size": 10,
+            # Page size per connection, keyed by connection field name
+            "page_sizes": {
+                "organizationUsers": 10,
+                "studies": 10,
+                "credentials": 10,
+                "volumes": 10,
+                "billingGroups": 10,
+            },
+            # Max number of parents (i.e. studies) whose child connections
+            # are paginated at the same time
+            "max_concurrent_parents": 5,
+            # Max number of pages of each of those parents fetched ahead of
+            # the caller
+            "max_buffered_pages": 2,
+            # Request the next page of a connection while the current page is
+            # processed when the whole connection is listed
+            "prefetch": True,
+            # Grow the page size of a connection while pages come back faster
+            # than target_latency and shrink it when they are slower, so that
+            # large listings take fewer requests without risking the client
+            # execution_timeout
+            "adaptive": {
+                "enabled": False,
+                "min_page_size": 10,
+                "max_page_size": 500,
+                "target_latency": 10,  # seconds
+            },
+        },
+        # Max number of nodes fetched in one batched node query
+        "batch": {"max_batch_size": 50},
+        # Lookups memoized by the loaders during a run. Set ttl or max_size
+        # to None to keep values until the run ends
+        "loader": {
+            "ttl": 5 * 60,  # seconds
+            # Max number of values memoized per loader
+            "max_size": 10000,
+        },
+        "client": {
+            "execution_timeout": 30,  # seconds
+            # Reuse one connection pool for the whole CLI process
+            "persistent_session": True,
+            # Send only the query hash (Automatic Persisted Queries) and fall
+            # back to the full query text if Dewrangle does not support it.
+            # Off until Dewrangle is known to support persisted queries
+            "persisted_queries": False,
+            # Max number of GraphQL requests in flight at once
+            "max_concurrency": 10,
+            # Identical GraphQL queries sent at the same time by different
+            # threads or tasks share one request and response
+            "single_flight": True,
+            # Ask for gzip/deflate compressed GraphQL responses, and brotli
+            # if the brotli package is installed
+            "compression": True,
+            # Parse GraphQL responses with: auto (orjson if installed,
+            # otherwise json), orjson or json
+            "json_deserializer": "auto",
+            # Token bucket shared by every GraphQL and REST request in the
+            # process. Off (None) unless DEWRANGLE_RATE_LIMIT is set to the
+            # max requests per second. DEWRANGLE_RATE_LIMIT_BURST sets how
+            # many requests may go out at once, defaulting to the rate
+            "rate_limit": {
+                "requests_per_second": (
+                    float(DEWRANGLE_RATE_LIMIT)
+                    if DEWRANGLE_RATE_LIMIT
+                    else None
+                ),
+                "burst": (
+                    int(DEWRANGLE_RATE_LIMIT_BURST)
+                    if DEWRANGLE_RATE_LIMIT_BURST
+                    else None
+                ),
+            },
+            # Retry policy shared by the GraphQL and REST clients. Only
+            # idempotent requests and mutations marked retry-safe are retried
+            "retry": {
+                "max_attempts": 5,
+                "backoff_base": 0.5,  # seconds
+                "backoff_max": 30,  # seconds
+                # Give up instead of waiting longer than this for Retry-After
+                "max_retry_after": 120,  # seconds
+                "status_codes": [429, 502, 503, 504],
+            },
+            # aiohttp.TCPConnector limits for the persistent session
+            "connector": {
+                "limit": 100,
+                "limit_per_host": 0,
+                "keepalive_timeout": 15,  # seconds
+            },
+        },
         "endpoints": {
             "graphql": "/api/graphql",
             "rest": {
@@ -86,6 +183,29 @@ config = {
             },
         },
         "output_dir": os.path.join(ROOT_DATA_DIR, "dewrangle"),
+        "schema": {
+            # Introspected GraphQL schemas are cached here, keyed by base URL
+            "cache_dir": os.path.join(ROOT_DATA_DIR, "cache", "schema"),
+            "cache_ttl": 24 * 60 * 60,  # seconds
+        },
+        # Entities looked up by the find_* functions are cached here, keyed
+        # by base URL, and kept up to date by the create/update/delete
+        # functions. Off unless DEWRANGLE_ENTITY_CACHE is set or
+        # `dewrangle --use-cache` is used, because changes made outside the
+        # CLI are only seen once a cached entity expires
+        "cache": {
+            "enabled": DEWRANGLE_ENTITY_CACHE,
+            "path": os.path.join(ROOT_DATA_DIR, "cache", "entities.sqlite3"),
+            # Seconds a cached entity is used for before it is looked up
+            # in Dewrangle again, per entity type
+            "ttls": {
+                "organization": 24 * 60 * 60,
+                "study": 60 * 60,
+                "volume": 60 * 60,
+                "credential": 60 * 60,
+                "billing_group": 24 * 60 * 60,
+            },
+        },
         "credential_type": "AWS",
         "billing_group_id": os.environ.get("CAVATICA_BILLING_GROUP_ID"),
     },
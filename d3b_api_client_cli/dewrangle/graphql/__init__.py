@@ -6,6 +6,8 @@ Dewrangle GraphQL methods
 - CRUD volume(s)
 - CRUD credential(s)
 - Read jobs
+- Read a snapshot of the whole entity tree
+- Sync the local entity cache with a snapshot
 """
 
 from d3b_api_client_cli.dewrangle.graphql.organization import *
@@ -14,3 +16,4 @@ from d3b_api_client_cli.dewrangle.graphql.credential import *
 from d3b_api_client_cli.dewrangle.graphql.volume import *
 from d3b_api_client_cli.dewrangle.graphql.job import *
 from d3b_api_client_cli.dewrangle.graphql.billing_group import *
+from d3b_api_client_cli.dewrangle.graphql.snapshot import *
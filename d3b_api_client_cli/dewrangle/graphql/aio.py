@@ -0,0 +1,19 @@
+"""
+Asyncio versions of the Dewrangle GraphQL methods
+
+All coroutines share the process-wide GraphQL session and the number of
+requests in flight is bounded by config["dewrangle"]["client"]["max_concurrency"]
+
+- CRUD organization(s)
+- CRUD study(ies)
+- CRUD volume(s)
+- CRUD credential(s)
+- Read jobs
+"""
+
+from d3b_api_client_cli.dewrangle.graphql.organization.aio import *
+from d3b_api_client_cli.dewrangle.graphql.study.aio import *
+from d3b_api_client_cli.dewrangle.graphql.credential.aio import *
+from d3b_api_client_cli.dewrangle.graphql.volume.aio import *
+from d3b_api_client_cli.dewrangle.graphql.job.aio import *
+from d3b_api_client_cli.dewrangle.graphql.billing_group.aio import *
@@ -0,0 +1,223 @@
+"""
+Batched node queries
+
+Read many Dewrangle entities by GraphQL node ID in as few requests as
+possible. A single node query, like study.queries.study, is turned into a
+document that fetches a whole batch of nodes at once: either with the Relay
+nodes(ids:) field if the server supports it or with one aliased node field
+per ID.
+"""
+
+import asyncio
+import logging
+from pprint import pformat
+from typing import Optional
+
+from gql import gql
+from graphql import (
+    DocumentNode,
+    FieldNode,
+    GraphQLSchema,
+    get_operation_ast,
+    print_ast,
+)
+
+from d3b_api_client_cli.dewrangle.graphql.common import (
+    exec_query,
+    async_exec_query,
+    async_get_graphql_schema,
+    get_graphql_schema,
+)
+from d3b_api_client_cli.config import config
+
+logger = logging.getLogger(__name__)
+
+DEWRANGLE_MAX_BATCH_SIZE = config["dewrangle"]["batch"]["max_batch_size"]
+
+# Batched documents keyed by (id of node query, batch size or "nodes")
+_batch_documents = {}
+
+
+def _node_field(node_query: DocumentNode) -> tuple[str, FieldNode]:
+    """
+    Get the operation name and node field of a single node query
+    """
+    operation = get_operation_ast(node_query)
+    fields = operation.selection_set.selections
+    if not (
+        len(fields) == 1
+        and isinstance(fields[0], FieldNode)
+        and fields[0].name.value == "node"
+    ):
+        raise ValueError(
+            "❌ Batched queries can only be built from queries that select a"
+            " single node(id: $id) field"
+        )
+    name = operation.name.value if operation.name else "nodeQuery"
+
+    return name, fields[0]
+
+
+def _alias(index: int) -> str:
+    return f"n{index}"
+
+
+def batch_node_query(node_query: DocumentNode, size: int) -> DocumentNode:
+    """
+    Build a document that fetches size nodes with aliased node fields
+
+    Arguments:
+        node_query - a query selecting one node(id: $id) field
+        size - number of nodes in the batch
+
+    Returns:
+        A document with variables $id0 ... $id<size-1>
+    """
+    key = (id(node_query), size)
+    if key not in _batch_documents:
+        name, field = _node_field(node_query)
+        selection = print_ast(field.selection_set)
+        variables = ", ".join(f"$id{i}: ID!" for i in range(size))
+        fields = "\n".join(
+            f"{_alias(i)}: node(id: $id{i}) {selection}" for i in range(size)
+        )
+        _batch_documents[key] = gql(
+            f"query {name}Batch({variables}) {{\n{fields}\n}}"
+        )
+
+    return _batch_documents[key]
+
+
+def batch_nodes_query(node_query: DocumentNode) -> DocumentNode:
+    """
+    Build a document that fetches many nodes with the nodes(ids:) field
+    """
+    key = (id(node_query), "nodes")
+    if key not in _batch_documents:
+        name, field = _node_field(node_query)
+        selection = print_ast(field.selection_set)
+        _batch_documents[key] = gql(
+            f"query {name}Nodes($ids: [ID!]!) {{\n"
+            f"nodes(ids: $ids) {selection}\n}}"
+        )
+
+    return _batch_documents[key]
+
+
+def _supports_nodes_field(schema: Optional[GraphQLSchema]) -> bool:
+    """
+    Check whether the Dewrangle schema has a Relay nodes(ids:) field
+    """
+    return bool(schema and schema.query_type.fields.get("nodes"))
+
+
+def _chunks(node_ids: list[str], batch_size: int) -> list[list[str]]:
+    """
+    Deduplicate node IDs and split them into batches
+    """
+    if batch_size < 1:
+        raise ValueError(f"❌ Batch size must be at least 1, got {batch_size}")
+
+    node_ids = list(dict.fromkeys(node_ids))
+    return [
+        node_ids[i : i + batch_size]
+        for i in range(0, len(node_ids), batch_size)
+    ]
+
+
+def _batch_request(
+    node_query: DocumentNode, chunk: list[str], use_nodes_field: bool
+) -> tuple[DocumentNode, dict]:
+    """
+    Build the document and variables for one batch of node IDs
+    """
+    if use_nodes_field:
+        return batch_nodes_query(node_query), {"ids": chunk}
+
+    variables = {f"id{i}": node_id for i, node_id in enumerate(chunk)}
+    return batch_node_query(node_query, len(chunk)), variables
+
+
+def _store_nodes(
+    resp: dict, chunk: list[str], use_nodes_field: bool, nodes: dict
+) -> dict:
+    """
+    Store a batch of nodes into the nodes dict, keyed by node ID
+    """
+    if use_nodes_field:
+        results = resp["nodes"]
+    else:
+        results = [resp.get(_alias(i)) for i in range(len(chunk))]
+
+    for node_id, node in zip(chunk, results):
+        if not node:
+            logger.error("❌ Not Found: dewrangle node %s", node_id)
+        nodes[node_id] = node or {}
+
+    return nodes
+
+
+def read_nodes(
+    node_query: DocumentNode,
+    node_ids: list[str],
+    batch_size: int = DEWRANGLE_MAX_BATCH_SIZE,
+) -> dict:
+    """
+    Fetch many nodes by ID using ceil(len(node_ids) / batch_size) requests
+
+    Arguments:
+        node_query - a query selecting one node(id: $id) field
+        node_ids - GraphQL node IDs to fetch
+        batch_size - max number of nodes fetched in one request
+
+    Returns:
+        dict of node dicts keyed by node ID. Nodes that were not found map
+        to an empty dict
+    """
+    chunks = _chunks(node_ids, batch_size)
+    use_nodes_field = _supports_nodes_field(get_graphql_schema())
+    logger.info(
+        "📦 Fetching %s nodes in %s batched requests",
+        len(node_ids),
+        len(chunks),
+    )
+
+    nodes = {}
+    for chunk in chunks:
+        document, variables = _batch_request(node_query, chunk, use_nodes_field)
+        resp = exec_query(document, variables=variables)
+        nodes = _store_nodes(resp, chunk, use_nodes_field, nodes)
+
+    logger.debug("Fetched nodes:\n%s", pformat(nodes))
+
+    return nodes
+
+
+async def async_read_nodes(
+    node_query: DocumentNode,
+    node_ids: list[str],
+    batch_size: int = DEWRANGLE_MAX_BATCH_SIZE,
+) -> dict:
+    """
+    Fetch many nodes by ID using ceil(len(node_ids) / batch_size) requests
+
+    See read_nodes for details
+    """
+    chunks = _chunks(node_ids, batch_size)
+    use_nodes_field = _supports_nodes_field(await async_get_graphql_schema())
+
+    requests = [
+        _batch_request(node_query, chunk, use_nodes_field) for chunk in chunks
+    ]
+    responses = await asyncio.gather(
+        *[
+            async_exec_query(document, variables=variables)
+            for document, variables in requests
+        ]
+    )
+
+    nodes = {}
+    for resp, chunk in zip(responses, chunks):
+        nodes = _store_nodes(resp, chunk, use_nodes_field, nodes)
+
+    return nodes
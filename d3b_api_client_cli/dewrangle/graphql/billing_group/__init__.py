@@ -5,28 +5,47 @@ GraphQL methods to CRUD billing_group in Dewrangle
 import os
 import logging
 from pprint import pformat, pprint
+from typing import Iterator
 
 import gql
 
 from d3b_api_client_cli.dewrangle.graphql.common import (
     exec_query,
 )
+from d3b_api_client_cli.dewrangle.graphql.pagination import paginate_each
+from d3b_api_client_cli.dewrangle.graphql.projection import project
+from d3b_api_client_cli.dewrangle.graphql.checkpoint import listing_checkpoint
+from d3b_api_client_cli.dewrangle.graphql import cache
+from d3b_api_client_cli.dewrangle.graphql.loader import (
+    Loader,
+    node_loader,
+    remember_node,
+    forget_node,
+)
+from d3b_api_client_cli.dewrangle.graphql.organization.queries import (
+    ORGANIZATION_KEY_FIELDS,
+)
 from d3b_api_client_cli.dewrangle.graphql.billing_group import (
     queries,
     mutations,
 )
 from d3b_api_client_cli.dewrangle.graphql.organization import (
-    paginate_organizations,
+    iter_organizations,
+)
+from d3b_api_client_cli.dewrangle.graphql.batch import (
+    read_nodes,
+    DEWRANGLE_MAX_BATCH_SIZE,
 )
 from d3b_api_client_cli.config import config
 from d3b_api_client_cli.utils import (
     write_json,
+    stream_entities,
+    STREAMING_OUTPUT_FORMATS,
 )
 
 logger = logging.getLogger(__name__)
 
 DEWRANGLE_DIR = config["dewrangle"]["output_dir"]
-DEWRANGLE_MAX_PAGE_SIZE = config["dewrangle"]["pagination"]["max_page_size"]
 
 
 def create_or_find_billing_group(
@@ -36,6 +55,11 @@ def create_or_find_billing_group(
     Create billing_group if it does not exist, otherwise return
     the existing billing group in Dewrangle
 
+    Billing groups that were already found or created in this run, or are
+    in the entity cache, are returned without sending any request. All
+    billing groups are only paginated if the create fails, see
+    find_billing_group
+
     Arguments:
         organization_id - Dewrangle ID of organization
         cavatica_billing_group_id - Cavatica billing group ID
@@ -43,10 +67,16 @@ def create_or_find_billing_group(
     Returns:
         Dewrangle billing_group dict
     """
+    billing_group = _known_billing_group(cavatica_billing_group_id)
+    if billing_group:
+        return billing_group
+
     billing_group = create_billing_group(
         organization_id, cavatica_billing_group_id
     )
     if not billing_group:
+        # Already exists but was created outside this run
+        billing_group_index.clear()
         return find_billing_group(cavatica_billing_group_id)
     else:
         return billing_group
@@ -72,9 +102,16 @@ def create_billing_group(
         }
     }
 
-    key = "Create"
     resp = exec_query(mutations.create_billing_group, variables=params)
 
+    return _create_result(resp, organization_id)
+
+
+def _create_result(resp: dict, organization_id: str) -> dict:
+    """
+    Log the response of a billing_group create and return the billing_group
+    """
+    key = "Create"
     errors = resp.get(f"billingGroup{key}", {}).get("errors")
     if errors:
         logger.error("❌ %s billing_group failed:\n%s", key, pformat(resp))
@@ -84,6 +121,7 @@ def create_billing_group(
     result = resp["billingGroupCreate"]["billingGroup"]
     if not errors:
         result["organization_id"] = organization_id
+        _remember_billing_group(result)
 
     return result
 
@@ -110,6 +148,13 @@ def delete_billing_group(
         delete_safety_check=delete_safety_check,
     )
 
+    return _delete_result(resp, node_id)
+
+
+def _delete_result(resp: dict, node_id: str) -> dict:
+    """
+    Log the response of a billing_group delete and return the billing_group
+    """
     errors = resp.get("billingGroupDelete", {}).get("errors")
     key = "Delete"
     if errors:
@@ -119,12 +164,17 @@ def delete_billing_group(
         logger.info("✅ %s billing_group succeeded:\n%s", key, pformat(resp))
         result = resp["billingGroupDelete"]["billingGroup"]
         result["id"] = node_id
+        _forget_billing_group(result)
 
     return result
 
 
 def read_billing_groups(
-    output_dir: str = DEWRANGLE_DIR, log_output: bool = True
+    output_dir: str = DEWRANGLE_DIR,
+    log_output: bool = True,
+    fields: list[str] = None,
+    resume: bool = False,
+    output_format: str = "json",
 ) -> list[dict]:
     """
     Fetch billing_groups that the client has access to
@@ -132,17 +182,41 @@ def read_billing_groups(
     Arguments:
         output_dir - directory where billing_group metadata will be written
         log_output - whether to log billing_group dicts
+        fields - only fetch these fields of each billing_group, i.e. id,name
+        resume - checkpoint the listing in output_dir and continue an
+        interrupted listing from its checkpoint instead of starting over
+        output_format - json writes the whole listing at once. ndjson and
+        csv write each entity to the output file as its page arrives
 
     Returns:
-        List of billing_group dicts
+        List of billing_group dicts, or the path to the output file if
+        output_format is ndjson or csv
     """
-    data = paginate_billing_groups()
+    checkpoint = listing_checkpoint(
+        output_dir, "BillingGroup", key={"fields": fields}, resume=resume
+    )
+    if output_format in STREAMING_OUTPUT_FORMATS:
+        filepath = stream_entities(
+            iter_billing_groups(
+                fields=fields, prefetch=True, checkpoint=checkpoint
+            ),
+            output_dir,
+            "BillingGroup",
+            output_format,
+        )
+        if checkpoint:
+            checkpoint.clear()
+        return filepath
+
+    data = paginate_billing_groups(fields=fields, checkpoint=checkpoint)
 
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
         filepath = os.path.join(output_dir, "BillingGroup.json")
         write_json(data, filepath)
         logger.info("✏️  Wrote %s billing_group to %s", len(data), filepath)
+        if checkpoint:
+            checkpoint.clear()
 
     if log_output:
         logger.info("💰 BillingGroups:\n%s", pformat(data))
@@ -153,9 +227,19 @@ def read_billing_groups(
 def read_billing_group(node_id: str) -> dict:
     """
     Fetch billing_group by node id
+
+    The billing_group is memoized for the rest of the run
+    """
+    billing_group = node_loader(queries.billing_group).load(node_id)
+
+    return _read_result({"node": billing_group}, node_id)
+
+
+def _read_result(resp: dict, node_id: str) -> dict:
+    """
+    Log the response of a billing_group node query and return the
+    billing_group
     """
-    variables = {"id": node_id}
-    resp = exec_query(queries.billing_group, variables=variables)
     billing_group = resp.get("node", {})
 
     if billing_group:
@@ -170,71 +254,188 @@ def read_billing_group(node_id: str) -> dict:
     return billing_group
 
 
+def batch_read_billing_groups(
+    node_ids: list[str], batch_size: int = DEWRANGLE_MAX_BATCH_SIZE
+) -> dict:
+    """
+    Fetch many billing_groups by node id in ceil(len(node_ids) / batch_size)
+    requests
+
+    Returns:
+        dict of billing_group dicts keyed by node ID
+    """
+    return read_nodes(queries.billing_group, node_ids, batch_size=batch_size)
+
+
+def iter_billing_groups(
+    organizations=None,
+    billing_group_page_size=None,
+    fields=None,
+    prefetch=False,
+    checkpoint=None,
+) -> Iterator[dict]:
+    """
+    Lazily fetch the billing_groups in all organizations that the viewer has
+    access to
+
+    Pages are fetched as the caller iterates, so stopping early (i.e. once
+    the wanted billing_group is found) stops the pagination.
+    See d3b_api_client_cli.dewrangle.graphql.pagination
+
+    Set prefetch if the whole listing will be used, so that each next page
+    is requested while the current one is processed
+
+    Save each page to checkpoint if one is given and skip what it already
+    holds. See d3b_api_client_cli.dewrangle.graphql.checkpoint
+
+    Only fetch the given fields of each billing_group if fields are provided.
+    See d3b_api_client_cli.dewrangle.graphql.projection
+    """
+    if not organizations:
+        organizations = iter_organizations(fields=ORGANIZATION_KEY_FIELDS)
+
+    query = project(
+        queries.org_billing_groups,
+        fields,
+        path=queries.BILLING_GROUPS_PATH,
+        required=queries.BILLING_GROUP_KEY_FIELDS,
+    )
+
+    for org, page in paginate_each(
+        query,
+        queries.BILLING_GROUPS_PATH,
+        organizations,
+        page_size=billing_group_page_size,
+        prefetch=prefetch,
+        checkpoint=checkpoint,
+    ):
+        if not page.total_count:
+            continue
+
+        logger.info(
+            "Collecting %s billing_groups for org %s",
+            f"{page.count}/{page.total_count}",
+            org["name"],
+        )
+        for billing_group in page.nodes:
+            yield _billing_group_node(billing_group, org)
+
+
 def paginate_billing_groups(
-    organizations=None, billing_group_page_size=DEWRANGLE_MAX_PAGE_SIZE
+    organizations=None,
+    billing_group_page_size=None,
+    fields=None,
+    checkpoint=None,
 ):
     """
     Fetch all billing_groups in all organizations that the viewer has access to
 
     Use Relay graphql pagination
-    """
-    if not organizations:
-        organizations = paginate_organizations()
 
+    Returns:
+        dict of billing_group dicts keyed by Cavatica billing group ID
+
+    Only fetch the given fields of each billing_group if fields are provided.
+    See d3b_api_client_cli.dewrangle.graphql.projection
+    """
     logger.info("📄 Paginating Dewrangle billing_groups ...")
 
-    billing_groups = {}
-    for org in organizations:
-        variables = {"first": billing_group_page_size, "id": org["id"]}
-        resp = exec_query(queries.org_billing_groups, variables=variables)
-
-        count = 0
-        has_next_page = True
-        while has_next_page:
-            org_billing_groups = resp["node"]["billingGroups"]["edges"]
-            page_info = resp["node"]["billingGroups"]["pageInfo"]
-
-            count += len(org_billing_groups)
-            total = resp["node"]["billingGroups"]["totalCount"]
-
-            if not total:
-                has_next_page = False
-                continue
-
-            logger.info(
-                "Collecting %s billing_groups for org %s",
-                count / total,
-                org["name"],
-            )
-            # Add billing_groups to ouput
-            for s in org_billing_groups:
-                billing_group = s["node"]
-                billing_group["organization_id"] = org["id"]
-                billing_groups[billing_group["cavaticaBillingGroupId"]] = (
-                    billing_group
-                )
-                logger.info(
-                    "Found billing_group %s",
-                    billing_group["cavaticaBillingGroupId"],
-                )
-
-            # Fetch next page if there is one
-            has_next_page = page_info["hasNextPage"]
-            end_cursor = page_info["endCursor"]
-            if has_next_page and end_cursor:
-                variables.update({"after": end_cursor})
-                resp = exec_query(
-                    queries.org_billing_groups, variables=variables
-                )
+    return {
+        billing_group["cavaticaBillingGroupId"]: billing_group
+        for billing_group in iter_billing_groups(
+            organizations=organizations,
+            billing_group_page_size=billing_group_page_size,
+            fields=fields,
+            prefetch=True,
+            checkpoint=checkpoint,
+        )
+    }
 
-    return billing_groups
+
+def _billing_group_node(billing_group: dict, org: dict) -> dict:
+    """
+    Add the organization to a billing_group from a page of billing_groups
+    """
+    billing_group["organization_id"] = org["id"]
+    logger.info(
+        "Found billing_group %s",
+        billing_group["cavaticaBillingGroupId"],
+    )
+
+    return billing_group
 
 
 def find_billing_group(cavatica_billing_group_id: str) -> dict:
     """
     Find billing_group using cavatica billing group id.
     Use this when you don't know the org ID
+
+    Billing groups are looked up in the entity cache first, see
+    d3b_api_client_cli.dewrangle.graphql.cache. Otherwise all billing groups
+    are paginated once and indexed by cavatica billing group id for the rest
+    of the run
+
+    Returns:
+        The billing_group with every field of a page of billing groups and
+        its organization_id, or an empty dict if it was not found
+    """
+    billing_group = cache.get_entity("billing_group", cavatica_billing_group_id)
+    if billing_group:
+        return billing_group
+
+    return billing_group_index.load(cavatica_billing_group_id)
+
+
+def _known_billing_group(cavatica_billing_group_id: str) -> dict:
+    """
+    Get a billing_group from the entity cache or the billing group index
+    without loading anything
+    """
+    return cache.get_entity(
+        "billing_group", cavatica_billing_group_id
+    ) or billing_group_index.peek(cavatica_billing_group_id)
+
+
+def _load_billing_groups(cavatica_billing_group_ids: list[str]) -> dict:
+    """
+    Batch load function of billing_group_index
+
+    Paginate all billing groups once and index every one of them, not just
+    the ones requested
     """
     billing_groups = paginate_billing_groups()
+    billing_group_index.prime_all(billing_groups)
+    cache.put_entities("billing_group", billing_groups)
+
+    return billing_groups
+
 
-    return billing_groups.get(cavatica_billing_group_id, {})
+# Billing groups keyed by cavatica billing group id
+billing_group_index = Loader(_load_billing_groups, name="billing_group_index")
+
+
+def _remember_billing_group(billing_group: dict):
+    """
+    Write a created billing_group through to the loaders of the run, the
+    billing group index and the entity cache
+    """
+    if not billing_group.get("id"):
+        return
+
+    remember_node(queries.billing_group, billing_group)
+    billing_group_index.prime(
+        billing_group["cavaticaBillingGroupId"], billing_group
+    )
+    cache.put_entity(
+        "billing_group", billing_group["cavaticaBillingGroupId"], billing_group
+    )
+
+
+def _forget_billing_group(billing_group: dict):
+    """
+    Evict a deleted billing_group from the loaders of the run, the billing
+    group index and the entity cache
+    """
+    forget_node(billing_group["id"])
+    billing_group_index.clear(billing_group.get("cavaticaBillingGroupId"))
+    cache.delete_entity("billing_group", billing_group["id"])
@@ -0,0 +1,201 @@
+"""
+Asyncio versions of the GraphQL methods to CRUD billing_group in Dewrangle
+"""
+
+import logging
+from typing import AsyncIterator
+
+from d3b_api_client_cli.dewrangle.graphql.batch import (
+    async_read_nodes,
+    DEWRANGLE_MAX_BATCH_SIZE,
+)
+from d3b_api_client_cli.dewrangle.graphql.common import (
+    async_exec_query,
+)
+from d3b_api_client_cli.dewrangle.graphql.pagination import (
+    async_paginate_each,
+)
+from d3b_api_client_cli.dewrangle.graphql.projection import project
+from d3b_api_client_cli.dewrangle.graphql import cache
+from d3b_api_client_cli.dewrangle.graphql.loader import node_loader
+from d3b_api_client_cli.dewrangle.graphql.organization.queries import (
+    ORGANIZATION_KEY_FIELDS,
+)
+from d3b_api_client_cli.dewrangle.graphql.billing_group import (
+    queries,
+    mutations,
+    _create_result,
+    _delete_result,
+    _read_result,
+    _billing_group_node,
+    _known_billing_group,
+    billing_group_index,
+)
+from d3b_api_client_cli.dewrangle.graphql.organization.aio import (
+    paginate_organizations,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def create_or_find_billing_group(
+    organization_id: str, cavatica_billing_group_id: str
+) -> dict:
+    """
+    Create billing_group if it does not exist, otherwise return
+    the existing billing group in Dewrangle
+
+    See create_or_find_billing_group in
+    d3b_api_client_cli.dewrangle.graphql.billing_group
+    """
+    billing_group = _known_billing_group(cavatica_billing_group_id)
+    if billing_group:
+        return billing_group
+
+    billing_group = await create_billing_group(
+        organization_id, cavatica_billing_group_id
+    )
+    if not billing_group:
+        # Already exists but was created outside this run
+        billing_group_index.clear()
+        return await find_billing_group(cavatica_billing_group_id)
+    else:
+        return billing_group
+
+
+async def create_billing_group(
+    organization_id: str, cavatica_billing_group_id: str
+) -> dict:
+    """
+    Create billing_group in Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.billing_group.create_billing_group
+    """
+    params = {
+        "input": {
+            "organizationId": organization_id,
+            "cavaticaBillingGroupId": cavatica_billing_group_id,
+        }
+    }
+    resp = await async_exec_query(
+        mutations.create_billing_group, variables=params
+    )
+
+    return _create_result(resp, organization_id)
+
+
+async def delete_billing_group(
+    _id: str,
+    delete_safety_check: bool = True,
+) -> dict:
+    """
+    Delete billing_group in Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.billing_group.delete_billing_group
+    """
+    resp = await async_exec_query(
+        mutations.delete_billing_group,
+        variables={"id": _id},
+        delete_safety_check=delete_safety_check,
+    )
+
+    return _delete_result(resp, _id)
+
+
+async def read_billing_group(node_id: str) -> dict:
+    """
+    Fetch billing_group by node id
+
+    The billing_group is memoized for the rest of the run and concurrent
+    reads are merged into batched node queries
+    """
+    billing_group = await node_loader(queries.billing_group).load_async(node_id)
+
+    return _read_result({"node": billing_group}, node_id)
+
+
+async def batch_read_billing_groups(
+    node_ids: list[str], batch_size: int = DEWRANGLE_MAX_BATCH_SIZE
+) -> dict:
+    """
+    Fetch many billing_groups by node id in ceil(len(node_ids) / batch_size)
+    requests
+
+    Returns:
+        dict of billing_group dicts keyed by node ID
+    """
+    return await async_read_nodes(
+        queries.billing_group, node_ids, batch_size=batch_size
+    )
+
+
+async def iter_billing_groups(
+    organizations=None,
+    billing_group_page_size=None,
+    fields=None,
+    prefetch=False,
+) -> AsyncIterator[dict]:
+    """
+    Lazily fetch the billing_groups in all organizations that the viewer has
+    access to
+
+    See d3b_api_client_cli.dewrangle.graphql.billing_group.iter_billing_groups
+    """
+    if not organizations:
+        organizations = await paginate_organizations(
+            fields=ORGANIZATION_KEY_FIELDS
+        )
+
+    query = project(
+        queries.org_billing_groups,
+        fields,
+        path=queries.BILLING_GROUPS_PATH,
+        required=queries.BILLING_GROUP_KEY_FIELDS,
+    )
+
+    async for org, page in async_paginate_each(
+        query,
+        queries.BILLING_GROUPS_PATH,
+        organizations,
+        page_size=billing_group_page_size,
+        prefetch=prefetch,
+    ):
+        for billing_group in page.nodes:
+            yield _billing_group_node(billing_group, org)
+
+
+async def paginate_billing_groups(
+    organizations=None,
+    billing_group_page_size=None,
+    fields=None,
+) -> dict:
+    """
+    Fetch all billing_groups in all organizations that the viewer has access to
+
+    Use Relay graphql pagination
+    """
+    logger.info("📄 Paginating Dewrangle billing_groups ...")
+
+    return {
+        billing_group["cavaticaBillingGroupId"]: billing_group
+        async for billing_group in iter_billing_groups(
+            organizations=organizations,
+            billing_group_page_size=billing_group_page_size,
+            fields=fields,
+            prefetch=True,
+        )
+    }
+
+
+async def find_billing_group(cavatica_billing_group_id: str) -> dict:
+    """
+    Find billing_group using cavatica billing group id.
+    Use this when you don't know the org ID
+
+    See d3b_api_client_cli.dewrangle.graphql.billing_group.find_billing_group
+    """
+    billing_group = cache.get_entity("billing_group", cavatica_billing_group_id)
+    if billing_group:
+        return billing_group
+
+    return await billing_group_index.load_async(cavatica_billing_group_id)
@@ -20,6 +20,10 @@ create_billing_group = gql(
           id
           name
           cavaticaBillingGroupId
+          organization {
+            name
+            id
+          }
         }
       }
     }
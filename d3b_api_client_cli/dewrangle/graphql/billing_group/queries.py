@@ -4,6 +4,7 @@ Dewrangle GraphQL query definitions
 
 from gql import gql
 
+
 billing_group = gql(
     """
     query BillingGroupQuery($id: ID!) {
@@ -52,3 +53,8 @@ org_billing_groups = gql(
     }
   """
 )
+
+# Path from the root of org_billing_groups to each billing group and the fields
+# that are always needed to store a page of billing groups
+BILLING_GROUPS_PATH = "node.billingGroups.edges.node"
+BILLING_GROUP_KEY_FIELDS = ["id", "cavaticaBillingGroupId"]
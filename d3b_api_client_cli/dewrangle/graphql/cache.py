@@ -0,0 +1,242 @@
+"""
+Persistent cache of Dewrangle entities
+
+Organizations, studies, volumes, credentials and billing groups are cached in
+a SQLite database keyed by the Dewrangle base URL, the entity type and the
+lookup key that the find_* functions search by (i.e. the global ID of a
+study). A lookup that hits the cache returns without any network request.
+A lookup that misses falls through to Dewrangle and caches what it found.
+
+Creates, updates and deletes write through to the cache so that it stays
+consistent with the changes made by this CLI. Changes made elsewhere are
+picked up once the cached entity is older than the TTL of its type, or
+by syncing the cache with a snapshot of Dewrangle.
+
+The cache is opt-in, see config["dewrangle"]["cache"]["enabled"].
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from d3b_api_client_cli.config import config
+
+logger = logging.getLogger(__name__)
+
+ENTITY_TYPES = [
+    "organization",
+    "study",
+    "volume",
+    "credential",
+    "billing_group",
+]
+DELIMITER = "::"
+
+_connections = {}
+_lock = threading.Lock()
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS entities (
+    base_url TEXT NOT NULL,
+    type TEXT NOT NULL,
+    key TEXT NOT NULL,
+    id TEXT,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (base_url, type, key)
+)
+"""
+_CREATE_INDEX = """
+CREATE INDEX IF NOT EXISTS entities_by_id ON entities (base_url, type, id)
+"""
+
+
+def entity_key(*parts: str) -> str:
+    """
+    Build the lookup key of an entity from its parts, i.e. the study ID
+    and the key of a credential
+    """
+    return DELIMITER.join(str(part) for part in parts)
+
+
+def _is_enabled() -> bool:
+    return config["dewrangle"]["cache"]["enabled"]
+
+
+def _base_url() -> str:
+    return (config["dewrangle"]["base_url"] or "").rstrip("/")
+
+
+def _check_type(entity_type: str):
+    if entity_type not in ENTITY_TYPES:
+        raise ValueError(
+            f"❌ Unknown entity type {entity_type}. Must be one of"
+            f" {ENTITY_TYPES}"
+        )
+
+
+def _connection() -> sqlite3.Connection:
+    """
+    Get the connection to the cache database, creating it if needed
+
+    The connection is shared by every thread in the process, so callers
+    must hold the module lock while using it
+    """
+    path = config["dewrangle"]["cache"]["path"]
+    conn = _connections.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute(_CREATE_TABLE)
+        conn.execute(_CREATE_INDEX)
+        conn.commit()
+        _connections[path] = conn
+
+    return conn
+
+
+def close_cache():
+    """
+    Close the connections to the cache databases
+    """
+    with _lock:
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+
+def get_entity(entity_type: str, key: str) -> Optional[dict]:
+    """
+    Get a cached entity by its lookup key
+
+    Returns:
+        The entity or None if it is not cached or the cached entity is
+        older than the TTL in config["dewrangle"]["cache"]["ttls"]
+    """
+    _check_type(entity_type)
+    if not (_is_enabled() and key):
+        return None
+
+    with _lock:
+        row = (
+            _connection()
+            .execute(
+                "SELECT data, fetched_at FROM entities"
+                " WHERE base_url = ? AND type = ? AND key = ?",
+                (_base_url(), entity_type, key),
+            )
+            .fetchone()
+        )
+    if not row:
+        return None
+
+    data, fetched_at = row
+    ttl = config["dewrangle"]["cache"]["ttls"].get(entity_type)
+    if (ttl is not None) and (time.time() - fetched_at > ttl):
+        logger.debug("⌛️ Cached %s %s has expired", entity_type, key)
+        return None
+
+    logger.debug("Found %s %s in the cache", entity_type, key)
+    return json.loads(data)
+
+
+def put_entities(entity_type: str, entities: dict):
+    """
+    Cache entities keyed by their lookup key
+
+    Arguments:
+        entity_type - one of ENTITY_TYPES
+        entities - entities keyed by their lookup key
+    """
+    _check_type(entity_type)
+    if not (_is_enabled() and entities):
+        return
+
+    fetched_at = time.time()
+    rows = [
+        (
+            _base_url(),
+            entity_type,
+            key,
+            entity.get("id"),
+            json.dumps(entity),
+            fetched_at,
+        )
+        for key, entity in entities.items()
+        if key and entity
+    ]
+    with _lock:
+        conn = _connection()
+        conn.executemany(
+            "INSERT OR REPLACE INTO entities"
+            " (base_url, type, key, id, data, fetched_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.commit()
+
+
+def put_entity(entity_type: str, key: str, entity: dict):
+    """
+    Cache an entity by its lookup key
+
+    See put_entities
+    """
+    put_entities(entity_type, {key: entity})
+
+
+def delete_entity(entity_type: str, node_id: str):
+    """
+    Remove an entity from the cache by its Dewrangle node ID
+    """
+    _check_type(entity_type)
+    if not (_is_enabled() and node_id):
+        return
+
+    with _lock:
+        conn = _connection()
+        conn.execute(
+            "DELETE FROM entities WHERE base_url = ? AND type = ? AND id = ?",
+            (_base_url(), entity_type, node_id),
+        )
+        conn.commit()
+
+
+def clear_cache(entity_type: str = None) -> int:
+    """
+    Remove the cached entities of the current Dewrangle base URL
+
+    Arguments:
+        entity_type - only remove entities of this type. Defaults to all
+
+    Returns:
+        Number of entities removed. Nothing is removed when the cache is
+        disabled
+    """
+    if entity_type:
+        _check_type(entity_type)
+    if not _is_enabled():
+        return 0
+
+    query = "DELETE FROM entities WHERE base_url = ?"
+    params = [_base_url()]
+    if entity_type:
+        query += " AND type = ?"
+        params.append(entity_type)
+
+    with _lock:
+        conn = _connection()
+        count = conn.execute(query, params).rowcount
+        conn.commit()
+
+    logger.info(
+        "🗑️  Removed %s cached %s entities for %s",
+        count,
+        entity_type or "Dewrangle",
+        _base_url(),
+    )
+    return count
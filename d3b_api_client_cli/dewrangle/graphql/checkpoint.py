@@ -0,0 +1,164 @@
+"""
+On-disk checkpoints of long paginations
+
+While a listing paginates the child connection of many parents (i.e. the
+volumes of every study), each page is appended to a checkpoint file under
+the output directory with the parent ID, the end cursor and the entities in
+the page. Listings are only checkpointed if resume is requested. If the
+run dies, running it again with resume continues from the checkpoint:
+parents that were finished are not fetched again and the others continue
+after their last end cursor.
+
+Checkpoint files are newline delimited JSON so that a page is checkpointed
+by appending one line, no matter how many pages came before it.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Optional
+
+from d3b_api_client_cli.dewrangle.graphql.pagination import Page
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR_NAME = ".checkpoints"
+
+
+class Checkpoint:
+    """
+    Checkpoint of the pagination of a connection across many parents
+
+    Arguments:
+        output_dir - directory of the listing. The checkpoint is written to
+        the .checkpoints directory in it
+        name - name of the listing, i.e. Volume
+        key - anything that identifies the listing's arguments, i.e. the
+        fields being fetched, so that a checkpoint is only resumed by the
+        same listing
+    """
+
+    def __init__(self, output_dir: str, name: str, key: Optional[dict] = None):
+        digest = hashlib.sha256(
+            json.dumps(key or {}, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        self.filepath = os.path.join(
+            output_dir, CHECKPOINT_DIR_NAME, f"{name}-{digest[:16]}.ndjson"
+        )
+        self._parents = {}
+
+    def load(self) -> "Checkpoint":
+        """
+        Read the pages checkpointed by a previous run
+        """
+        self._parents = {}
+        if not os.path.isfile(self.filepath):
+            logger.info("No checkpoint to resume at %s", self.filepath)
+            return self
+
+        with open(self.filepath, "r") as checkpoint_file:
+            for line in checkpoint_file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The run died while writing the last line
+                    break
+                state = self._parents.setdefault(entry["parent"], {"nodes": []})
+                state["nodes"].extend(entry["nodes"])
+                state.update(
+                    {
+                        k: entry[k]
+                        for k in ["number", "cursor", "total_count", "done"]
+                    }
+                )
+
+        logger.info(
+            "⏯️  Resuming %s parents (%s finished) from %s",
+            len(self._parents),
+            len([s for s in self._parents.values() if s["done"]]),
+            self.filepath,
+        )
+        return self
+
+    def clear(self):
+        """
+        Delete the checkpoint file
+        """
+        self._parents = {}
+        if os.path.isfile(self.filepath):
+            os.remove(self.filepath)
+
+    def save(self, parent: dict, page: Page):
+        """
+        Append a page of a parent's connection to the checkpoint
+        """
+        entry = {
+            "parent": parent["id"],
+            "number": page.number,
+            "cursor": page.end_cursor,
+            "total_count": page.total_count,
+            "done": not (page.has_next_page and page.end_cursor),
+            "nodes": page.nodes,
+        }
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        with open(self.filepath, "a") as checkpoint_file:
+            checkpoint_file.write(json.dumps(entry) + "\n")
+
+    def cursors(self) -> dict:
+        """
+        End cursors of the parents that were started but not finished
+        """
+        return {
+            parent_id: state["cursor"]
+            for parent_id, state in self._parents.items()
+            if not state["done"]
+        }
+
+    def finished(self, parent_id: str) -> bool:
+        return self._parents.get(parent_id, {}).get("done", False)
+
+    def page(self, parent_id: str) -> Optional[Page]:
+        """
+        The checkpointed entities of a parent as one page, or None if the
+        parent was not started
+        """
+        state = self._parents.get(parent_id)
+        if not state:
+            return None
+
+        return Page(
+            number=state["number"],
+            nodes=state["nodes"],
+            count=len(state["nodes"]),
+            total_count=state["total_count"],
+            has_next_page=not state["done"],
+            end_cursor=state["cursor"],
+            elapsed=0.0,
+        )
+
+
+def listing_checkpoint(
+    output_dir: Optional[str],
+    name: str,
+    key: Optional[dict] = None,
+    resume: bool = False,
+) -> Optional[Checkpoint]:
+    """
+    Get the checkpoint of a read_* listing
+
+    Arguments:
+        output_dir - directory the listing is written to
+        name - name of the listing, i.e. Volume
+        key - see Checkpoint
+        resume - checkpoint the listing, continuing from the checkpoint of
+        a previous run if there is one
+
+    Returns:
+        The checkpoint or None if resume is not requested or the listing is
+        not written to a directory
+    """
+    if not (output_dir and resume):
+        return None
+
+    return Checkpoint(output_dir, name, key=key).load()
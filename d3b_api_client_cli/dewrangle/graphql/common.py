@@ -2,18 +2,39 @@
 Common functions needed to execute GraphQL queries and mutations
 """
 
+import asyncio
+import atexit
+import dataclasses
 import logging
+import threading
+from typing import Optional
 
+import aiohttp
 from gql import Client
-from gql.transport.aiohttp import AIOHTTPTransport
-from graphql import print_ast
+from gql.transport.exceptions import TransportServerError
+from graphql import DocumentNode, GraphQLSchema
 
 from d3b_api_client_cli.config import (
     config,
     DEWRANGLE_DEV_PAT,
     check_dewrangle_http_config,
 )
+from d3b_api_client_cli.dewrangle.graphql import schema
+from d3b_api_client_cli.dewrangle.graphql.operations import get_operation
+from d3b_api_client_cli.dewrangle.graphql.transport import DewrangleTransport
+from d3b_api_client_cli.dewrangle.graphql.single_flight import (
+    flight_key,
+    get_single_flight,
+    is_collapsible,
+)
 from d3b_api_client_cli import utils
+from d3b_api_client_cli.utils.rate_limit import get_rate_limiter
+from d3b_api_client_cli.utils.retry import (
+    RetryPolicy,
+    async_call_with_retry,
+    call_with_retry,
+    default_retry_policy,
+)
 
 DEWRANGLE_BASE_URL = config["dewrangle"]["base_url"]
 DEWRANGLE_MAX_PAGE_SIZE = config["dewrangle"]["pagination"]["max_page_size"]
@@ -21,14 +42,41 @@ EXECUTION_TIMEOUT = config["dewrangle"]["client"]["execution_timeout"]
 
 logger = logging.getLogger(__name__)
 graphql_client = None
+graphql_session = None
+_graphql_session_lock = threading.Lock()
 
 gql_logger = logging.getLogger("gql.transport.aiohttp")
 gql_logger.setLevel(level=logging.CRITICAL)
 
 
-def create_graphql_client() -> Client:
+class DewrangleClient(Client):
+    """
+    gql Client that validates each document against the schema only once
+    instead of on every request
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._validated = set()
+
+    def validate(self, document: DocumentNode):
+        key = (id(self.schema), id(get_operation(document)))
+        if key not in self._validated:
+            super().validate(document)
+            self._validated.add(key)
+
+
+def create_graphql_client(
+    client_session_args: dict = None, introspection: dict = None
+) -> Client:
     """
     Create a gql GraphQL client that will exec queries asynchronously
+
+    Arguments:
+        client_session_args - extra kwargs passed to aiohttp.ClientSession
+        (i.e. a shared connector)
+        introspection - a cached introspection result. If not provided the
+        schema is fetched from Dewrangle when the client connects
     """
     # Ensure env vars are set
     check_dewrangle_http_config()
@@ -40,36 +88,421 @@ def create_graphql_client() -> Client:
         "🛠️  Setting up GraphQL client for %s",
         f"{base_url.rstrip('/')}/{endpoint}",
     )
-    headers = {"x-api-key": DEWRANGLE_DEV_PAT}
+    headers = {
+        "x-api-key": DEWRANGLE_DEV_PAT,
+        "Accept-Encoding": utils.accept_encoding(),
+    }
 
-    transport = AIOHTTPTransport(url=url, headers=headers)
+    transport = DewrangleTransport(
+        url=url,
+        headers=headers,
+        client_session_args=client_session_args,
+        persisted_queries=config["dewrangle"]["client"]["persisted_queries"],
+        json_deserializer=utils.get_json_deserializer(),
+    )
 
     # Create a GraphQL client using the defined transport
-    return Client(
+    return DewrangleClient(
         transport=transport,
-        fetch_schema_from_transport=True,
+        introspection=introspection,
+        fetch_schema_from_transport=not introspection,
         execute_timeout=EXECUTION_TIMEOUT,
     )
 
 
-def exec_query(gql_query, variables=None, delete_safety_check=True):
+class GraphQLSession:
+    """
+    A long-lived GraphQL session that is shared by the whole CLI process
+
+    The session runs on its own event loop in a background thread so that
+    synchronous callers can reuse one aiohttp connection pool instead of
+    opening a new session (and TCP/TLS connection) on every query. Async
+    callers on other event loops share the same session via execute_async.
+
+    A semaphore bounds the number of requests in flight at once
+    """
+
+    def __init__(
+        self, connector_config: dict = None, max_concurrency: int = None
+    ):
+        self.connector_config = (
+            connector_config or config["dewrangle"]["client"]["connector"]
+        )
+        self.max_concurrency = (
+            max_concurrency or config["dewrangle"]["client"]["max_concurrency"]
+        )
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.connect_lock = asyncio.Lock()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever,
+            name="dewrangle-graphql-session",
+            daemon=True,
+        )
+        self.client = None
+        self.session = None
+        self.thread.start()
+
+    def _run(self, coro):
+        """
+        Run a coroutine on the background event loop and wait for the result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def _connect(self):
+        """
+        Create the client and connect it. The aiohttp connector must be
+        created inside the event loop that will use it
+
+        Use the cached schema if there is one, otherwise fetch the schema
+        from Dewrangle and cache it
+        """
+        base_url = config["dewrangle"]["base_url"]
+        introspection = schema.read_cached_introspection(base_url)
+
+        connector = aiohttp.TCPConnector(
+            limit=self.connector_config["limit"],
+            limit_per_host=self.connector_config["limit_per_host"],
+            keepalive_timeout=self.connector_config["keepalive_timeout"],
+        )
+        self.client = create_graphql_client(
+            client_session_args={"connector": connector},
+            introspection=introspection,
+        )
+        self.session = await self.client.connect_async()
+
+        if not introspection:
+            schema.write_cached_introspection(
+                base_url, self.client.introspection
+            )
+
+    async def _ensure_connected(self):
+        async with self.connect_lock:
+            if not self.session:
+                await self._connect()
+
+    async def _execute(self, gql_query, variables=None):
+        await self._ensure_connected()
+        schema.validate_variables(self.client.schema, gql_query, variables)
+        async with self.semaphore:
+            return await self.session.execute(
+                gql_query, variable_values=variables
+            )
+
+    def connect(self):
+        """
+        Connect the session if it is not already connected
+        """
+        self._run(self._ensure_connected())
+
+    async def connect_async(self):
+        """
+        Connect the session from any event loop without blocking it
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._ensure_connected(), self.loop
+        )
+        await asyncio.wrap_future(future)
+
+    def execute(self, gql_query, variables=None) -> dict:
+        """
+        Execute a GraphQL query using the shared session
+        """
+        return self._run(self._execute(gql_query, variables=variables))
+
+    async def execute_async(self, gql_query, variables=None) -> dict:
+        """
+        Execute a GraphQL query using the shared session from any event loop
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._execute(gql_query, variables=variables), self.loop
+        )
+        return await asyncio.wrap_future(future)
+
+    async def _close(self):
+        if self.session:
+            await self.client.close_async()
+        self.session = None
+        self.client = None
+
+    def close(self):
+        """
+        Close the session and its connection pool, then stop the event loop
+        """
+        if not self.loop.is_running():
+            return
+        try:
+            self._run(self._close())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+
+
+def get_graphql_session() -> GraphQLSession:
+    """
+    Get the process-wide GraphQL session, creating it if needed
+    """
+    global graphql_session
+    with _graphql_session_lock:
+        if not graphql_session:
+            graphql_session = GraphQLSession()
+            atexit.register(close_graphql_session)
+        return graphql_session
+
+
+def close_graphql_session():
+    """
+    Close the process-wide GraphQL session if one was opened
+    """
+    global graphql_session
+    with _graphql_session_lock:
+        if graphql_session:
+            logger.debug("Closing persistent GraphQL session")
+            graphql_session.close()
+            graphql_session = None
+
+
+def _check_delete(gql_query, delete_safety_check=True):
+    """
+    Raise an exception if this is a delete operation and we are not
+    allowed to delete on this host
+    """
+    base_url = config["dewrangle"]["base_url"]
+    if delete_safety_check and get_operation(gql_query).destructive:
+        utils.delete_safety_check(base_url)
+
+
+def _classify_graphql_error(e: BaseException, status_codes: tuple):
+    """
+    Decide whether a GraphQL request failed with a transient error
+
+    Dropped connections, timeouts and non GraphQL responses with one of the
+    retry status codes are transient. GraphQL errors returned by Dewrangle
+    are not
+
+    Returns:
+        (is transient, seconds from Retry-After header)
+    """
+    if isinstance(e, TransportServerError):
+        return (e.code in status_codes), getattr(e, "retry_after", None)
+
+    return (
+        isinstance(
+            e,
+            (
+                aiohttp.ClientConnectionError,
+                aiohttp.ClientPayloadError,
+                asyncio.TimeoutError,
+            ),
+        ),
+        None,
+    )
+
+
+def _retry_policy(gql_query, retry_safe: Optional[bool] = None) -> RetryPolicy:
+    """
+    Get the retry policy of an operation
+
+    Queries are retried unless retry_safe is False. Mutations are only
+    retried if retry_safe is True
+    """
+    if retry_safe is None:
+        retry_safe = get_operation(gql_query).operation_type == "query"
+
+    policy = default_retry_policy()
+    if not retry_safe:
+        policy = dataclasses.replace(policy, max_attempts=1)
+
+    return policy
+
+
+async def async_exec_query(
+    gql_query, variables=None, delete_safety_check=True, retry_safe=None
+):
+    """
+    Execute a graphql query asynchronously
+
+    All async callers in the process share one GraphQL session and the
+    number of requests in flight is bounded by
+    config["dewrangle"]["client"]["max_concurrency"]
+
+    See exec_query for details
+    """
+    _check_delete(gql_query, delete_safety_check=delete_safety_check)
+    policy = _retry_policy(gql_query, retry_safe=retry_safe)
+
+    if is_collapsible(gql_query):
+        return await get_single_flight().do_async(
+            flight_key(gql_query, variables),
+            lambda: _async_exec_query(gql_query, variables, policy),
+        )
+
+    return await _async_exec_query(gql_query, variables, policy)
+
+
+async def _async_exec_query(gql_query, variables, policy: RetryPolicy):
+    """
+    Send a graphql query asynchronously, retrying transient failures
+    """
+
+    async def execute():
+        await get_rate_limiter().acquire_async()
+        return await get_graphql_session().execute_async(
+            gql_query, variables=variables
+        )
+
+    return await async_call_with_retry(
+        execute,
+        "graphql",
+        lambda e: _classify_graphql_error(e, policy.status_codes),
+        policy,
+    )
+
+
+def exec_query(
+    gql_query, variables=None, delete_safety_check=True, retry_safe=None
+):
     """
     Execute a graphql query and handle errors gracefully
 
+    Requests are rate limited by the token bucket shared by the process.
+    See d3b_api_client_cli.utils.rate_limit
+
+    Requests that fail with a transient error are retried with exponential
+    backoff according to config["dewrangle"]["client"]["retry"]. Queries are
+    always safe to retry but mutations are only retried if retry_safe=True
+
+    Identical queries sent by other threads or tasks while this one is in
+    flight share its request and response. Mutations are never shared.
+    See d3b_api_client_cli.dewrangle.graphql.single_flight
+
     :param gql_query: gql formatted GraphQL query
     :type gql_query: graphql.language.ast.DocumentNode
     :param variables: GraphQL query variables
     :type variables: dict
+    :param retry_safe: whether the operation may be sent more than once.
+    Defaults to True for queries and False for mutations
+    :type retry_safe: bool
     :rtype: dict
     :returns: the GraphQL query response
     """
+    _check_delete(gql_query, delete_safety_check=delete_safety_check)
+    policy = _retry_policy(gql_query, retry_safe=retry_safe)
+
+    if is_collapsible(gql_query):
+        return get_single_flight().do(
+            flight_key(gql_query, variables),
+            lambda: _exec_query(gql_query, variables, policy),
+        )
+
+    return _exec_query(gql_query, variables, policy)
+
+
+def _exec_query(gql_query, variables, policy: RetryPolicy):
+    """
+    Send a graphql query, retrying transient failures
+    """
     base_url = config["dewrangle"]["base_url"]
-    str_query = print_ast(gql_query)
-    if delete_safety_check and "delete" in str_query.lower():
-        utils.delete_safety_check(base_url)
+
+    def classify(e):
+        return _classify_graphql_error(e, policy.status_codes)
+
+    if config["dewrangle"]["client"]["persistent_session"]:
+
+        def execute():
+            get_rate_limiter().acquire()
+            return get_graphql_session().execute(gql_query, variables=variables)
+
+        return call_with_retry(
+            execute,
+            "graphql",
+            classify,
+            policy,
+        )
 
     global graphql_client
     if not graphql_client:
+        graphql_client = create_graphql_client(
+            introspection=schema.read_cached_introspection(base_url)
+        )
+
+    fetch_schema = graphql_client.schema is None
+    if not fetch_schema:
+        schema.validate_variables(graphql_client.schema, gql_query, variables)
+
+    def execute():
+        get_rate_limiter().acquire()
+        return graphql_client.execute(gql_query, variable_values=variables)
+
+    resp = call_with_retry(
+        execute,
+        "graphql",
+        classify,
+        policy,
+    )
+
+    if fetch_schema and graphql_client.introspection:
+        schema.write_cached_introspection(
+            base_url, graphql_client.introspection
+        )
+
+    return resp
+
+
+def get_graphql_schema() -> Optional[GraphQLSchema]:
+    """
+    Get the Dewrangle GraphQL schema the client validates against
+
+    Returns:
+        The schema or None if it has not been fetched yet
+    """
+    if config["dewrangle"]["client"]["persistent_session"]:
+        session = get_graphql_session()
+        session.connect()
+        return session.client.schema
+
+    return graphql_client.schema if graphql_client else None
+
+
+async def async_get_graphql_schema() -> Optional[GraphQLSchema]:
+    """
+    Get the Dewrangle GraphQL schema without blocking the event loop
+
+    See get_graphql_schema
+    """
+    if config["dewrangle"]["client"]["persistent_session"]:
+        session = get_graphql_session()
+        await session.connect_async()
+        return session.client.schema
+
+    return graphql_client.schema if graphql_client else None
+
+
+def refresh_graphql_schema() -> str:
+    """
+    Discard the cached Dewrangle GraphQL schema and fetch it again
+
+    Returns:
+        Path to the cached schema file
+    """
+    global graphql_client
+
+    base_url = config["dewrangle"]["base_url"]
+    schema.clear_cached_introspection(base_url)
+
+    close_graphql_session()
+    graphql_client = None
+    if config["dewrangle"]["client"]["persistent_session"]:
+        get_graphql_session().connect()
+    else:
         graphql_client = create_graphql_client()
+        graphql_client.connect_sync()
+        try:
+            schema.write_cached_introspection(
+                base_url, graphql_client.introspection
+            )
+        finally:
+            graphql_client.close_sync()
 
-    return graphql_client.execute(gql_query, variable_values=variables)
+    return schema.schema_cache_path(base_url)
@@ -6,29 +6,49 @@ import os
 import logging
 from pprint import pformat, pprint
 from collections import defaultdict
+from typing import Iterator, Optional
 
 import gql
 
 from d3b_api_client_cli.dewrangle.graphql.common import (
     exec_query,
 )
+from d3b_api_client_cli.dewrangle.graphql.pagination import paginate_each
+from d3b_api_client_cli.dewrangle.graphql.projection import project
+from d3b_api_client_cli.dewrangle.graphql.checkpoint import listing_checkpoint
+from d3b_api_client_cli.dewrangle.graphql import cache
+from d3b_api_client_cli.dewrangle.graphql.loader import (
+    Loader,
+    node_loader,
+    remember_node,
+    forget_node,
+)
+from d3b_api_client_cli.dewrangle.graphql.study.queries import (
+    STUDY_KEY_FIELDS,
+)
 from d3b_api_client_cli.dewrangle.graphql.study import (
-    paginate_studies,
+    iter_studies,
     find_study,
+    read_study,
 )
 from d3b_api_client_cli.dewrangle.graphql.credential import (
     queries,
     mutations,
 )
+from d3b_api_client_cli.dewrangle.graphql.batch import (
+    read_nodes,
+    DEWRANGLE_MAX_BATCH_SIZE,
+)
 from d3b_api_client_cli.config import config
 from d3b_api_client_cli.utils import (
     write_json,
+    stream_entities,
+    STREAMING_OUTPUT_FORMATS,
 )
 
 logger = logging.getLogger(__name__)
 
 DEWRANGLE_DIR = config["dewrangle"]["output_dir"]
-DEWRANGLE_MAX_PAGE_SIZE = config["dewrangle"]["pagination"]["max_page_size"]
 
 
 def upsert_credential(
@@ -62,6 +82,24 @@ def upsert_credential(
     else:
         credential = find_credential(credential_key, study_id)
 
+    key, params = _upsert_params(variables, study_id, credential)
+    if credential:
+        resp = exec_query(mutations.update_credential, variables=params)
+    else:
+        resp = exec_query(mutations.create_credential, variables=params)
+
+    return _upsert_result(resp, key)
+
+
+def _upsert_params(
+    variables: dict, study_id: str, credential: Optional[dict]
+) -> tuple[str, dict]:
+    """
+    Build the mutation variables for a credential create or update
+
+    Returns:
+        the mutation key (Create or Update) and the mutation variables
+    """
     params = {"input": variables}
 
     if credential:
@@ -72,13 +110,18 @@ def upsert_credential(
             params["input"].pop(immutable_attr, None)
 
         params.update({"id": credential["id"]})
-        resp = exec_query(mutations.update_credential, variables=params)
     else:
         key = "Create"
         params["input"].update({"studyId": study_id})
         params.pop("id", None)
-        resp = exec_query(mutations.create_credential, variables=params)
 
+    return key, params
+
+
+def _upsert_result(resp: dict, key: str) -> dict:
+    """
+    Log the response of a credential create/update and return the credential
+    """
     errors = resp.get(f"credential{key}", {}).get("errors")
     if errors:
         logger.error("❌ %s credential failed:\n%s", key, pformat(resp))
@@ -89,6 +132,7 @@ def upsert_credential(
         result = resp[f"credential{key}"]["credential"]
         result["id"] = result["id"]
         result["study_id"] = result["study"]["id"]
+        _remember_credential(result)
 
     return result
 
@@ -134,6 +178,13 @@ def delete_credential(
         delete_safety_check=delete_safety_check,
     )
 
+    return _delete_result(resp, node_id)
+
+
+def _delete_result(resp: dict, node_id: str) -> dict:
+    """
+    Log the response of a credential delete and return the credential
+    """
     errors = resp.get("credentialDelete", {}).get("errors")
     key = "Delete"
     if errors:
@@ -143,6 +194,7 @@ def delete_credential(
         logger.info("✅ %s credential succeeded:\n%s", key, pformat(resp))
         result = resp["credentialDelete"]["credential"]
         result["id"] = node_id
+        _forget_credential(result)
 
     return result
 
@@ -150,15 +202,24 @@ def delete_credential(
 def read_credential(node_id: str) -> dict:
     """
     Fetch credential by node id
+
+    The credential is memoized for the rest of the run
+    """
+    credential = node_loader(queries.credential).load(node_id)
+
+    return _read_result({"node": credential}, node_id)
+
+
+def _read_result(resp: dict, node_id: str) -> dict:
+    """
+    Log the response of a credential node query and return the credential
     """
-    variables = {"id": node_id}
-    resp = exec_query(queries.credential, variables=variables)
     credential = resp.get("node", {})
 
     if credential:
         logger.info(
             "🔎  Found Dewrangle credential %s:\n%s",
-            credential["globalId"],
+            credential["id"],
             pformat(credential),
         )
     else:
@@ -167,10 +228,26 @@ def read_credential(node_id: str) -> dict:
     return credential
 
 
+def batch_read_credentials(
+    node_ids: list[str], batch_size: int = DEWRANGLE_MAX_BATCH_SIZE
+) -> dict:
+    """
+    Fetch many credentials by node id in ceil(len(node_ids) / batch_size)
+    requests
+
+    Returns:
+        dict of credential dicts keyed by node ID
+    """
+    return read_nodes(queries.credential, node_ids, batch_size=batch_size)
+
+
 def read_credentials(
     study_global_id=None,
     output_dir: str = DEWRANGLE_DIR,
     log_output: bool = True,
+    fields: list[str] = None,
+    resume: bool = False,
+    output_format: str = "json",
 ) -> list[dict]:
     """
     Fetch credentials that the client has access to
@@ -179,21 +256,53 @@ def read_credentials(
         study_global_id - Global ID of credential's study
         output_dir - directory where study metadata will be written
         log_output - whether to log study dicts
+        fields - only fetch these fields of each credential, i.e. id,name
+        resume - checkpoint the listing in output_dir and continue an
+        interrupted listing from its checkpoint instead of starting over
+        output_format - json writes the whole listing at once. ndjson and
+        csv write each entity to the output file as its page arrives
 
     Returns:
-        List of credential dicts
+        List of credential dicts, or the path to the output file if
+        output_format is ndjson or csv
     """
     study_id = None
     if study_global_id:
         study_id = find_study(study_global_id).get("id")
 
-    data = paginate_credentials(study_id=study_id)
+    checkpoint = listing_checkpoint(
+        output_dir,
+        "Credential",
+        key={"study_id": study_id, "fields": fields},
+        resume=resume,
+    )
+    if output_format in STREAMING_OUTPUT_FORMATS:
+        filepath = stream_entities(
+            iter_credentials(
+                study_id=study_id,
+                fields=fields,
+                prefetch=True,
+                checkpoint=checkpoint,
+            ),
+            output_dir,
+            "Credential",
+            output_format,
+        )
+        if checkpoint:
+            checkpoint.clear()
+        return filepath
+
+    data = paginate_credentials(
+        study_id=study_id, fields=fields, checkpoint=checkpoint
+    )
 
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
         filepath = os.path.join(output_dir, "Credential.json")
         write_json(data, filepath)
         logger.info("✏️  Wrote %s credential to %s", len(data), filepath)
+        if checkpoint:
+            checkpoint.clear()
 
     if log_output:
         logger.info("🔐 Credentials:\n%s", pformat(data))
@@ -201,8 +310,78 @@ def read_credentials(
     return data
 
 
+def iter_credentials(
+    studies=None,
+    study_id=None,
+    dewrangle_page_size=None,
+    fields=None,
+    prefetch=False,
+    checkpoint=None,
+) -> Iterator[dict]:
+    """
+    Lazily fetch the credentials in all studies that the viewer has access
+    to
+
+    Optionally filter credentials by study. Pages are fetched as the caller
+    iterates, so stopping early (i.e. once the wanted credential is found)
+    stops the pagination.
+    See d3b_api_client_cli.dewrangle.graphql.pagination
+
+    Set prefetch if the whole listing will be used, so that each next page
+    is requested while the current one is processed
+
+    Save each page to checkpoint if one is given and skip what it already
+    holds. See d3b_api_client_cli.dewrangle.graphql.checkpoint
+
+    Only fetch the given fields of each credential if fields are provided.
+    See d3b_api_client_cli.dewrangle.graphql.projection
+    """
+    if not studies and study_id:
+        study = read_study(study_id)
+        studies = [study] if study else []
+    elif not studies:
+        studies = iter_studies(fields=STUDY_KEY_FIELDS)
+    else:
+        studies = studies.values()
+
+    query = project(
+        queries.study_credentials,
+        fields,
+        path=queries.CREDENTIALS_PATH,
+        required=queries.CREDENTIAL_KEY_FIELDS,
+    )
+
+    studies = [
+        study
+        for study in studies
+        if not study_id or (study.get("id") == study_id)
+    ]
+    for study, page in paginate_each(
+        query,
+        queries.CREDENTIALS_PATH,
+        studies,
+        page_size=dewrangle_page_size,
+        prefetch=prefetch,
+        checkpoint=checkpoint,
+    ):
+        if not page.total_count:
+            continue
+
+        logger.info(
+            "Collecting %s credentials for study %s",
+            f"{page.count}/{page.total_count}",
+            study["name"],
+        )
+        for credential in page.nodes:
+            yield _credential_node(credential, study)
+
+
 def paginate_credentials(
-    studies=None, study_id=None, dewrangle_page_size=DEWRANGLE_MAX_PAGE_SIZE
+    studies=None,
+    study_id=None,
+    dewrangle_page_size=None,
+    fields=None,
+    checkpoint=None,
 ) -> dict:
     """
     Fetch all credentials in all studies that the viewer has access to
@@ -222,59 +401,131 @@ def paginate_credentials(
            },
            "credential_key2": ...
         }
+
+    Only fetch the given fields of each credential if fields are provided.
+    See d3b_api_client_cli.dewrangle.graphql.projection
     """
-    if not studies:
-        studies = paginate_studies()
+    logger.info("📄 Paginating Dewrangle credentials ...")
+
+    credentials = defaultdict(dict)
+    for credential in iter_credentials(
+        studies=studies,
+        study_id=study_id,
+        dewrangle_page_size=dewrangle_page_size,
+        fields=fields,
+        prefetch=True,
+        checkpoint=checkpoint,
+    ):
+        credentials[credential["key"]][credential["study_id"]] = credential
 
-    logger.info("📄 Paginating Dewrangle studies ...")
+    return dict(credentials)
 
-    credentials = defaultdict(lambda: defaultdict(dict))
-    for study in studies.values():
-        if study_id and (study.get("id") != study_id):
-            continue
-        variables = {"first": dewrangle_page_size, "id": study["id"]}
-        resp = exec_query(queries.study_credentials, variables=variables)
-
-        count = 0
-        has_next_page = True
-        while has_next_page:
-            study_credentials = resp["node"]["credentials"]["edges"]
-            page_info = resp["node"]["credentials"]["pageInfo"]
-
-            count += len(study_credentials)
-            total = resp["node"]["credentials"]["totalCount"]
-
-            if not total:
-                has_next_page = False
-                continue
-
-            logger.info(
-                "Collecting %s credentials for study %s",
-                count / total,
-                study["name"],
-            )
-            # Add credentials to ouput
-            for s in study_credentials:
-                credential = s["node"]
-                credential["study_id"] = study["id"]
-                credential["study_global_id"] = study["globalId"]
-                credentials[credential["key"]][study["id"]] = credential
-
-            # Fetch next page if there is one
-            has_next_page = page_info["hasNextPage"]
-            end_cursor = page_info["endCursor"]
-            if has_next_page and end_cursor:
-                variables.update({"after": end_cursor})
-                resp = exec_query(
-                    queries.study_credentials, variables=variables
-                )
 
-    return dict(credentials)
+def _credential_node(credential: dict, study: dict) -> dict:
+    """
+    Add the study to a credential from a page of credentials
+    """
+    credential["study_id"] = study["id"]
+    credential["study_global_id"] = study["globalId"]
+
+    return credential
 
 
 def find_credential(credential_key: str, study_id: str) -> dict:
     """
     Find credential using credential key and study id.
+
+    Credentials are looked up in the entity cache first, see
+    d3b_api_client_cli.dewrangle.graphql.cache. Otherwise the credentials of
+    the study are fetched once and indexed by key for the rest of the run,
+    so finding other credentials in the study costs nothing
+
+    Nothing is found without a study, since credential keys are only unique
+    within their study
+
+    Returns:
+        The credential with every field of a page of credentials and its
+        study IDs, or an empty dict if it was not found
+    """
+    if not study_id:
+        return {}
+
+    credential = cache.get_entity(
+        "credential", cache.entity_key(study_id, credential_key)
+    )
+    if credential:
+        return credential
+
+    return study_credential_index.load(study_id).get(credential_key, {})
+
+
+def _load_study_credentials(study_ids: list[str]) -> dict:
     """
-    credentials = paginate_credentials(study_id=study_id)
-    return credentials.get(credential_key, {}).get(study_id, {})
+    Batch load function of study_credential_index
+
+    Fetch all credentials of each study and index them by key
+    """
+    index = {}
+    for study_id in study_ids:
+        if not study_id:
+            # iter_credentials would list the credentials of every study
+            index[study_id] = {}
+            continue
+        index[study_id] = {
+            c["key"]: c
+            for c in iter_credentials(study_id=study_id, prefetch=True)
+        }
+        cache.put_entities(
+            "credential",
+            {
+                cache.entity_key(study_id, key): credential
+                for key, credential in index[study_id].items()
+            },
+        )
+
+    return index
+
+
+# Credentials of a study keyed by credential key, keyed by study ID
+study_credential_index = Loader(
+    _load_study_credentials, name="study_credential_index"
+)
+
+
+def _remember_credential(credential: dict):
+    """
+    Write a created or updated credential through to the loaders of the run,
+    the index of its study and the entity cache
+    """
+    if not credential.get("id"):
+        return
+
+    remember_node(queries.credential, credential)
+    study_credential_index.update(
+        credential["study_id"],
+        lambda index: {**index, credential["key"]: credential},
+    )
+    cache.put_entity(
+        "credential",
+        cache.entity_key(credential["study_id"], credential["key"]),
+        credential,
+    )
+
+
+def _forget_credential(credential: dict):
+    """
+    Evict a deleted credential from the loaders of the run, the index of its
+    study and the entity cache
+    """
+    forget_node(credential["id"])
+    study = credential.get("study") or {}
+    if study.get("id"):
+        study_credential_index.update(
+            study["id"],
+            lambda index: {
+                k: c for k, c in index.items() if c["id"] != credential["id"]
+            },
+        )
+    else:
+        study_credential_index.clear()
+    cache.delete_entity("credential", credential["id"])
@@ -0,0 +1,233 @@
+"""
+Asyncio versions of the GraphQL methods to create and delete AWS credentials
+in Dewrangle
+"""
+
+import logging
+from collections import defaultdict
+from typing import AsyncIterator
+
+from d3b_api_client_cli.dewrangle.graphql.batch import (
+    async_read_nodes,
+    DEWRANGLE_MAX_BATCH_SIZE,
+)
+from d3b_api_client_cli.dewrangle.graphql.common import (
+    async_exec_query,
+)
+from d3b_api_client_cli.dewrangle.graphql.pagination import (
+    async_paginate_each,
+)
+from d3b_api_client_cli.dewrangle.graphql.projection import project
+from d3b_api_client_cli.dewrangle.graphql import cache
+from d3b_api_client_cli.dewrangle.graphql.loader import node_loader
+from d3b_api_client_cli.dewrangle.graphql.study.queries import (
+    STUDY_KEY_FIELDS,
+)
+from d3b_api_client_cli.dewrangle.graphql.study.aio import (
+    paginate_studies,
+    find_study,
+    read_study,
+)
+from d3b_api_client_cli.dewrangle.graphql.credential import (
+    queries,
+    mutations,
+    _upsert_params,
+    _upsert_result,
+    _delete_result,
+    _read_result,
+    _credential_node,
+    study_credential_index,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def upsert_credential(
+    variables: dict, study_id=None, study_global_id=None
+) -> dict:
+    """
+    Upsert credential in Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.credential.upsert_credential
+    """
+    if not (study_id or study_global_id):
+        raise ValueError(
+            "❌ Either the graphql node ID or global ID of the credential's"
+            " study must be provided to either create or update the credential"
+        )
+
+    credential_key = variables.get("key")
+
+    # If no study id provided, try querying for it via global ID
+    if not study_id:
+        study_id = (await find_study(study_global_id)).get("id")
+
+    # Try finding existing credential
+    if not credential_key:
+        credential = None
+    else:
+        credential = await find_credential(credential_key, study_id)
+
+    key, params = _upsert_params(variables, study_id, credential)
+    if credential:
+        resp = await async_exec_query(
+            mutations.update_credential, variables=params
+        )
+    else:
+        resp = await async_exec_query(
+            mutations.create_credential, variables=params
+        )
+
+    return _upsert_result(resp, key)
+
+
+async def delete_credential(
+    node_id: str = None,
+    credential_key: str = None,
+    study_global_id: str = None,
+    delete_safety_check: bool = True,
+) -> dict:
+    """
+    Delete credential in Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.credential.delete_credential
+    """
+    if not (node_id or (credential_key and study_global_id)):
+        raise ValueError(
+            "❌ You must provide either the credential graphql ID or"
+            " credential key and study global ID to look up the credential"
+        )
+    if credential_key:
+        study_id = (await find_study(study_global_id)).get("id")
+        credential = await find_credential(credential_key, study_id)
+        node_id = credential.get("id")
+        if not node_id:
+            logger.warning(
+                "⚠️  Could not find associated dewrangle ID."
+                " Delete credential %s ABORTED",
+                node_id,
+            )
+            return
+
+    resp = await async_exec_query(
+        mutations.delete_credential,
+        variables={"id": node_id},
+        delete_safety_check=delete_safety_check,
+    )
+
+    return _delete_result(resp, node_id)
+
+
+async def read_credential(node_id: str) -> dict:
+    """
+    Fetch credential by node id
+
+    The credential is memoized for the rest of the run and concurrent reads are
+    merged into batched node queries
+    """
+    credential = await node_loader(queries.credential).load_async(node_id)
+
+    return _read_result({"node": credential}, node_id)
+
+
+async def batch_read_credentials(
+    node_ids: list[str], batch_size: int = DEWRANGLE_MAX_BATCH_SIZE
+) -> dict:
+    """
+    Fetch many credentials by node id in ceil(len(node_ids) / batch_size)
+    requests
+
+    Returns:
+        dict of credential dicts keyed by node ID
+    """
+    return await async_read_nodes(
+        queries.credential, node_ids, batch_size=batch_size
+    )
+
+
+async def iter_credentials(
+    studies=None,
+    study_id=None,
+    dewrangle_page_size=None,
+    fields=None,
+    prefetch=False,
+) -> AsyncIterator[dict]:
+    """
+    Lazily fetch the credentials in all studies that the viewer has access
+    to
+
+    See d3b_api_client_cli.dewrangle.graphql.credential.iter_credentials
+    """
+    if not studies and study_id:
+        study = await read_study(study_id)
+        studies = {study_id: study} if study else {}
+    elif not studies:
+        studies = await paginate_studies(fields=STUDY_KEY_FIELDS)
+
+    query = project(
+        queries.study_credentials,
+        fields,
+        path=queries.CREDENTIALS_PATH,
+        required=queries.CREDENTIAL_KEY_FIELDS,
+    )
+
+    studies = [
+        study
+        for study in studies.values()
+        if not study_id or (study.get("id") == study_id)
+    ]
+    async for study, page in async_paginate_each(
+        query,
+        queries.CREDENTIALS_PATH,
+        studies,
+        page_size=dewrangle_page_size,
+        prefetch=prefetch,
+    ):
+        for credential in page.nodes:
+            yield _credential_node(credential, study)
+
+
+async def paginate_credentials(
+    studies=None,
+    study_id=None,
+    dewrangle_page_size=None,
+    fields=None,
+) -> dict:
+    """
+    Fetch all credentials in all studies that the viewer has access to
+
+    See d3b_api_client_cli.dewrangle.graphql.credential.paginate_credentials
+    """
+    logger.info("📄 Paginating Dewrangle credentials ...")
+
+    credentials = defaultdict(dict)
+    async for credential in iter_credentials(
+        studies=studies,
+        study_id=study_id,
+        dewrangle_page_size=dewrangle_page_size,
+        fields=fields,
+        prefetch=True,
+    ):
+        credentials[credential["key"]][credential["study_id"]] = credential
+
+    return dict(credentials)
+
+
+async def find_credential(credential_key: str, study_id: str) -> dict:
+    """
+    Find credential using credential key and study id.
+
+    See d3b_api_client_cli.dewrangle.graphql.credential.find_credential
+    """
+    if not study_id:
+        return {}
+
+    credential = cache.get_entity(
+        "credential", cache.entity_key(study_id, credential_key)
+    )
+    if credential:
+        return credential
+
+    return (await study_credential_index.load_async(study_id)).get(
+        credential_key, {}
+    )
@@ -4,6 +4,7 @@ Dewrangle GraphQL query definitions
 
 from gql import gql
 
+
 credential = gql(
     """
     query credentialQuery($id: ID!) {
@@ -54,3 +55,8 @@ study_credentials = gql(
     }
   """
 )
+
+# Path from the root of study_credentials to each credential and the fields
+# that are always needed to store a page of credentials
+CREDENTIALS_PATH = "node.credentials.edges.node"
+CREDENTIAL_KEY_FIELDS = ["id", "key"]
@@ -15,6 +15,10 @@ from d3b_api_client_cli.dewrangle.graphql.job import (
     queries,
     mutations,
 )
+from d3b_api_client_cli.dewrangle.graphql.batch import (
+    read_nodes,
+    DEWRANGLE_MAX_BATCH_SIZE,
+)
 from d3b_api_client_cli.config import config
 from d3b_api_client_cli.utils import (
     write_json,
@@ -38,21 +42,25 @@ def poll_job(
     """
     job_query = queries.job
 
-    def is_complete(resp):
-        complete = resp["node"]["completedAt"] is not None
-        success = not resp["node"]["errors"]["edges"]
-
-        return {"complete": complete, "success": success}
-
     return _poll_job(
         job_id,
         job_query,
-        is_complete,
+        _is_complete,
         timeout_seconds=timeout_seconds,
         interval_seconds=interval_seconds,
     )
 
 
+def _is_complete(resp: dict) -> dict:
+    """
+    Determine whether a Dewrangle job is complete and if it succeeded
+    """
+    complete = resp["node"]["completedAt"] is not None
+    success = not resp["node"]["errors"]["edges"]
+
+    return {"complete": complete, "success": success}
+
+
 def _validate_status_format(status: dict):
     """
     Validate that the deveoper supplied a properly formatted function for
@@ -101,7 +109,6 @@ def _poll_job(
         job is not complete
 
     """
-    elapsed_time_seconds = 0
     start_time = time.time()
 
     while True:
@@ -109,60 +116,83 @@ def _poll_job(
         params = {"id": job_id}
         resp = exec_query(job_query, variables=params)
 
-        job = resp["node"]
-        node_id = job["id"]
-        operation = job["operation"].lower().replace("_", "-")
-
-        # Check completion status
-        status = complete_function(resp)
-        _validate_status_format(status)
-
-        # Job completed
-        if status["complete"] or (not status["success"]):
-            success = status["success"]
-            emoji = "✅ " if success else "❌"
-            suffix = "" if success else " with errors"
-            logger.info(
-                "%s Job %s %s completed%s:\n%s",
-                emoji,
-                operation,
-                node_id,
-                suffix,
-                pformat(job),
-            )
+        result = _check_job(
+            resp, complete_function, start_time, timeout_seconds
+        )
+        if result:
+            return result
 
-            return {"success": status["complete"], "job": job}
+        time.sleep(interval_seconds)
 
-        elapsed_time_seconds = time.time() - start_time
-        elapsed_formatted = time.strftime(
-            "%H:%M:%S", time.gmtime(elapsed_time_seconds)
-        )
 
-        # Timeout exceeded
-        if (timeout_seconds is not None) and (
-            elapsed_time_seconds > timeout_seconds
-        ):
-            logger.warning(
-                "⚠️  Timeout of %s seconds expired."
-                " Current job %s %s result:\n%s"
-                "\n✌️ Dewrangle must still be working, but CLI is exiting",
-                timeout_seconds,
-                operation,
-                node_id,
-                pformat(job),
-            )
-            return {"success": None, "job": job}
+def _check_job(
+    resp: dict,
+    complete_function: Callable[[dict], dict],
+    start_time: float,
+    timeout_seconds: Optional[int] = None,
+) -> Optional[dict]:
+    """
+    Check the status of a polled Dewrangle job
 
-        # Continue polling
+    See _poll_job for details
+
+    Returns:
+        The poll result if the job is complete or the timeout is exceeded
+        or None if polling should continue
+    """
+    job = resp["node"]
+    node_id = job["id"]
+    operation = job["operation"].lower().replace("_", "-")
+
+    # Check completion status
+    status = complete_function(resp)
+    _validate_status_format(status)
+
+    # Job completed
+    if status["complete"] or (not status["success"]):
+        success = status["success"]
+        emoji = "✅ " if success else "❌"
+        suffix = "" if success else " with errors"
         logger.info(
-            "⏰ Waiting for job %s %s to"
-            " complete. Elapsed time (hh:mm:ss): %s",
+            "%s Job %s %s completed%s:\n%s",
+            emoji,
             operation,
             node_id,
-            elapsed_formatted,
+            suffix,
+            pformat(job),
         )
 
-        time.sleep(interval_seconds)
+        return {"success": status["complete"], "job": job}
+
+    elapsed_time_seconds = time.time() - start_time
+    elapsed_formatted = time.strftime(
+        "%H:%M:%S", time.gmtime(elapsed_time_seconds)
+    )
+
+    # Timeout exceeded
+    if (timeout_seconds is not None) and (
+        elapsed_time_seconds > timeout_seconds
+    ):
+        logger.warning(
+            "⚠️  Timeout of %s seconds expired."
+            " Current job %s %s result:\n%s"
+            "\n✌️ Dewrangle must still be working, but CLI is exiting",
+            timeout_seconds,
+            operation,
+            node_id,
+            pformat(job),
+        )
+        return {"success": None, "job": job}
+
+    # Continue polling
+    logger.info(
+        "⏰ Waiting for job %s %s to complete. Elapsed time (hh:mm:ss): %s",
+        operation,
+        node_id,
+        elapsed_formatted,
+    )
+
+    return None
 
 
 def read_job(node_id: str, output_dir: str = DEWRANGLE_DIR) -> dict:
@@ -172,6 +202,15 @@ def read_job(node_id: str, output_dir: str = DEWRANGLE_DIR) -> dict:
     params = {"id": node_id}
 
     resp = exec_query(queries.job, variables=params)
+
+    return _read_job_result(resp, output_dir=output_dir)
+
+
+def _read_job_result(resp: dict, output_dir: str = DEWRANGLE_DIR) -> dict:
+    """
+    Log the response of a job node query, write the job to file and return
+    the job
+    """
     result = resp["node"]
     logger.info("Fetched job %s", result["id"])
     operation = result["operation"].lower().replace("_", "-")
@@ -196,3 +235,16 @@ def read_job(node_id: str, output_dir: str = DEWRANGLE_DIR) -> dict:
         )
 
     return result
+
+
+def batch_read_jobs(
+    node_ids: list[str], batch_size: int = DEWRANGLE_MAX_BATCH_SIZE
+) -> dict:
+    """
+    Fetch many jobs by node id in ceil(len(node_ids) / batch_size)
+    requests
+
+    Returns:
+        dict of job dicts keyed by node ID
+    """
+    return read_nodes(queries.job, node_ids, batch_size=batch_size)
@@ -0,0 +1,92 @@
+"""
+Asyncio versions of the GraphQL methods for jobs in Dewrangle
+"""
+
+import asyncio
+import time
+import logging
+from typing import Callable, Optional
+
+from graphql import DocumentNode
+
+from d3b_api_client_cli.dewrangle.graphql.batch import (
+    async_read_nodes,
+    DEWRANGLE_MAX_BATCH_SIZE,
+)
+from d3b_api_client_cli.dewrangle.graphql.common import async_exec_query
+from d3b_api_client_cli.dewrangle.graphql.job import (
+    queries,
+    DEWRANGLE_DIR,
+    _is_complete,
+    _check_job,
+    _read_job_result,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def poll_job(
+    job_id: str,
+    timeout_seconds: Optional[int] = None,
+    interval_seconds: Optional[int] = 30,
+):
+    """
+    Poll for status on a Dewrangle FHIR ingest job
+
+    See d3b_api_client_cli.dewrangle.graphql.job._poll_job for details
+    """
+    return await _poll_job(
+        job_id,
+        queries.job,
+        _is_complete,
+        timeout_seconds=timeout_seconds,
+        interval_seconds=interval_seconds,
+    )
+
+
+async def _poll_job(
+    job_id: str,
+    job_query: DocumentNode,
+    complete_function: Callable[[dict], dict],
+    timeout_seconds: Optional[int] = None,
+    interval_seconds: Optional[int] = 30,
+) -> dict:
+    """
+    Poll for status on a Dewrangle job without blocking the event loop
+
+    See d3b_api_client_cli.dewrangle.graphql.job._poll_job for details
+    """
+    start_time = time.time()
+
+    while True:
+        resp = await async_exec_query(job_query, variables={"id": job_id})
+
+        result = _check_job(
+            resp, complete_function, start_time, timeout_seconds
+        )
+        if result:
+            return result
+
+        await asyncio.sleep(interval_seconds)
+
+
+async def read_job(node_id: str, output_dir: str = DEWRANGLE_DIR) -> dict:
+    """
+    Fetch Job by ID from Dewrangle. Mostly for developer debugging purposes
+    """
+    resp = await async_exec_query(queries.job, variables={"id": node_id})
+
+    return _read_job_result(resp, output_dir=output_dir)
+
+
+async def batch_read_jobs(
+    node_ids: list[str], batch_size: int = DEWRANGLE_MAX_BATCH_SIZE
+) -> dict:
+    """
+    Fetch many jobs by node id in ceil(len(node_ids) / batch_size)
+    requests
+
+    Returns:
+        dict of job dicts keyed by node ID
+    """
+    return await async_read_nodes(queries.job, node_ids, batch_size=batch_size)
@@ -0,0 +1,423 @@
+"""
+Per-run request coalescing and memoization of Dewrangle lookups
+
+A Loader sits in front of exec_query and resolves keys, like node IDs or
+study global IDs, with a batch load function. Results are memoized so
+resolving the same entity again costs nothing. Async lookups that are
+queued in the same event loop tick are merged into one call to the batch
+load function.
+
+A run is the lifetime of the process, or of a loader_scope if one is
+active. Together the loaders are the identity map of the run: functions
+that create or update an entity memoize the result right away (see
+remember_node) and functions that delete an entity forget it (see
+forget_node), so a chain of calls never fetches an entity that it already
+holds.
+
+Memoized values expire after config["dewrangle"]["loader"]["ttl"] seconds
+and at most config["dewrangle"]["loader"]["max_size"] values are kept per
+loader, least recently used first out. Keys that the batch load function
+did not find are not memoized, so they are looked up again next time.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Hashable,
+    Iterable,
+    Iterator,
+    Optional,
+)
+
+from graphql import DocumentNode
+
+from d3b_api_client_cli.config import config
+from d3b_api_client_cli.dewrangle.graphql.batch import (
+    read_nodes,
+    async_read_nodes,
+)
+
+logger = logging.getLogger(__name__)
+
+BatchLoadFn = Callable[[list], dict]
+AsyncBatchLoadFn = Callable[[list], Awaitable[dict]]
+
+# All loaders created in this process, reset by reset_loaders
+_loaders = []
+
+# Node loaders keyed by id of node query
+_node_loaders = {}
+
+# Memo of the active loader_scope, if any
+_scope = contextvars.ContextVar("dewrangle_loader_scope", default=None)
+
+
+class _Memo:
+    """
+    Memoized values of one loader in one run
+    """
+
+    def __init__(self):
+        # key -> (value, time stored), least recently used first
+        self.values = OrderedDict()
+        # Time prime_all was called, if every existing key is memoized
+        self.complete_at = None
+        # Keys queued for the next async batch, and the loop they belong to
+        self.queue = {}
+        self.queue_loop = None
+
+
+class Loader:
+    """
+    Memoize and coalesce lookups of Dewrangle entities by key
+
+    Arguments:
+        batch_load_fn - function that takes a list of keys and returns a dict
+        of values keyed by key. Missing keys resolve to an empty dict
+        async_batch_load_fn - coroutine function with the same signature used
+        by the async methods. If not provided, batch_load_fn is run in a
+        worker thread
+        name - name used in log messages
+        ttl - seconds a value stays memoized. Defaults to
+        config["dewrangle"]["loader"]["ttl"]
+        max_size - max number of memoized values. Defaults to
+        config["dewrangle"]["loader"]["max_size"]
+    """
+
+    def __init__(
+        self,
+        batch_load_fn: BatchLoadFn,
+        async_batch_load_fn: Optional[AsyncBatchLoadFn] = None,
+        name: str = "loader",
+        ttl: Optional[float] = None,
+        max_size: Optional[int] = None,
+    ):
+        self.batch_load_fn = batch_load_fn
+        self.async_batch_load_fn = async_batch_load_fn
+        self.name = name
+        self._ttl = ttl
+        self._max_size = max_size
+        self._memo = _Memo()
+        self._lock = threading.Lock()
+        _loaders.append(self)
+
+    @property
+    def ttl(self) -> Optional[float]:
+        """
+        Seconds a value stays memoized
+        """
+        if self._ttl is None:
+            return config["dewrangle"]["loader"]["ttl"]
+        return self._ttl
+
+    @property
+    def max_size(self) -> Optional[int]:
+        """
+        Max number of memoized values
+        """
+        if self._max_size is None:
+            return config["dewrangle"]["loader"]["max_size"]
+        return self._max_size
+
+    def _get_memo(self) -> _Memo:
+        """
+        Get the memo of the active loader_scope or the process-wide one
+        """
+        scope = _scope.get()
+        if scope is None:
+            return self._memo
+
+        with self._lock:
+            return scope.setdefault(self, _Memo())
+
+    def _expired(self, stored_at: float) -> bool:
+        """
+        Whether a value stored at stored_at is too old to be used
+        """
+        ttl = self.ttl
+        return ttl is not None and time.monotonic() - stored_at > ttl
+
+    def _get(self, memo: _Memo, key: Hashable) -> tuple[bool, Any]:
+        """
+        Look up a memoized value, dropping it if it expired. Must be called
+        with the lock held
+
+        Returns:
+            whether the key is memoized and its value
+        """
+        entry = memo.values.get(key)
+        if entry is not None:
+            value, stored_at = entry
+            if not self._expired(stored_at):
+                memo.values.move_to_end(key)
+                return True, value
+            del memo.values[key]
+
+        if memo.complete_at is not None:
+            if not self._expired(memo.complete_at):
+                return True, {}
+            memo.complete_at = None
+
+        return False, None
+
+    def _set(self, memo: _Memo, key: Hashable, value: Any):
+        """
+        Memoize a value, evicting the least recently used values over
+        max_size. Must be called with the lock held
+        """
+        memo.values[key] = (value, time.monotonic())
+        memo.values.move_to_end(key)
+
+        max_size = self.max_size
+        if max_size is not None:
+            while len(memo.values) > max_size:
+                memo.values.popitem(last=False)
+                # Evicted keys are no longer known, so a miss is not final
+                memo.complete_at = None
+
+    def _cached(self, keys: Iterable[Hashable]) -> tuple[dict, list]:
+        """
+        Split keys into memoized values and keys that still need loading
+        """
+        memo = self._get_memo()
+        found = {}
+        with self._lock:
+            for k in keys:
+                if k in found:
+                    continue
+                hit, value = self._get(memo, k)
+                if hit:
+                    found[k] = value
+        missing = list(dict.fromkeys(k for k in keys if k not in found))
+
+        return found, missing
+
+    def _store(self, memo: _Memo, keys: list, values: dict) -> dict:
+        """
+        Memoize the values of a batch of keys. Keys that were not found are
+        not memoized and resolve to an empty dict
+        """
+        with self._lock:
+            for k in keys:
+                if values.get(k) is not None:
+                    self._set(memo, k, values[k])
+
+        return {k: values[k] if values.get(k) is not None else {} for k in keys}
+
+    def load(self, key: Hashable) -> Any:
+        """
+        Resolve one key
+        """
+        return self.load_many([key])[key]
+
+    def load_many(self, keys: Iterable[Hashable]) -> dict:
+        """
+        Resolve many keys with at most one call to the batch load function
+        """
+        keys = list(keys)
+        found, missing = self._cached(keys)
+        if missing:
+            logger.debug("🔎 %s loading %s keys", self.name, len(missing))
+            found.update(
+                self._store(
+                    self._get_memo(), missing, self.batch_load_fn(missing)
+                )
+            )
+
+        return {k: found[k] for k in keys}
+
+    async def load_async(self, key: Hashable) -> Any:
+        """
+        Resolve one key. Keys queued in the same event loop tick are loaded
+        together
+        """
+        found, _ = self._cached([key])
+        if key in found:
+            return found[key]
+
+        memo = self._get_memo()
+        loop = asyncio.get_running_loop()
+        if memo.queue_loop is not loop:
+            memo.queue = {}
+            memo.queue_loop = loop
+
+        if key not in memo.queue:
+            if not memo.queue:
+                loop.call_soon(self._dispatch, memo)
+            memo.queue[key] = loop.create_future()
+
+        return await asyncio.shield(memo.queue[key])
+
+    async def load_many_async(self, keys: Iterable[Hashable]) -> dict:
+        """
+        Resolve many keys. See load_async
+        """
+        keys = list(keys)
+        values = await asyncio.gather(*[self.load_async(k) for k in keys])
+
+        return dict(zip(keys, values))
+
+    def _dispatch(self, memo: _Memo):
+        """
+        Load all keys queued in the current tick in one batch
+        """
+        queue, memo.queue = memo.queue, {}
+        asyncio.ensure_future(self._load_queue(memo, queue))
+
+    async def _load_queue(self, memo: _Memo, queue: dict):
+        """
+        Call the batch load function and resolve the queued futures
+        """
+        keys = list(queue)
+        logger.debug("🔎 %s loading %s keys", self.name, len(keys))
+        try:
+            if self.async_batch_load_fn:
+                values = await self.async_batch_load_fn(keys)
+            else:
+                values = await asyncio.to_thread(self.batch_load_fn, keys)
+            values = self._store(memo, keys, values)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            for future in queue.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for key, future in queue.items():
+            if not future.done():
+                future.set_result(values[key])
+
+    def prime(self, key: Hashable, value: Any):
+        """
+        Memoize a value that was fetched by some other means
+        """
+        memo = self._get_memo()
+        with self._lock:
+            self._set(memo, key, value)
+
+    def prime_all(self, values: dict):
+        """
+        Memoize every existing key at once. Until the values expire, keys
+        that are not in values resolve to an empty dict without calling the
+        batch load function
+        """
+        memo = self._get_memo()
+        with self._lock:
+            for key, value in values.items():
+                self._set(memo, key, value)
+            max_size = self.max_size
+            if max_size is None or len(values) <= max_size:
+                memo.complete_at = time.monotonic()
+
+    def peek(self, key: Hashable) -> Any:
+        """
+        Get a memoized value without loading it
+
+        Returns:
+            The value or None if the key is not memoized
+        """
+        memo = self._get_memo()
+        with self._lock:
+            entry = memo.values.get(key)
+            if entry is None or self._expired(entry[1]):
+                return None
+            return entry[0]
+
+    def update(self, key: Hashable, fn: Callable[[Any], Any]):
+        """
+        Replace a memoized value with fn(value). Keys that are not memoized
+        are left alone, so the next lookup loads them
+        """
+        memo = self._get_memo()
+        with self._lock:
+            hit, value = self._get(memo, key)
+            if hit and key in memo.values:
+                memo.values[key] = (fn(value), memo.values[key][1])
+
+    def clear(self, key: Optional[Hashable] = None):
+        """
+        Forget one memoized key or all of them if key is not provided
+        """
+        memo = self._get_memo()
+        with self._lock:
+            if key is None:
+                memo.values.clear()
+                memo.complete_at = None
+            else:
+                memo.values.pop(key, None)
+
+
+@contextlib.contextmanager
+def loader_scope() -> Iterator[None]:
+    """
+    Give the code in the with block its own run: loaders start empty and
+    everything they memoize is forgotten when the block exits
+
+    The scope follows the context (see contextvars), so concurrent requests
+    or tasks that each open a scope do not share memoized values. Worker
+    threads only see the scope if they run in a copy of the context
+    (e.g. contextvars.copy_context().run or asyncio.to_thread)
+    """
+    token = _scope.set({})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def node_loader(node_query: DocumentNode) -> Loader:
+    """
+    Get the loader that fetches nodes by ID with a single node query
+
+    Lookups are merged into batched node queries.
+    See d3b_api_client_cli.dewrangle.graphql.batch
+    """
+    key = id(node_query)
+    if key not in _node_loaders:
+
+        def batch_load_fn(node_ids):
+            nodes = read_nodes(node_query, node_ids)
+            return {k: v for k, v in nodes.items() if v}
+
+        async def async_batch_load_fn(node_ids):
+            nodes = await async_read_nodes(node_query, node_ids)
+            return {k: v for k, v in nodes.items() if v}
+
+        _node_loaders[key] = Loader(
+            batch_load_fn, async_batch_load_fn, name="node_loader"
+        )
+
+    return _node_loaders[key]
+
+
+def remember_node(node_query: DocumentNode, node: dict):
+    """
+    Memoize a node returned by a create or update mutation so that reading
+    it by ID does not fetch it again
+    """
+    if node and node.get("id"):
+        node_loader(node_query).prime(node["id"], node)
+
+
+def forget_node(node_id: str):
+    """
+    Forget a deleted node in every node loader
+    """
+    for loader in _node_loaders.values():
+        loader.clear(node_id)
+
+
+def reset_loaders():
+    """
+    Forget everything memoized by all loaders in the current run.
+    Prefer loader_scope to isolate the lookups of one request
+    """
+    for loader in _loaders:
+        loader.clear()
@@ -0,0 +1,145 @@
+"""
+Registry of the GraphQL operations sent to Dewrangle
+
+Each document is printed, hashed and inspected once. The registry records
+the operation's type, name, whether it is destructive and the SHA-256 hash
+of its query text, which is what Automatic Persisted Queries use to identify
+the operation instead of sending the full query text.
+"""
+
+import hashlib
+import importlib
+import logging
+import pkgutil
+import threading
+import weakref
+from dataclasses import dataclass
+
+from graphql import DocumentNode, FieldNode, get_operation_ast, print_ast
+
+logger = logging.getLogger(__name__)
+
+# Operations keyed by document. Documents built on the fly, like batched node
+# queries, are dropped from the registry once they are garbage collected
+_registry = weakref.WeakKeyDictionary()
+_registry_lock = threading.Lock()
+_registered_modules = False
+
+
+@dataclass(frozen=True)
+class Operation:
+    """
+    Metadata about a GraphQL document computed once
+
+    Attributes:
+        name - name of the operation or None if anonymous
+        operation_type - query, mutation or subscription
+        destructive - whether the operation deletes anything. Destructive
+        operations are subject to the delete safety check
+        query - query text sent to the server
+        sha256 - SHA-256 hex digest of the query text
+    """
+
+    name: str
+    operation_type: str
+    destructive: bool
+    query: str
+    sha256: str
+
+
+def _is_destructive(operation_type: str, root_fields: list[str]) -> bool:
+    """
+    A mutation is destructive if any of its root fields deletes something
+    """
+    return (operation_type == "mutation") and any(
+        "delete" in field.lower() for field in root_fields
+    )
+
+
+def _build_operation(document: DocumentNode) -> Operation:
+    """
+    Print, hash and inspect a document
+    """
+    query = print_ast(document)
+    operation = get_operation_ast(document)
+    if operation:
+        name = operation.name.value if operation.name else None
+        operation_type = operation.operation.value
+        root_fields = [
+            selection.name.value
+            for selection in operation.selection_set.selections
+            if isinstance(selection, FieldNode)
+        ]
+    else:
+        name, operation_type, root_fields = None, "query", []
+
+    return Operation(
+        name=name,
+        operation_type=operation_type,
+        destructive=_is_destructive(operation_type, root_fields),
+        query=query,
+        sha256=hashlib.sha256(query.encode("utf-8")).hexdigest(),
+    )
+
+
+def register_operation(document: DocumentNode) -> Operation:
+    """
+    Add a document to the registry if it is not there already
+    """
+    with _registry_lock:
+        operation = _registry.get(document)
+    if not operation:
+        operation = _build_operation(document)
+        with _registry_lock:
+            operation = _registry.setdefault(document, operation)
+
+    return operation
+
+
+def register_operations() -> dict:
+    """
+    Register every document defined in the queries and mutations modules of
+    the Dewrangle GraphQL entity packages
+
+    Returns:
+        dict of Operations keyed by <package>.<module>.<document name>,
+        i.e. study.queries.study
+    """
+    global _registered_modules
+
+    # pylint: disable=import-outside-toplevel
+    from d3b_api_client_cli.dewrangle import graphql
+
+    operations = {}
+    for pkg in pkgutil.iter_modules(graphql.__path__):
+        if not pkg.ispkg:
+            continue
+        for module_name in ["queries", "mutations"]:
+            try:
+                module = importlib.import_module(
+                    f"{graphql.__name__}.{pkg.name}.{module_name}"
+                )
+            except ModuleNotFoundError:
+                continue
+            for attr, value in vars(module).items():
+                if isinstance(value, DocumentNode):
+                    key = f"{pkg.name}.{module_name}.{attr}"
+                    operations[key] = register_operation(value)
+
+    _registered_modules = True
+    logger.debug("Registered %s GraphQL operations", len(operations))
+
+    return operations
+
+
+def get_operation(document: DocumentNode) -> Operation:
+    """
+    Get the registered metadata of a document
+
+    The documents in the queries and mutations modules are registered on
+    first use. Other documents are registered the first time they are seen
+    """
+    if not _registered_modules:
+        register_operations()
+
+    return register_operation(document)
@@ -5,18 +5,26 @@ GraphQL methods to CRUD organization in Dewrangle
 import os
 import logging
 from pprint import pformat
+from typing import Iterator
 
 from d3b_api_client_cli.dewrangle.graphql.common import (
     exec_query,
 )
+from d3b_api_client_cli.dewrangle.graphql.pagination import paginate_pages
+from d3b_api_client_cli.dewrangle.graphql.projection import project
+from d3b_api_client_cli.dewrangle.graphql.loader import Loader, reset_loaders
+from d3b_api_client_cli.dewrangle.graphql import cache
 from d3b_api_client_cli.dewrangle.graphql.organization import (
     queries,
     mutations,
 )
 from d3b_api_client_cli.config import config
-from d3b_api_client_cli.utils import write_json
+from d3b_api_client_cli.utils import (
+    write_json,
+    stream_entities,
+    STREAMING_OUTPUT_FORMATS,
+)
 
-DEWRANGLE_MAX_PAGE_SIZE = config["dewrangle"]["pagination"]["max_page_size"]
 DEWRANGLE_DIR = config["dewrangle"]["output_dir"]
 logger = logging.getLogger(__name__)
 
@@ -31,12 +39,7 @@ def upsert_organization(variables: dict) -> dict:
     params = {"input": variables}
 
     # Check if this is an update or create
-    orgs = read_organizations(log_output=False)
-    found_org = None
-    for org in orgs:
-        if org["name"] == variables["name"]:
-            found_org = org
-            break
+    found_org = read_organization(dewrangle_org_name=variables["name"])
 
     if found_org:
         key = "Update"
@@ -46,6 +49,16 @@ def upsert_organization(variables: dict) -> dict:
         key = "Create"
         resp = exec_query(mutations.create_organization, variables=params)
 
+    return _upsert_result(resp, key, found_org)
+
+
+def _upsert_result(resp: dict, key: str, found_org: dict = None) -> dict:
+    """
+    Log the response of an organization create/update and return the
+    organization
+
+    found_org is the organization before an update
+    """
     errors = resp.get(f"organization{key}", {}).get("errors")
     if errors:
         logger.error("❌ %s organization failed:\n%s", key, pformat(resp))
@@ -53,6 +66,8 @@ def upsert_organization(variables: dict) -> dict:
         logger.info("✅ %s organization succeeded:\n%s", key, pformat(resp))
 
     result = resp[f"organization{key}"]["organization"]
+    if not errors:
+        _remember_organization(result, found_org)
 
     return result
 
@@ -71,7 +86,8 @@ def delete_organization(
         delete_safety_check: only delete if this is False
 
     Returns:
-        the response from Dewrangle
+        the response from Dewrangle or None if no organization has the
+        given name
     """
     if not (dewrangle_org_id or dewrangle_org_name):
         raise ValueError(
@@ -79,9 +95,15 @@ def delete_organization(
         )
 
     if dewrangle_org_name:
-        node_id = read_organization(dewrangle_org_name=dewrangle_org_name).get(
-            "id"
-        )
+        org = read_organization(dewrangle_org_name=dewrangle_org_name)
+        node_id = (org or {}).get("id")
+        if not node_id:
+            logger.warning(
+                "⚠️  Could not find organization %s."
+                " Delete organization ABORTED",
+                dewrangle_org_name,
+            )
+            return
     else:
         node_id = dewrangle_org_id
 
@@ -91,25 +113,50 @@ def delete_organization(
         delete_safety_check=delete_safety_check,
     )
 
+    return _delete_result(resp, node_id)
+
+
+def _delete_result(resp: dict, node_id: str) -> dict:
+    """
+    Log the response of an organization delete and return the organization
+    """
     key = "Delete"
     errors = resp.get("organizationDelete", {}).get("errors")
+    result = resp.get("organizationDelete", {}).get("organization")
     if errors:
         logger.error("❌ %s organization failed:\n%s", key, pformat(resp))
     else:
         logger.info("✅ %s organization succeeded:\n%s", key, pformat(resp))
-        result = resp["organizationDelete"]["organization"]
         result["id"] = node_id
+        _forget_organization(result)
 
     return result
 
 
 def read_organizations(
-    output_dir: str = DEWRANGLE_DIR, log_output: bool = True
+    output_dir: str = DEWRANGLE_DIR,
+    log_output: bool = True,
+    fields: list[str] = None,
+    output_format: str = "json",
 ) -> list[dict]:
     """
     Fetch organizations that the client has access to
+
+    Only fetch the given fields of each organization if fields are provided
+
+    If output_format is ndjson or csv, write each organization to the output
+    file as its page arrives and return the path to the file
     """
-    organizations = paginate_organizations()
+    if output_format in STREAMING_OUTPUT_FORMATS:
+        filepath = stream_entities(
+            iter_organizations(fields=fields, prefetch=True),
+            output_dir,
+            "Organization",
+            output_format,
+        )
+        return filepath
+
+    organizations = paginate_organizations(fields=fields)
     logger.info("Fetched %s organizations", len(organizations))
 
     if output_dir:
@@ -130,7 +177,15 @@ def read_organization(
     dewrangle_org_id: str = None, dewrangle_org_name: str = None
 ) -> dict:
     """
-    Fetch Dewrangle organization by name
+    Fetch Dewrangle organization by ID or name
+
+    Organizations are looked up by name in the entity cache first, see
+    d3b_api_client_cli.dewrangle.graphql.cache. Otherwise all organizations
+    are paginated once and indexed by ID and name for the rest of the run.
+    Nothing is written to the output directory
+
+    Returns:
+        The organization or None if it was not found
     """
     if not (dewrangle_org_id or dewrangle_org_name):
         raise ValueError(
@@ -139,67 +194,127 @@ def read_organization(
     key = "id" if dewrangle_org_id else "name"
     value = dewrangle_org_id if dewrangle_org_id else dewrangle_org_name
 
-    found_org = None
-    orgs = read_organizations(log_output=False)
+    if dewrangle_org_name:
+        org = cache.get_entity("organization", dewrangle_org_name)
+        if org:
+            return org
+
+    return organization_index.load((key, value)) or None
+
+
+def _load_organizations(keys: list[tuple[str, str]]) -> dict:
+    """
+    Batch load function of organization_index
+
+    Paginate all organizations once and index every one of them by ID and
+    by name
+    """
+    orgs = paginate_organizations()
+    index = {}
     for org in orgs:
-        if org[key] == value:
-            found_org = org
-            break
+        index[("id", org["id"])] = org
+        index[("name", org["name"])] = org
+    organization_index.prime_all(index)
+    cache.put_entities("organization", {org["name"]: org for org in orgs})
 
-    return found_org
+    return index
 
 
-def paginate_organizations(
-    org_page_size: int = DEWRANGLE_MAX_PAGE_SIZE,
-) -> list[dict]:
+# Organizations keyed by ("id", ID) and ("name", name)
+organization_index = Loader(_load_organizations, name="organization_index")
+
+
+def _remember_organization(org: dict, found_org: dict = None):
     """
-    Fetch all organizations that the viewer has access to
+    Write a created or updated organization through to the organization
+    index and the entity cache, forgetting its old name if it was renamed
+    """
+    if found_org:
+        organization_index.clear(("name", found_org["name"]))
+        cache.delete_entity("organization", found_org["id"])
 
-    Use Relay graphql pagination
+    organization_index.prime(("id", org["id"]), org)
+    organization_index.prime(("name", org["name"]), org)
+    cache.put_entity("organization", org["name"], org)
+
+
+def _forget_organization(org: dict):
     """
-    logger.info("📄 Paginating Dewrangle organizations ...")
+    Evict a deleted organization from the organization index and the entity
+    cache. The studies, volumes and credentials of the organization are gone
+    too, so everything memoized during the run is forgotten
+    """
+    reset_loaders()
+    cache.delete_entity("organization", org["id"])
 
-    variables = {"first": org_page_size}
-    resp = exec_query(queries.organization_users, variables=variables)
 
-    organizations = []
-    count = 0
-    has_next_page = True
-    while has_next_page:
-        org_users = resp["viewer"]["organizationUsers"]["edges"]
+def iter_organizations(
+    org_page_size: int = None,
+    fields=None,
+    prefetch=False,
+) -> Iterator[dict]:
+    """
+    Lazily fetch the organizations that the viewer has access to
 
-        count += len(org_users)
-        total = resp["viewer"]["organizationUsers"]["totalCount"]
+    Pages are fetched as the caller iterates, so stopping early (i.e. once
+    the wanted organization is found) stops the pagination.
+    See d3b_api_client_cli.dewrangle.graphql.pagination
 
-        if not total:
-            has_next_page = False
-            continue
+    Set prefetch if the whole listing will be used, so that each next page
+    is requested while the current one is processed
 
-        logger.info("Collecting %s organizations", f"{count}/{total}")
-        for org_user in org_users:
-            organizations.append(org_user["node"]["organization"])
+    Only fetch the given fields of each organization if fields are provided.
+    See d3b_api_client_cli.dewrangle.graphql.projection
+    """
+    query = project(
+        queries.organization_users,
+        fields,
+        path=queries.ORGANIZATIONS_PATH,
+        required=queries.ORGANIZATION_KEY_FIELDS,
+    )
 
-        page_info = resp["viewer"]["organizationUsers"]["pageInfo"]
+    for page in paginate_pages(
+        query,
+        queries.ORGANIZATIONS_PATH,
+        page_size=org_page_size,
+        prefetch=prefetch,
+    ):
+        if not page.total_count:
+            return
+        logger.info(
+            "Collecting %s organizations", f"{page.count}/{page.total_count}"
+        )
+        yield from page.nodes
 
-        has_next_page = page_info["hasNextPage"]
-        end_cursor = page_info["endCursor"]
 
-        if has_next_page and end_cursor:
-            variables.update({"after": end_cursor})
-            resp = exec_query(queries.organization_users, variables=variables)
+def paginate_organizations(
+    org_page_size: int = None,
+    fields=None,
+) -> list[dict]:
+    """
+    Fetch all organizations that the viewer has access to
 
-    return organizations
+    Use Relay graphql pagination
+
+    Only fetch the given fields of each organization if fields are provided.
+    See d3b_api_client_cli.dewrangle.graphql.projection
+    """
+    logger.info("📄 Paginating Dewrangle organizations ...")
+
+    return list(
+        iter_organizations(
+            org_page_size=org_page_size, fields=fields, prefetch=True
+        )
+    )
 
 
 def get_org_by_name(org_name: str) -> dict:
     """
     Fetch organization from Dewrangle
-    """
-    orgs = paginate_organizations()
 
-    found_org = {}
-    for org in orgs:
-        if org["name"] == org_name:
-            found_org = org
-            break
-    return found_org
+    See read_organization
+
+    Returns:
+        The organization or an empty dict if it was not found
+    """
+    return read_organization(dewrangle_org_name=org_name) or {}
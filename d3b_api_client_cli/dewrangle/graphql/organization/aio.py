@@ -0,0 +1,169 @@
+"""
+Asyncio versions of the GraphQL methods to CRUD organization in Dewrangle
+"""
+
+import logging
+from typing import AsyncIterator
+
+from d3b_api_client_cli.dewrangle.graphql.common import (
+    async_exec_query,
+)
+from d3b_api_client_cli.dewrangle.graphql.pagination import (
+    async_paginate_pages,
+)
+from d3b_api_client_cli.dewrangle.graphql.projection import project
+from d3b_api_client_cli.dewrangle.graphql import cache
+from d3b_api_client_cli.dewrangle.graphql.organization import (
+    queries,
+    mutations,
+    _upsert_result,
+    _delete_result,
+    organization_index,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def upsert_organization(variables: dict) -> dict:
+    """
+    Upsert organization in Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.organization.upsert_organization
+    """
+    params = {"input": variables}
+
+    found_org = await read_organization(dewrangle_org_name=variables["name"])
+
+    if found_org:
+        key = "Update"
+        params.update({"id": found_org["id"]})
+        resp = await async_exec_query(
+            mutations.update_organization, variables=params
+        )
+    else:
+        key = "Create"
+        resp = await async_exec_query(
+            mutations.create_organization, variables=params
+        )
+
+    return _upsert_result(resp, key, found_org)
+
+
+async def delete_organization(
+    dewrangle_org_id: str = None,
+    dewrangle_org_name: str = None,
+    delete_safety_check: bool = True,
+) -> dict:
+    """
+    Delete organization in Dewrangle by graphql node ID or name
+
+    See d3b_api_client_cli.dewrangle.graphql.organization.delete_organization
+    """
+    if not (dewrangle_org_id or dewrangle_org_name):
+        raise ValueError(
+            "You must provide either the dewrangle_org_id or dewrangle_org_name"
+        )
+
+    if dewrangle_org_name:
+        org = await read_organization(dewrangle_org_name=dewrangle_org_name)
+        node_id = (org or {}).get("id")
+        if not node_id:
+            logger.warning(
+                "⚠️  Could not find organization %s."
+                " Delete organization ABORTED",
+                dewrangle_org_name,
+            )
+            return
+    else:
+        node_id = dewrangle_org_id
+
+    resp = await async_exec_query(
+        mutations.delete_organization,
+        variables={"id": node_id},
+        delete_safety_check=delete_safety_check,
+    )
+
+    return _delete_result(resp, node_id)
+
+
+async def read_organization(
+    dewrangle_org_id: str = None, dewrangle_org_name: str = None
+) -> dict:
+    """
+    Fetch Dewrangle organization by ID or name
+
+    See d3b_api_client_cli.dewrangle.graphql.organization.read_organization
+    """
+    if not (dewrangle_org_id or dewrangle_org_name):
+        raise ValueError(
+            "You must provide either the dewrangle_org_id or dewrangle_org_name"
+        )
+    key = "id" if dewrangle_org_id else "name"
+    value = dewrangle_org_id if dewrangle_org_id else dewrangle_org_name
+
+    if dewrangle_org_name:
+        org = cache.get_entity("organization", dewrangle_org_name)
+        if org:
+            return org
+
+    return await organization_index.load_async((key, value)) or None
+
+
+async def iter_organizations(
+    org_page_size: int = None,
+    fields=None,
+    prefetch=False,
+) -> AsyncIterator[dict]:
+    """
+    Lazily fetch the organizations that the viewer has access to
+
+    See d3b_api_client_cli.dewrangle.graphql.organization.iter_organizations
+    """
+    query = project(
+        queries.organization_users,
+        fields,
+        path=queries.ORGANIZATIONS_PATH,
+        required=queries.ORGANIZATION_KEY_FIELDS,
+    )
+
+    async for page in async_paginate_pages(
+        query,
+        queries.ORGANIZATIONS_PATH,
+        page_size=org_page_size,
+        prefetch=prefetch,
+    ):
+        if not page.total_count:
+            return
+        logger.info(
+            "Collecting %s organizations", f"{page.count}/{page.total_count}"
+        )
+        for org in page.nodes:
+            yield org
+
+
+async def paginate_organizations(
+    org_page_size: int = None,
+    fields=None,
+) -> list[dict]:
+    """
+    Fetch all organizations that the viewer has access to
+
+    Use Relay graphql pagination
+    """
+    logger.info("📄 Paginating Dewrangle organizations ...")
+
+    return [
+        org
+        async for org in iter_organizations(
+            org_page_size=org_page_size, fields=fields, prefetch=True
+        )
+    ]
+
+
+async def get_org_by_name(org_name: str) -> dict:
+    """
+    Fetch organization from Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.organization.get_org_by_name
+    """
+    return await read_organization(dewrangle_org_name=org_name) or {}
@@ -4,6 +4,7 @@ Dewrangle GraphQL query definitions
 
 from gql import gql
 
+
 organization_users = gql(
     """
     query($first: Int, $after: ID) {
@@ -35,3 +36,8 @@ organization_users = gql(
 }
     """
 )
+
+# Path from the root of organization_users to each organization and the fields
+# that are always needed to store a page of organizations
+ORGANIZATIONS_PATH = "viewer.organizationUsers.edges.node.organization"
+ORGANIZATION_KEY_FIELDS = ["id", "name"]
@@ -0,0 +1,721 @@
+"""
+Streaming Relay pagination of Dewrangle GraphQL connections
+
+The paginators fetch one page of a connection at a time and hand it to the
+caller before fetching the next one. Callers that stop iterating, i.e.
+once they found the node they were looking for, stop the pagination too.
+
+Connections are located in the response with the same dotted entity paths
+that are used for field projection, i.e. node.volumes.edges.node. The part
+before edges is the connection and the part after edges is the path from
+each edge to the entity.
+
+Page sizes are configured per connection in
+config["dewrangle"]["pagination"]["page_sizes"]. In adaptive mode the page
+size of a connection grows while pages are fast and shrinks when they get
+slow, and the learned size is reused for the rest of the run.
+
+paginate_each paginates the child connection of many parents (i.e. the
+volumes of every study) at the same time and yields the pages grouped by
+parent in the order of the parents, so wall time depends on the largest
+parent rather than the sum of all of them. Each parent only fetches a few
+pages ahead of the caller and the parents are started as the caller moves
+on, so a caller that stops early stops the pagination of every parent.
+
+Callers that list a whole connection can ask the paginators to prefetch:
+the request for the next page goes out as soon as the end cursor of the
+current page is known, so it overlaps with the caller processing the page.
+"""
+
+import asyncio
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Iterable, Iterator, Optional
+
+from graphql import DocumentNode
+
+from d3b_api_client_cli.dewrangle.graphql.common import (
+    exec_query,
+    async_exec_query,
+)
+from d3b_api_client_cli.config import config
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the pages of a parent in its page queue
+_DONE = object()
+
+# Page sizes learned in adaptive mode keyed by connection field name
+_page_sizes = {}
+_page_sizes_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class Page:
+    """
+    One page of a Relay connection
+
+    Attributes:
+        number - page number, starting at 1
+        nodes - entities in this page
+        count - number of entities fetched so far, including this page
+        total_count - totalCount of the connection or None if not selected
+        has_next_page - whether there is another page after this one
+        end_cursor - cursor of the last edge in this page
+        elapsed - seconds it took to fetch this page
+    """
+
+    number: int
+    nodes: list
+    count: int
+    total_count: Optional[int]
+    has_next_page: bool
+    end_cursor: Optional[str]
+    elapsed: float
+
+
+def _split_path(path: str) -> tuple[list[str], list[str]]:
+    """
+    Split an entity path into the path to the connection and the path from
+    each edge to the entity
+    """
+    parts = path.split(".")
+    if "edges" not in parts:
+        raise ValueError(f"❌ Path {path} does not go through a connection")
+    i = parts.index("edges")
+
+    return parts[:i], parts[i + 1 :]
+
+
+def page_size_for(path: str) -> int:
+    """
+    Get the page size to start paginating a connection with
+
+    Arguments:
+        path - dotted path to the entities, i.e. node.volumes.edges.node
+
+    Returns:
+        The size learned in adaptive mode if there is one, otherwise the
+        size configured for the connection
+    """
+    pagination = config["dewrangle"]["pagination"]
+    name = _split_path(path)[0][-1]
+    page_size = pagination["page_sizes"].get(name, pagination["max_page_size"])
+    if pagination["adaptive"]["enabled"]:
+        with _page_sizes_lock:
+            page_size = _page_sizes.get(name, page_size)
+
+    return page_size
+
+
+def _next_page_size(path: str, page_size: int, page: Page) -> int:
+    """
+    Adapt the page size of a connection to how long the last page took
+
+    Shrink the page size in proportion if the page took longer than the
+    target latency. The target is capped at half the client
+    execution_timeout so that pages never get close to timing out. Double
+    the page size if a full page took less than half the target
+    """
+    adaptive = config["dewrangle"]["pagination"]["adaptive"]
+    target = min(
+        adaptive["target_latency"],
+        config["dewrangle"]["client"]["execution_timeout"] / 2,
+    )
+
+    next_page_size = page_size
+    if page.elapsed > target:
+        next_page_size = int(page_size * target / page.elapsed)
+    elif (page.elapsed < target / 2) and (len(page.nodes) >= page_size):
+        next_page_size = page_size * 2
+    next_page_size = max(
+        adaptive["min_page_size"],
+        min(adaptive["max_page_size"], next_page_size),
+    )
+
+    if next_page_size != page_size:
+        logger.info(
+            "📐 Page %s of %s took %.2fs, changing page size from %s to %s",
+            page.number,
+            path,
+            page.elapsed,
+            page_size,
+            next_page_size,
+        )
+    with _page_sizes_lock:
+        _page_sizes[_split_path(path)[0][-1]] = next_page_size
+
+    return next_page_size
+
+
+def reset_page_sizes():
+    """
+    Forget the page sizes learned in adaptive mode
+    """
+    with _page_sizes_lock:
+        _page_sizes.clear()
+
+
+def _get(data: Optional[dict], keys: list[str]) -> Optional[dict]:
+    for key in keys:
+        if data is None:
+            return None
+        data = data.get(key)
+
+    return data
+
+
+def _page(
+    resp: dict,
+    keys: tuple[list[str], list[str]],
+    number: int,
+    count: int,
+    elapsed: float,
+) -> Page:
+    """
+    Extract a page of entities from a query response
+    """
+    connection_keys, node_keys = keys
+    connection = _get(resp, connection_keys) or {}
+    page_info = connection.get("pageInfo") or {}
+    nodes = [
+        node
+        for node in (
+            _get(edge, node_keys) for edge in connection.get("edges", [])
+        )
+        if node is not None
+    ]
+
+    return Page(
+        number=number,
+        nodes=nodes,
+        count=count + len(nodes),
+        total_count=connection.get("totalCount"),
+        has_next_page=bool(page_info.get("hasNextPage")),
+        end_cursor=page_info.get("endCursor"),
+        elapsed=elapsed,
+    )
+
+
+def _is_adaptive(page_size: Optional[int]) -> bool:
+    """
+    Only adapt the page size if the caller did not choose one
+    """
+    adaptive = config["dewrangle"]["pagination"]["adaptive"]
+
+    return (page_size is None) and adaptive["enabled"]
+
+
+def _log_page(path: str, page: Page):
+    logger.debug(
+        "📄 Page %s of %s: %s nodes (%s/%s) in %.2fs",
+        page.number,
+        path,
+        len(page.nodes),
+        page.count,
+        page.total_count,
+        page.elapsed,
+    )
+
+
+def _fetch_page(
+    query: DocumentNode,
+    path: str,
+    variables: dict,
+    number: int,
+    count: int,
+) -> Page:
+    start = time.monotonic()
+    resp = exec_query(query, variables=variables)
+    page = _page(
+        resp, _split_path(path), number, count, time.monotonic() - start
+    )
+    _log_page(path, page)
+
+    return page
+
+
+async def _async_fetch_page(
+    query: DocumentNode,
+    path: str,
+    variables: dict,
+    number: int,
+    count: int,
+) -> Page:
+    start = time.monotonic()
+    resp = await async_exec_query(query, variables=variables)
+    page = _page(
+        resp, _split_path(path), number, count, time.monotonic() - start
+    )
+    _log_page(path, page)
+
+    return page
+
+
+def _next_variables(
+    path: str,
+    variables: dict,
+    page: Page,
+    adaptive: bool,
+) -> Optional[dict]:
+    """
+    Variables of the page after this one or None if this is the last page
+    """
+    if not (page.has_next_page and page.end_cursor):
+        return None
+
+    page_size = variables["first"]
+    if adaptive:
+        page_size = _next_page_size(path, page_size, page)
+
+    return {**variables, "first": page_size, "after": page.end_cursor}
+
+
+def _is_prefetching(prefetch: bool, threaded: bool = True) -> bool:
+    """
+    Only prefetch if the caller will list the whole connection
+
+    Only the persistent GraphQL session can be shared with the prefetch
+    thread
+    """
+    if not (prefetch and config["dewrangle"]["pagination"]["prefetch"]):
+        return False
+
+    return (not threaded) or config["dewrangle"]["client"]["persistent_session"]
+
+
+def paginate_pages(
+    query: DocumentNode,
+    path: str,
+    variables: Optional[dict] = None,
+    page_size: Optional[int] = None,
+    prefetch: bool = False,
+) -> Iterator[Page]:
+    """
+    Lazily fetch the pages of a Relay connection
+
+    Without prefetch the next page is only fetched when the caller asks for
+    it, so breaking out of the loop stops the pagination
+
+    Arguments:
+        query - query document with $first and $after variables
+        path - dotted path from the root of the response to the entities,
+        i.e. node.volumes.edges.node
+        variables - other query variables, i.e. the ID of the parent node
+        page_size - number of entities per page. Defaults to the page size
+        configured for the connection, adapted to the server's latency if
+        config["dewrangle"]["pagination"]["adaptive"] is enabled
+        prefetch - request the next page in the background as soon as the
+        current page is received, while the caller processes it. Set this
+        when the whole connection will be listed. Disabled by
+        config["dewrangle"]["pagination"]["prefetch"]
+
+    Yields:
+        Page
+    """
+    _split_path(path)
+    adaptive = _is_adaptive(page_size)
+    variables = {**(variables or {}), "first": page_size or page_size_for(path)}
+
+    executor = None
+    if _is_prefetching(prefetch):
+        executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="dewrangle-prefetch"
+        )
+
+    next_page = None
+    try:
+        page = _fetch_page(query, path, variables, 1, 0)
+        while True:
+            variables = _next_variables(path, variables, page, adaptive)
+            if variables and executor:
+                next_page = executor.submit(
+                    _fetch_page,
+                    query,
+                    path,
+                    variables,
+                    page.number + 1,
+                    page.count,
+                )
+
+            yield page
+
+            if not variables:
+                return
+            if next_page:
+                page = next_page.result()
+                next_page = None
+            else:
+                page = _fetch_page(
+                    query, path, variables, page.number + 1, page.count
+                )
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def paginate_nodes(
+    query: DocumentNode,
+    path: str,
+    variables: Optional[dict] = None,
+    page_size: Optional[int] = None,
+    prefetch: bool = False,
+) -> Iterator[dict]:
+    """
+    Lazily fetch the entities of a Relay connection
+
+    See paginate_pages
+    """
+    for page in paginate_pages(
+        query, path, variables, page_size=page_size, prefetch=prefetch
+    ):
+        yield from page.nodes
+
+
+async def async_paginate_pages(
+    query: DocumentNode,
+    path: str,
+    variables: Optional[dict] = None,
+    page_size: Optional[int] = None,
+    prefetch: bool = False,
+) -> AsyncIterator[Page]:
+    """
+    Lazily fetch the pages of a Relay connection asynchronously
+
+    See paginate_pages
+    """
+    _split_path(path)
+    adaptive = _is_adaptive(page_size)
+    prefetch = _is_prefetching(prefetch, threaded=False)
+    variables = {**(variables or {}), "first": page_size or page_size_for(path)}
+
+    next_page = None
+    try:
+        page = await _async_fetch_page(query, path, variables, 1, 0)
+        while True:
+            variables = _next_variables(path, variables, page, adaptive)
+            if variables and prefetch:
+                next_page = asyncio.ensure_future(
+                    _async_fetch_page(
+                        query, path, variables, page.number + 1, page.count
+                    )
+                )
+
+            yield page
+
+            if not variables:
+                return
+            if next_page:
+                page = await next_page
+                next_page = None
+            else:
+                page = await _async_fetch_page(
+                    query, path, variables, page.number + 1, page.count
+                )
+    finally:
+        if next_page:
+            next_page.cancel()
+
+
+async def async_paginate_nodes(
+    query: DocumentNode,
+    path: str,
+    variables: Optional[dict] = None,
+    page_size: Optional[int] = None,
+    prefetch: bool = False,
+) -> AsyncIterator[dict]:
+    """
+    Lazily fetch the entities of a Relay connection asynchronously
+
+    See paginate_pages
+    """
+    async for page in async_paginate_pages(
+        query, path, variables, page_size=page_size, prefetch=prefetch
+    ):
+        for node in page.nodes:
+            yield node
+
+
+def _max_concurrent_parents(max_concurrency: Optional[int] = None) -> int:
+    """
+    Number of parents to paginate at the same time
+
+    Only the persistent GraphQL session can be shared by many threads, so
+    parents are paginated one at a time without it
+    """
+    if not config["dewrangle"]["client"]["persistent_session"]:
+        return 1
+
+    return (
+        max_concurrency
+        or config["dewrangle"]["pagination"]["max_concurrent_parents"]
+    )
+
+
+def _parent_variables(
+    parent: dict, cursors: Optional[dict], variables: Optional[dict]
+) -> dict:
+    variables = {**(variables or {}), "id": parent["id"]}
+    if cursors and cursors.get(parent["id"]):
+        variables["after"] = cursors[parent["id"]]
+
+    return variables
+
+
+def paginate_each(
+    query: DocumentNode,
+    path: str,
+    parents: Iterable[dict],
+    page_size: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    cursors: Optional[dict] = None,
+    variables: Optional[dict] = None,
+    prefetch: bool = False,
+    checkpoint=None,
+) -> Iterator[tuple[dict, Page]]:
+    """
+    Paginate the child connection of many parent nodes concurrently
+
+    The pages of each parent are fetched in order by a pool of worker
+    threads, but they are yielded grouped by parent in the order of the
+    parents so the output is deterministic. Each running parent fetches at
+    most config["dewrangle"]["pagination"]["max_buffered_pages"] pages ahead
+    of the caller. With a single parent the pages are fetched lazily, see
+    paginate_pages
+
+    Arguments:
+        query - query document with $id, $first and $after variables
+        path - dotted path from the root of the response to the entities,
+        i.e. node.volumes.edges.node
+        parents - parent nodes. The ID of each is passed as $id
+        page_size - see paginate_pages
+        max_concurrency - max number of parents paginated at the same time.
+        Defaults to config["dewrangle"]["pagination"]["max_concurrent_parents"]
+        cursors - end cursors keyed by parent ID. The pagination of these
+        parents starts after the cursor instead of at the first page
+        variables - other query variables, the same for every parent
+        prefetch - see paginate_pages. Only used when parents are paginated
+        one at a time
+        checkpoint - d3b_api_client_cli.dewrangle.graphql.checkpoint.Checkpoint
+        to save each page to. Entities checkpointed by a previous run are
+        yielded as one page per parent and only the rest is fetched
+
+    Yields:
+        (parent, Page)
+    """
+    if checkpoint:
+        parents = list(parents)
+        pending = [p for p in parents if not checkpoint.finished(p["id"])]
+        pages = paginate_each(
+            query,
+            path,
+            pending,
+            page_size=page_size,
+            max_concurrency=max_concurrency,
+            cursors={**(cursors or {}), **checkpoint.cursors()},
+            variables=variables,
+            prefetch=prefetch,
+        )
+        yield from _checkpointed(parents, pages, checkpoint)
+        return
+
+    max_concurrency = _max_concurrent_parents(max_concurrency)
+    parents = iter(parents)
+    first = list(itertools.islice(parents, 2))
+
+    if (len(first) <= 1) or (max_concurrency <= 1):
+        for parent in itertools.chain(first, parents):
+            for page in paginate_pages(
+                query,
+                path,
+                _parent_variables(parent, cursors, variables),
+                page_size=page_size,
+                prefetch=prefetch,
+            ):
+                yield parent, page
+        return
+
+    logger.info(
+        "📄 Paginating %s of many parents, %s at a time", path, max_concurrency
+    )
+    parents = itertools.chain(first, parents)
+    buffered_pages = config["dewrangle"]["pagination"]["max_buffered_pages"]
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(
+        max_workers=max_concurrency, thread_name_prefix="dewrangle-paginate"
+    )
+    window = deque()
+
+    def start_next():
+        parent = next(parents, None)
+        if parent is None:
+            return
+        pages = queue.Queue(maxsize=buffered_pages)
+        executor.submit(
+            _stream_pages,
+            lambda: paginate_pages(
+                query,
+                path,
+                _parent_variables(parent, cursors, variables),
+                page_size=page_size,
+            ),
+            pages,
+            stop,
+        )
+        window.append((parent, pages))
+
+    try:
+        for _ in range(max_concurrency):
+            start_next()
+        while window:
+            parent, pages = window.popleft()
+            start_next()
+            for page in iter(pages.get, _DONE):
+                if isinstance(page, BaseException):
+                    raise page
+                yield parent, page
+    finally:
+        # Stop the running parents and don't start the remaining ones if the
+        # caller stopped early or a parent failed
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _stream_pages(
+    fetch_pages: Callable[[], Iterator[Page]],
+    pages: queue.Queue,
+    stop: threading.Event,
+):
+    """
+    Put the pages of one parent into a bounded queue, followed by _DONE or
+    the error that stopped the pagination. Waits while the queue is full and
+    gives up once stop is set
+    """
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    iterator = fetch_pages()
+    try:
+        for page in iterator:
+            if not put(page):
+                return
+        put(_DONE)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        put(e)
+    finally:
+        iterator.close()
+
+
+def _checkpointed(
+    parents: list[dict], pages: Iterator[tuple[dict, Page]], checkpoint
+) -> Iterator[tuple[dict, Page]]:
+    """
+    Yield the checkpointed page of each parent followed by its new pages,
+    checkpointing the new pages as they arrive
+    """
+    try:
+        current = next(pages, None)
+        for parent in parents:
+            restored = checkpoint.page(parent["id"])
+            if restored:
+                yield parent, restored
+            while current and (current[0] is parent):
+                checkpoint.save(*current)
+                yield current
+                current = next(pages, None)
+    finally:
+        pages.close()
+
+
+async def async_paginate_each(
+    query: DocumentNode,
+    path: str,
+    parents: Iterable[dict],
+    page_size: Optional[int] = None,
+    max_concurrency: Optional[int] = None,
+    cursors: Optional[dict] = None,
+    variables: Optional[dict] = None,
+    prefetch: bool = False,
+) -> AsyncIterator[tuple[dict, Page]]:
+    """
+    Paginate the child connection of many parent nodes concurrently
+
+    See paginate_each
+    """
+    max_concurrency = (
+        max_concurrency
+        or config["dewrangle"]["pagination"]["max_concurrent_parents"]
+    )
+    parents = iter(parents)
+    first = list(itertools.islice(parents, 2))
+
+    if (len(first) <= 1) or (max_concurrency <= 1):
+        for parent in itertools.chain(first, parents):
+            async for page in async_paginate_pages(
+                query,
+                path,
+                _parent_variables(parent, cursors, variables),
+                page_size=page_size,
+                prefetch=prefetch,
+            ):
+                yield parent, page
+        return
+
+    parents = itertools.chain(first, parents)
+    buffered_pages = config["dewrangle"]["pagination"]["max_buffered_pages"]
+    semaphore = asyncio.Semaphore(max_concurrency)
+    window = deque()
+
+    async def stream(parent, pages):
+        async with semaphore:
+            try:
+                async for page in async_paginate_pages(
+                    query,
+                    path,
+                    _parent_variables(parent, cursors, variables),
+                    page_size=page_size,
+                ):
+                    await pages.put(page)
+                await pages.put(_DONE)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                await pages.put(e)
+
+    def start_next():
+        parent = next(parents, None)
+        if parent is None:
+            return
+        pages = asyncio.Queue(maxsize=buffered_pages)
+        window.append(
+            (parent, pages, asyncio.ensure_future(stream(parent, pages)))
+        )
+
+    try:
+        for _ in range(max_concurrency):
+            start_next()
+        while window:
+            parent, pages, _ = window[0]
+            start_next()
+            while True:
+                page = await pages.get()
+                if page is _DONE:
+                    break
+                if isinstance(page, BaseException):
+                    raise page
+                yield parent, page
+            window.popleft()
+    finally:
+        for _, _, task in window:
+            task.cancel()
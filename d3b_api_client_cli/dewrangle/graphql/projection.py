@@ -0,0 +1,242 @@
+"""
+Field projection of Dewrangle GraphQL query documents
+
+The query documents select every field of an entity, including nested
+objects. project builds a lean variant of a document that only selects the
+requested fields of the entity, so callers that only need a few fields (i.e.
+an ID to find an entity) move a fraction of the bytes.
+
+Fields are given as dotted paths relative to the entity. A nested object
+name selects the whole object, i.e. study, while a dotted path selects one
+of its fields, i.e. study.globalId
+"""
+
+import logging
+from typing import Iterable, Optional
+
+from gql import gql
+from graphql import (
+    DocumentNode,
+    FieldNode,
+    InlineFragmentNode,
+    SelectionSetNode,
+    get_operation_ast,
+    print_ast,
+)
+
+logger = logging.getLogger(__name__)
+
+# Projected documents keyed by (id of document, path, fields)
+_projections = {}
+
+
+def _field_tree(fields: Iterable[str]) -> dict:
+    """
+    Convert dotted field paths into a tree of field names. None means
+    select the whole field
+    """
+    tree = {}
+    for field in fields:
+        parts = [p.strip() for p in field.split(".") if p.strip()]
+        node = tree
+        for i, part in enumerate(parts):
+            if i == len(parts) - 1:
+                node[part] = None
+            elif node.get(part, {}) is None:
+                break
+            else:
+                node = node.setdefault(part, {})
+
+    return tree
+
+
+def _response_key(field: FieldNode) -> str:
+    return field.alias.value if field.alias else field.name.value
+
+
+def _available_fields(selection_set: SelectionSetNode) -> set:
+    """
+    Names of the fields in a selection set, including inline fragments
+    """
+    names = set()
+    for selection in selection_set.selections:
+        if isinstance(selection, InlineFragmentNode):
+            names |= _available_fields(selection.selection_set)
+        elif isinstance(selection, FieldNode):
+            names.add(_response_key(selection))
+
+    return names
+
+
+def _project_selection_set(
+    selection_set: SelectionSetNode, tree: dict, prefix: str = ""
+) -> SelectionSetNode:
+    """
+    Keep only the fields of a selection set that are in the field tree
+    """
+    unknown = set(tree) - _available_fields(selection_set)
+    if unknown:
+        available = ", ".join(
+            sorted(prefix + f for f in _available_fields(selection_set))
+        )
+        raise ValueError(
+            "❌ Unknown field(s): "
+            f"{', '.join(sorted(prefix + f for f in unknown))}."
+            f" Available fields: {available}"
+        )
+
+    selections = []
+    for selection in selection_set.selections:
+        if isinstance(selection, InlineFragmentNode):
+            projected = _project_selection_set(
+                selection.selection_set,
+                {
+                    k: v
+                    for k, v in tree.items()
+                    if k in _available_fields(selection.selection_set)
+                },
+                prefix=prefix,
+            )
+            if projected.selections:
+                selections.append(
+                    InlineFragmentNode(
+                        type_condition=selection.type_condition,
+                        directives=selection.directives,
+                        selection_set=projected,
+                    )
+                )
+            continue
+
+        key = _response_key(selection)
+        if key not in tree:
+            continue
+
+        subtree = tree[key]
+        if subtree and (selection.selection_set is None):
+            raise ValueError(
+                f"❌ Unknown field(s): {prefix}{key} has no fields to select"
+            )
+        if subtree is None:
+            selections.append(selection)
+        else:
+            selections.append(
+                FieldNode(
+                    alias=selection.alias,
+                    name=selection.name,
+                    arguments=selection.arguments,
+                    directives=selection.directives,
+                    selection_set=_project_selection_set(
+                        selection.selection_set,
+                        subtree,
+                        prefix=f"{prefix}{key}.",
+                    ),
+                )
+            )
+
+    return SelectionSetNode(selections=tuple(selections))
+
+
+def _replace_at_path(
+    selection_set: SelectionSetNode, path: list[str], tree: dict
+) -> SelectionSetNode:
+    """
+    Follow a path of field names through a selection set and project the
+    selection set of the last field in the path
+    """
+    if not path:
+        return _project_selection_set(selection_set, tree)
+
+    found = False
+    selections = []
+    for selection in selection_set.selections:
+        if isinstance(selection, InlineFragmentNode):
+            if path[0] in _available_fields(selection.selection_set):
+                found = True
+                selection = InlineFragmentNode(
+                    type_condition=selection.type_condition,
+                    directives=selection.directives,
+                    selection_set=_replace_at_path(
+                        selection.selection_set, path, tree
+                    ),
+                )
+        elif (
+            isinstance(selection, FieldNode)
+            and (_response_key(selection) == path[0])
+            and selection.selection_set
+        ):
+            found = True
+            selection = FieldNode(
+                alias=selection.alias,
+                name=selection.name,
+                arguments=selection.arguments,
+                directives=selection.directives,
+                selection_set=_replace_at_path(
+                    selection.selection_set, path[1:], tree
+                ),
+            )
+        selections.append(selection)
+
+    if not found:
+        raise ValueError(f"❌ Field {path[0]} not found in GraphQL document")
+
+    return SelectionSetNode(selections=tuple(selections))
+
+
+def project(
+    document: DocumentNode,
+    fields: Optional[Iterable[str]],
+    path: str = "node",
+    required: Iterable[str] = ("id",),
+) -> DocumentNode:
+    """
+    Build a lean variant of a query document that only selects some fields
+    of an entity
+
+    Arguments:
+        document - the full query document
+        fields - dotted paths of the entity fields to select. If not
+        provided, return the document unchanged
+        path - dotted path of field names from the root of the query to the
+        entity, i.e. node.volumes.edges.node. Inline fragments are skipped
+        required - fields that are always selected because the caller needs
+        them, i.e. to key the results
+
+    Returns:
+        The projected document. Documents are memoized so the same
+        projection is only built once
+
+    Raises:
+        ValueError if a field is not selected by the full document
+    """
+    if not fields:
+        return document
+
+    fields = tuple(sorted(set(fields) | set(required)))
+    key = (id(document), path, fields)
+    if key not in _projections:
+        operation = get_operation_ast(document)
+        selection_set = _replace_at_path(
+            operation.selection_set, path.split("."), _field_tree(fields)
+        )
+        name = operation.name.value if operation.name else ""
+        variables = ", ".join(
+            print_ast(v) for v in operation.variable_definitions or []
+        )
+        variables = f"({variables})" if variables else ""
+        _projections[key] = gql(
+            f"{operation.operation.value} {name}{variables}"
+            f" {print_ast(selection_set)}"
+        )
+        logger.debug("Projected %s to fields %s", name, ", ".join(fields))
+
+    return _projections[key]
+
+
+def parse_fields(fields: Optional[str]) -> Optional[list[str]]:
+    """
+    Parse a comma separated list of fields from the command line
+    """
+    if not fields:
+        return None
+
+    return [f.strip() for f in fields.split(",") if f.strip()]
@@ -0,0 +1,117 @@
+"""
+On-disk cache of the Dewrangle GraphQL schema
+
+The introspected schema is cached per Dewrangle base URL so that CLI
+invocations do not need to run a full introspection query before doing any
+real work. The cached schema is also used to validate query variables locally
+so that malformed requests fail without a network round trip.
+"""
+
+import hashlib
+import logging
+import os
+import time
+from typing import Optional
+
+from graphql import GraphQLSchema, OperationDefinitionNode, get_operation_ast
+from graphql.execution.values import get_variable_values
+
+from d3b_api_client_cli.config import config
+from d3b_api_client_cli.utils import read_json, write_json
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_CACHE_DIR = config["dewrangle"]["schema"]["cache_dir"]
+SCHEMA_CACHE_TTL = config["dewrangle"]["schema"]["cache_ttl"]
+
+
+def schema_cache_path(base_url: str, cache_dir: str = SCHEMA_CACHE_DIR) -> str:
+    """
+    Path to the cached schema file for a Dewrangle base URL
+    """
+    key = hashlib.sha256(base_url.rstrip("/").encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, f"schema-{key[:16]}.json")
+
+
+def read_cached_introspection(
+    base_url: str,
+    cache_dir: str = SCHEMA_CACHE_DIR,
+    ttl: Optional[int] = SCHEMA_CACHE_TTL,
+) -> Optional[dict]:
+    """
+    Read the cached introspection result for a Dewrangle base URL
+
+    Returns:
+        The introspection result or None if there is no cached schema or
+        the cached schema is older than ttl seconds
+    """
+    filepath = schema_cache_path(base_url, cache_dir=cache_dir)
+    cached = read_json(filepath, default={})
+    if not cached:
+        return None
+
+    age = time.time() - cached.get("fetched_at", 0)
+    if (ttl is not None) and (age > ttl):
+        logger.info("⌛️ Cached GraphQL schema %s has expired", filepath)
+        return None
+
+    logger.debug("Using cached GraphQL schema %s", filepath)
+    return cached["introspection"]
+
+
+def write_cached_introspection(
+    base_url: str, introspection: dict, cache_dir: str = SCHEMA_CACHE_DIR
+) -> str:
+    """
+    Write an introspection result to the schema cache
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    filepath = schema_cache_path(base_url, cache_dir=cache_dir)
+    write_json(
+        {
+            "base_url": base_url,
+            "fetched_at": time.time(),
+            "introspection": introspection,
+        },
+        filepath,
+        indent=None,
+    )
+    logger.info("✏️  Cached GraphQL schema for %s to %s", base_url, filepath)
+
+    return filepath
+
+
+def clear_cached_introspection(
+    base_url: str, cache_dir: str = SCHEMA_CACHE_DIR
+) -> None:
+    """
+    Remove the cached schema for a Dewrangle base URL
+    """
+    filepath = schema_cache_path(base_url, cache_dir=cache_dir)
+    if os.path.isfile(filepath):
+        os.remove(filepath)
+        logger.info("🗑️  Removed cached GraphQL schema %s", filepath)
+
+
+def validate_variables(
+    schema: GraphQLSchema, gql_query, variables: Optional[dict] = None
+) -> None:
+    """
+    Validate GraphQL variables against the operation's variable definitions
+
+    Raises:
+        ValueError if any of the variables are missing or malformed
+    """
+    operation = get_operation_ast(gql_query)
+    if (schema is None) or not isinstance(operation, OperationDefinitionNode):
+        return
+
+    result = get_variable_values(
+        schema, operation.variable_definitions or [], variables or {}
+    )
+    if isinstance(result, list):
+        name = operation.name.value if operation.name else "<anonymous>"
+        messages = "\n".join(f"  - {error.message}" for error in result)
+        raise ValueError(
+            f"❌ Invalid variables for GraphQL operation {name}:\n{messages}"
+        )
@@ -0,0 +1,147 @@
+"""
+Single-flight collapsing of identical in-flight GraphQL queries
+
+When several threads or async tasks send the same query with the same
+variables at the same moment, only the first one (the leader) sends it.
+The others wait for the leader and get the same parsed response, so N
+identical reads cost one request.
+
+A flight ends when the leader's request finishes. Callers that arrive
+after that send a new request, so nothing is memoized here (see
+d3b_api_client_cli.dewrangle.graphql.loader for that). Mutations are never
+collapsed because each one must reach Dewrangle.
+
+Every caller of a flight gets the same response object, so callers must not
+change it in ways that depend on who made the call.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Hashable
+
+from graphql import DocumentNode
+
+from d3b_api_client_cli.config import config
+from d3b_api_client_cli.dewrangle.graphql.operations import get_operation
+
+logger = logging.getLogger(__name__)
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+class SingleFlight:
+    """
+    Thread-safe collapsing of identical calls usable from threads and event
+    loops
+
+    A flight is a concurrent.futures.Future, which threads can block on and
+    tasks on any event loop can await
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        """
+        Join the flight of a key, starting one if there is none
+
+        Returns:
+            the flight and whether the caller is its leader
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight:
+                logger.debug("🛬 Joining in-flight request %s", key)
+                return flight, False
+
+            flight = Future()
+            self._flights[key] = flight
+            return flight, True
+
+    def _land(self, key: Hashable, flight: Future, result=None, error=None):
+        """
+        End the flight of a key and hand its result to the waiting callers
+        """
+        with self._lock:
+            self._flights.pop(key, None)
+
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """
+        Call fn, or wait for the call of the same key that is in flight
+        """
+        flight, leader = self._join(key)
+        if not leader:
+            return flight.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._land(key, flight, error=e)
+            raise
+
+        self._land(key, flight, result=result)
+        return result
+
+    async def do_async(
+        self, key: Hashable, coro_fn: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """
+        Await coro_fn(), or wait for the call of the same key that is in
+        flight
+        """
+        flight, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(flight)
+
+        try:
+            result = await coro_fn()
+        except BaseException as e:
+            self._land(key, flight, error=e)
+            raise
+
+        self._land(key, flight, result=result)
+        return result
+
+
+def flight_key(gql_query: DocumentNode, variables: dict = None) -> tuple:
+    """
+    Identify a query by its operation hash and its variables
+    """
+    return (
+        get_operation(gql_query).sha256,
+        json.dumps(variables or {}, sort_keys=True, default=str),
+    )
+
+
+def is_collapsible(gql_query: DocumentNode) -> bool:
+    """
+    Whether identical in-flight calls of a document may be collapsed.
+    Only queries are, and only if config["dewrangle"]["client"]
+    ["single_flight"] is enabled
+    """
+    return bool(
+        config["dewrangle"]["client"]["single_flight"]
+        and get_operation(gql_query).operation_type == "query"
+    )
+
+
+def get_single_flight() -> SingleFlight:
+    """
+    Get the single flight group shared by every query in the process
+    """
+    global _single_flight
+    with _single_flight_lock:
+        if not _single_flight:
+            _single_flight = SingleFlight()
+
+    return _single_flight
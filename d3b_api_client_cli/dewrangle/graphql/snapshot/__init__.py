@@ -0,0 +1,332 @@
+"""
+GraphQL methods to fetch the whole Dewrangle entity tree at once
+
+A snapshot fetches the organizations that the viewer has access to, each
+with the first page of its studies and billing groups, and each study with
+the first page of its volumes and credentials, in one nested query per page
+of organizations. Connections are only paginated further when their
+pageInfo says there is a next page, so a typical tenant is fetched in a
+handful of requests instead of several per study.
+"""
+
+import os
+import logging
+from collections import defaultdict
+from typing import Optional
+
+from d3b_api_client_cli.dewrangle.graphql.pagination import (
+    paginate_each,
+    paginate_pages,
+    page_size_for,
+)
+from d3b_api_client_cli.dewrangle.graphql.study import _study_node
+from d3b_api_client_cli.dewrangle.graphql.study import (
+    queries as study_queries,
+)
+from d3b_api_client_cli.dewrangle.graphql.volume import (
+    _volume_node,
+    _volume_key,
+)
+from d3b_api_client_cli.dewrangle.graphql.volume import (
+    queries as volume_queries,
+)
+from d3b_api_client_cli.dewrangle.graphql.credential import _credential_node
+from d3b_api_client_cli.dewrangle.graphql.credential import (
+    queries as credential_queries,
+)
+from d3b_api_client_cli.dewrangle.graphql.billing_group import (
+    _billing_group_node,
+)
+from d3b_api_client_cli.dewrangle.graphql.billing_group import (
+    queries as billing_group_queries,
+)
+from d3b_api_client_cli.dewrangle.graphql.snapshot import queries
+from d3b_api_client_cli.dewrangle.graphql import cache
+from d3b_api_client_cli.config import config
+from d3b_api_client_cli.utils import write_json
+
+DEWRANGLE_DIR = config["dewrangle"]["output_dir"]
+logger = logging.getLogger(__name__)
+
+# Output file of each entity type in a snapshot
+SNAPSHOT_FILES = {
+    "organizations": "Organization.json",
+    "studies": "Study.json",
+    "volumes": "Volume.json",
+    "credentials": "Credential.json",
+    "billing_groups": "BillingGroup.json",
+}
+
+
+def _connection(node: dict, name: str) -> tuple[list[dict], Optional[str]]:
+    """
+    Remove a nested connection from a node
+
+    Returns:
+        The entities in the first page of the connection and the cursor to
+        continue paginating it after, or None if there are no more pages
+    """
+    connection = node.pop(name, None) or {}
+    page_info = connection.get("pageInfo") or {}
+    nodes = [
+        edge["node"]
+        for edge in connection.get("edges", [])
+        if edge.get("node") is not None
+    ]
+    cursor = None
+    if page_info.get("hasNextPage"):
+        cursor = page_info.get("endCursor")
+
+    return nodes, cursor
+
+
+class _Snapshot:
+    """
+    Accumulates the entities of a snapshot and the connections that still
+    have pages to fetch
+    """
+
+    def __init__(self):
+        self.organizations = []
+        self.studies = {}
+        self.volumes = defaultdict(dict)
+        self.credentials = defaultdict(dict)
+        self.billing_groups = {}
+        # Parents of connections with more pages and their end cursors
+        self.more = defaultdict(dict)
+        self.parents = defaultdict(list)
+
+    def _follow(self, name: str, parent: dict, cursor: Optional[str]):
+        if cursor:
+            self.more[name][parent["id"]] = cursor
+            self.parents[name].append(parent)
+
+    def add_organization(self, org: dict):
+        total_studies = (org.get("studies") or {}).get("totalCount")
+        studies, studies_cursor = _connection(org, "studies")
+        billing_groups, billing_groups_cursor = _connection(
+            org, "billingGroups"
+        )
+        # Same shape as the organizations from read_organizations
+        org["studies"] = {"totalCount": total_studies}
+        self.organizations.append(org)
+
+        for study in studies:
+            self.add_study(study, org)
+        for billing_group in billing_groups:
+            self.add_billing_group(billing_group, org)
+
+        self._follow("studies", org, studies_cursor)
+        self._follow("billingGroups", org, billing_groups_cursor)
+
+    def add_study(self, study: dict, org: dict):
+        volumes, volumes_cursor = _connection(study, "volumes")
+        credentials, credentials_cursor = _connection(study, "credentials")
+        study = _study_node(study, org)
+        self.studies[study["globalId"]] = study
+
+        for volume in volumes:
+            self.add_volume(volume, study)
+        for credential in credentials:
+            self.add_credential(credential, study)
+
+        self._follow("volumes", study, volumes_cursor)
+        self._follow("credentials", study, credentials_cursor)
+
+    def add_volume(self, volume: dict, study: dict):
+        volume = _volume_node(volume, study)
+        key = _volume_key(volume["name"], volume["pathPrefix"])
+        self.volumes[key][volume["study_id"]] = volume
+
+    def add_credential(self, credential: dict, study: dict):
+        credential = _credential_node(credential, study)
+        self.credentials[credential["key"]][credential["study_id"]] = credential
+
+    def add_billing_group(self, billing_group: dict, org: dict):
+        billing_group = _billing_group_node(billing_group, org)
+        self.billing_groups[billing_group["cavaticaBillingGroupId"]] = (
+            billing_group
+        )
+
+    def follow(self, name: str, query, path: str, add, variables=None):
+        """
+        Paginate the rest of every connection called name that has more
+        pages
+        """
+        parents = self.parents.pop(name, [])
+        cursors = self.more.pop(name, {})
+        if not parents:
+            return
+
+        logger.info(
+            "📄 Paginating the rest of %s in %s parents", name, len(parents)
+        )
+        for parent, page in paginate_each(
+            query,
+            path,
+            parents,
+            cursors=cursors,
+            variables=variables,
+            prefetch=True,
+        ):
+            for node in page.nodes:
+                add(node, parent)
+
+    def result(self) -> dict:
+        return {
+            "organizations": self.organizations,
+            "studies": self.studies,
+            "volumes": dict(self.volumes),
+            "credentials": dict(self.credentials),
+            "billing_groups": self.billing_groups,
+        }
+
+
+def fetch_snapshot(org_page_size: int = None) -> dict:
+    """
+    Fetch all organizations, studies, volumes, credentials and billing
+    groups that the viewer has access to
+
+    The nested connections in each page of organizations are sized with the
+    page sizes in config["dewrangle"]["pagination"]["page_sizes"]
+
+    Returns:
+        dict that looks like this
+        {
+            "organizations": <list like read_organizations>,
+            "studies": <dict like paginate_studies>,
+            "volumes": <dict like paginate_volumes>,
+            "credentials": <dict like paginate_credentials>,
+            "billing_groups": <dict like paginate_billing_groups>,
+        }
+    """
+    logger.info("📸 Fetching a snapshot of Dewrangle entities ...")
+
+    child_page_sizes = {
+        "volumesFirst": page_size_for(volume_queries.VOLUMES_PATH),
+        "credentialsFirst": page_size_for(credential_queries.CREDENTIALS_PATH),
+    }
+    variables = {
+        "studiesFirst": page_size_for(study_queries.STUDIES_PATH),
+        "billingGroupsFirst": page_size_for(
+            billing_group_queries.BILLING_GROUPS_PATH
+        ),
+        **child_page_sizes,
+    }
+
+    snapshot = _Snapshot()
+    for page in paginate_pages(
+        queries.snapshot,
+        queries.ORGANIZATIONS_PATH,
+        variables=variables,
+        page_size=org_page_size,
+        prefetch=True,
+    ):
+        for org in page.nodes:
+            snapshot.add_organization(org)
+
+    # Studies first since their first pages can add more volumes and
+    # credentials to follow
+    snapshot.follow(
+        "studies",
+        queries.org_study_trees,
+        queries.STUDIES_PATH,
+        snapshot.add_study,
+        variables=child_page_sizes,
+    )
+    snapshot.follow(
+        "billingGroups",
+        billing_group_queries.org_billing_groups,
+        billing_group_queries.BILLING_GROUPS_PATH,
+        snapshot.add_billing_group,
+    )
+    snapshot.follow(
+        "volumes",
+        volume_queries.study_volumes,
+        volume_queries.VOLUMES_PATH,
+        snapshot.add_volume,
+    )
+    snapshot.follow(
+        "credentials",
+        credential_queries.study_credentials,
+        credential_queries.CREDENTIALS_PATH,
+        snapshot.add_credential,
+    )
+
+    result = snapshot.result()
+    logger.info(
+        "📸 Snapshot has %s",
+        ", ".join(
+            f"{len(entities)} {name}" for name, entities in result.items()
+        ),
+    )
+
+    return result
+
+
+def read_snapshot(output_dir: str = DEWRANGLE_DIR) -> dict:
+    """
+    Fetch a snapshot of all Dewrangle entities and write each entity type
+    to the same file as its read_* function
+
+    See fetch_snapshot
+    """
+    data = fetch_snapshot()
+
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        for name, filename in SNAPSHOT_FILES.items():
+            filepath = os.path.join(output_dir, filename)
+            write_json(data[name], filepath)
+            logger.info("✏️  Wrote %s %s to %s", len(data[name]), name, filepath)
+
+    return data
+
+
+def sync_cache() -> dict:
+    """
+    Replace the entity cache of the current Dewrangle base URL with a
+    snapshot of all Dewrangle entities
+
+    See d3b_api_client_cli.dewrangle.graphql.cache
+
+    Returns:
+        Number of cached entities of each type
+
+    Raises:
+        ValueError if the entity cache is disabled
+    """
+    if not config["dewrangle"]["cache"]["enabled"]:
+        raise ValueError(
+            "❌ The entity cache is disabled. Enable it with"
+            " `dewrangle --use-cache` or DEWRANGLE_ENTITY_CACHE=true"
+        )
+
+    data = fetch_snapshot()
+    entities = {
+        "organization": {org["name"]: org for org in data["organizations"]},
+        "study": data["studies"],
+        "volume": {
+            cache.entity_key(study_id, key): volume
+            for key, volumes in data["volumes"].items()
+            for study_id, volume in volumes.items()
+        },
+        "credential": {
+            cache.entity_key(study_id, key): credential
+            for key, credentials in data["credentials"].items()
+            for study_id, credential in credentials.items()
+        },
+        "billing_group": data["billing_groups"],
+    }
+
+    cache.clear_cache()
+    for entity_type, entities_by_key in entities.items():
+        cache.put_entities(entity_type, entities_by_key)
+
+    counts = {k: len(v) for k, v in entities.items()}
+    logger.info(
+        "✅ Synced entity cache: %s",
+        ", ".join(f"{count} {name}" for name, count in counts.items()),
+    )
+
+    return counts
@@ -0,0 +1,175 @@
+"""
+Dewrangle GraphQL query definitions
+"""
+
+from gql import gql
+
+# Fields of a study with the first page of its volumes and credentials.
+# Shared by the snapshot query and the follow-up pagination of studies
+STUDY_TREE_FRAGMENT = """
+    fragment StudyTree on Study {
+      id
+      globalId
+      name
+      studyFhirServers {
+        edges {
+          node {
+            id
+            ... on StudyFhirServer {
+              fhirServer {
+                id
+                name
+                url
+                type
+                authType
+                authConfig {
+                  ... on FhirServerAuthConfigOIDCClientCredential {
+                    issuerBaseUrl
+                    clientId
+                  }
+                }
+              }
+            }
+          }
+        }
+      }
+      volumes(first: $volumesFirst) {
+        totalCount
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+        edges {
+          node {
+            id
+            name
+            region
+            type
+            pathPrefix
+            study {
+              id
+              globalId
+            }
+            credential {
+              id
+              type
+              key
+            }
+          }
+        }
+      }
+      credentials(first: $credentialsFirst) {
+        totalCount
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
+        edges {
+          node {
+            id
+            name
+            key
+          }
+        }
+      }
+    }
+"""
+
+snapshot = gql(
+    """
+    query snapshot(
+      $first: Int
+      $after: ID
+      $studiesFirst: Int
+      $billingGroupsFirst: Int
+      $volumesFirst: Int
+      $credentialsFirst: Int
+    ) {
+      viewer {
+        organizationUsers(first: $first, after: $after) {
+          totalCount
+          pageInfo {
+            hasNextPage
+            endCursor
+          }
+          edges {
+            node {
+              organization {
+                id
+                name
+                description
+                email
+                website
+                studies(first: $studiesFirst) {
+                  totalCount
+                  pageInfo {
+                    hasNextPage
+                    endCursor
+                  }
+                  edges {
+                    node {
+                      ...StudyTree
+                    }
+                  }
+                }
+                billingGroups(first: $billingGroupsFirst) {
+                  totalCount
+                  pageInfo {
+                    hasNextPage
+                    endCursor
+                  }
+                  edges {
+                    node {
+                      id
+                      cavaticaBillingGroupId
+                      name
+                    }
+                  }
+                }
+              }
+            }
+          }
+        }
+      }
+    }
+    """
+    + STUDY_TREE_FRAGMENT
+)
+
+org_study_trees = gql(
+    """
+    query orgStudyTrees(
+      $id: ID!
+      $first: Int
+      $after: ID
+      $volumesFirst: Int
+      $credentialsFirst: Int
+    ) {
+      node(id: $id) {
+        id
+        ... on Organization {
+          name
+          id
+          studies(first: $first, after: $after) {
+            totalCount
+            pageInfo {
+              hasNextPage
+              endCursor
+            }
+            edges {
+              node {
+                ...StudyTree
+              }
+            }
+          }
+        }
+      }
+    }
+    """
+    + STUDY_TREE_FRAGMENT
+)
+
+# Path from the root of snapshot to each organization and from the root of
+# org_study_trees to each study
+ORGANIZATIONS_PATH = "viewer.organizationUsers.edges.node.organization"
+STUDIES_PATH = "node.studies.edges.node"
@@ -2,26 +2,48 @@
 GraphQL methods to CRUD study in Dewrangle
 """
 
+import contextvars
 import os
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pformat
-from typing import Optional
+from typing import Iterator, Optional
 
 import gql
 
 from d3b_api_client_cli.dewrangle.graphql.common import (
     exec_query,
 )
+from d3b_api_client_cli.dewrangle.graphql.pagination import paginate_each
+from d3b_api_client_cli.dewrangle.graphql.projection import project
+from d3b_api_client_cli.dewrangle.graphql.checkpoint import listing_checkpoint
+from d3b_api_client_cli.dewrangle.graphql import cache
+from d3b_api_client_cli.dewrangle.graphql.organization.queries import (
+    ORGANIZATION_KEY_FIELDS,
+)
 from d3b_api_client_cli.dewrangle.graphql.study import (
     queries,
     mutations,
 )
 from d3b_api_client_cli.dewrangle.graphql.organization import (
-    paginate_organizations,
+    iter_organizations,
+)
+from d3b_api_client_cli.dewrangle.graphql.batch import (
+    read_nodes,
+    DEWRANGLE_MAX_BATCH_SIZE,
+)
+from d3b_api_client_cli.dewrangle.graphql.loader import (
+    Loader,
+    node_loader,
+    remember_node,
+    forget_node,
 )
 from d3b_api_client_cli.config import config
 from d3b_api_client_cli.utils import (
     write_json,
+    write_entities,
+    stream_entities,
+    STREAMING_OUTPUT_FORMATS,
     kf_id_to_global_id,
     global_id_to_kf_id,
 )
@@ -29,7 +51,9 @@ from d3b_api_client_cli.utils import (
 logger = logging.getLogger(__name__)
 
 DEWRANGLE_DIR = config["dewrangle"]["output_dir"]
-DEWRANGLE_MAX_PAGE_SIZE = config["dewrangle"]["pagination"]["max_page_size"]
+# Above this many filtered study queries, paginating all studies once is
+# cheaper
+MAX_FILTERED_STUDY_QUERIES = 10
 
 
 def upsert_global_descriptors(
@@ -52,6 +76,13 @@ def upsert_global_descriptors(
     }
     resp = exec_query(mutations.upsert_global_descriptors, variables=variables)
 
+    return _upsert_global_descriptors_result(resp)
+
+
+def _upsert_global_descriptors_result(resp: dict) -> dict:
+    """
+    Log the response of the global descriptor upsert mutation
+    """
     key = "globalDescriptorUpsert"
     mutation_errors = resp.get(key, {}).get("errors")
     job_errors = (
@@ -84,26 +115,25 @@ def upsert_study(
     Returns:
         Dewrangle study dict
     """
-    update = False
-    global_id = None
-    if study_id and study_id.startswith("SD_"):
-        global_id = kf_id_to_global_id(study_id)
-
-    if not global_id:
-        global_id = variables.get("globalId", "")
+    global_id = _upsert_global_id(variables, study_id)
 
     study = None
     if global_id:
-        study = find_study(global_id)
+        study = find_study(global_id, organization_id=organization_id)
+
+    return _upsert_study(variables, organization_id, study)
+
 
+def _upsert_study(
+    variables: dict, organization_id: str, study: Optional[dict]
+) -> dict:
+    """
+    Update the study if it exists, otherwise create it
+    """
+    update = False
     if study:
         update = True
-        if study["organization_id"] != organization_id:
-            raise ValueError(
-                "❌ This study is already part of another organization:"
-                f" {study['organization_id']}. You cannot change its"
-                " organization"
-            )
+        _check_study_organization(study, organization_id)
 
     params = {"input": variables}
 
@@ -117,17 +147,171 @@ def upsert_study(
         params["input"].update({"organizationId": organization_id})
         params.pop("id", None)
         resp = exec_query(mutations.create_study, variables=params)
-        dwid = resp["studyCreate"]["study"]["id"]
+        dwid = (resp["studyCreate"].get("study") or {}).get("id")
+
+    return _upsert_result(resp, key, dwid, organization_id)
+
+
+def upsert_studies(
+    rows: list[dict],
+    output_dir: str = DEWRANGLE_DIR,
+    output_format: str = "csv",
+    max_concurrency: int = None,
+) -> str:
+    """
+    Upsert many studies in Dewrangle
+
+    Existing studies are resolved all at once with study_global_id_loader,
+    which paginates all studies at most once, and then the create and
+    update mutations are sent concurrently. A failed row does not stop the
+    others. Rows with the global ID of an earlier row are rejected, so that
+    one study is never created twice
+
+    Arguments:
+        rows - Study attributes (see Dewrangle graphql schema) plus the
+        organization_id of the study and optionally its kf_id
+        output_dir - directory where the result of each row will be written
+        output_format - format of the result file: json, ndjson or csv
+        max_concurrency - max number of mutations in flight at once.
+        Defaults to config["dewrangle"]["client"]["max_concurrency"]
+
+    Returns:
+        Path to the result file
+    """
+    missing = [
+        i + 1 for i, row in enumerate(rows) if not row.get("organization_id")
+    ]
+    if missing:
+        raise ValueError(f"❌ Rows {missing} are missing an organization_id")
+
+    rows = [dict(row) for row in rows]
+    global_ids = [
+        _upsert_global_id(row, row.pop("kf_id", None)) for row in rows
+    ]
+    logger.info("🛸 Upserting %s studies ...", len(rows))
+    studies = study_global_id_loader.load_many(
+        [global_id for global_id in global_ids if global_id]
+    )
+    first_rows = {}
+    for i, global_id in enumerate(global_ids):
+        if global_id:
+            first_rows.setdefault(global_id, i + 1)
+
+    def upsert(i):
+        row = rows[i]
+        study = studies.get(global_ids[i]) if global_ids[i] else None
+        result = {
+            "row": i + 1,
+            "globalId": global_ids[i],
+            "organization_id": row.pop("organization_id", None),
+            "action": "Update" if study else "Create",
+            "id": None,
+            "error": None,
+        }
+        first_row = first_rows.get(global_ids[i], i + 1)
+        if first_row != i + 1:
+            result["error"] = f"Duplicate of row {first_row}"
+            logger.error("❌ Skipping row %s: %s", i + 1, result["error"])
+            return result
+
+        try:
+            study = _upsert_study(row, result["organization_id"], study)
+            result["id"] = study["id"]
+            result["globalId"] = study.get("globalId") or result["globalId"]
+            if study.get("errors"):
+                result["error"] = "; ".join(
+                    error.get("message", str(error))
+                    for error in study["errors"]
+                )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error("❌ Upsert study in row %s failed: %s", i + 1, e)
+            result["error"] = str(e)
+        return result
+
+    max_concurrency = (
+        max_concurrency or config["dewrangle"]["client"]["max_concurrency"]
+    )
+    if not config["dewrangle"]["client"]["persistent_session"]:
+        # Only the persistent GraphQL session can be shared by many threads
+        max_concurrency = 1
+    with ThreadPoolExecutor(
+        max_workers=max_concurrency, thread_name_prefix="dewrangle-upsert"
+    ) as executor:
+        # Run each row in a copy of the context so the workers share the
+        # loader_scope of the caller, if any
+        futures = [
+            executor.submit(contextvars.copy_context().run, upsert, i)
+            for i in range(len(rows))
+        ]
+        results = [future.result() for future in futures]
+
+    os.makedirs(output_dir, exist_ok=True)
+    filepath = os.path.join(output_dir, f"StudyUpsert.{output_format}")
+    if output_format in STREAMING_OUTPUT_FORMATS:
+        write_entities(results, filepath, output_format)
+    else:
+        write_json(results, filepath)
+
+    failed = sum(1 for result in results if result["error"])
+    logger.info(
+        "✏️  Upserted %s/%s studies, wrote results to %s",
+        len(results) - failed,
+        len(results),
+        filepath,
+    )
+
+    return filepath
+
+
+def _upsert_global_id(variables: dict, study_id: str = None) -> str:
+    """
+    Get the global ID used to look up an existing study before an upsert
+    """
+    global_id = None
+    if study_id and study_id.startswith("SD_"):
+        global_id = kf_id_to_global_id(study_id)
 
+    if not global_id:
+        global_id = variables.get("globalId", "")
+
+    return global_id
+
+
+def _check_study_organization(study: dict, organization_id: str):
+    """
+    Raise an exception if an existing study belongs to a different
+    organization than the one it is being upserted into
+    """
+    if study["organization_id"] != organization_id:
+        raise ValueError(
+            "❌ This study is already part of another organization:"
+            f" {study['organization_id']}. You cannot change its"
+            " organization"
+        )
+
+
+def _upsert_result(
+    resp: dict, key: str, dwid: str, organization_id: str
+) -> dict:
+    """
+    Log the response of a study create/update and return the study
+
+    If Dewrangle rejected the mutation, its errors are in the "errors" key
+    of the study
+    """
     errors = resp.get(f"study{key}", {}).get("errors")
     if errors:
         logger.error("❌ %s study failed:\n%s", key, pformat(resp))
     else:
         logger.info("✅ %s study succeeded:\n%s", key, pformat(resp))
 
-    result = resp[f"study{key}"]["study"]
+    result = resp[f"study{key}"].get("study") or {}
     result["id"] = dwid
     result["organization_id"] = organization_id
+    if errors:
+        result["errors"] = errors
+    else:
+        _remember_study(result)
 
     return result
 
@@ -164,6 +348,13 @@ def delete_study(
         delete_safety_check=delete_safety_check,
     )
 
+    return _delete_result(resp, node_id)
+
+
+def _delete_result(resp: dict, node_id: str) -> dict:
+    """
+    Log the response of a study delete and return the study
+    """
     errors = resp.get("studyDelete", {}).get("errors")
     key = "Delete"
     if errors:
@@ -173,12 +364,17 @@ def delete_study(
         logger.info("✅ %s study succeeded:\n%s", key, pformat(resp))
         result = resp["studyDelete"]["study"]
         result["id"] = node_id
+        _forget_study(result)
 
     return result
 
 
 def read_studies(
-    output_dir: str = DEWRANGLE_DIR, log_output: bool = True
+    output_dir: str = DEWRANGLE_DIR,
+    log_output: bool = True,
+    fields: list[str] = None,
+    resume: bool = False,
+    output_format: str = "json",
 ) -> list[dict]:
     """
     Fetch studies that the client has access to
@@ -186,17 +382,39 @@ def read_studies(
     Arguments:
         output_dir - directory where study metadata will be written
         log_output - whether to log study dicts
+        fields - only fetch these fields of each study, i.e. id,name
+        resume - checkpoint the listing in output_dir and continue an
+        interrupted listing from its checkpoint instead of starting over
+        output_format - json writes the whole listing at once. ndjson and
+        csv write each entity to the output file as its page arrives
 
     Returns:
-        List of study dicts
+        List of study dicts, or the path to the output file if
+        output_format is ndjson or csv
     """
-    data = paginate_studies()
+    checkpoint = listing_checkpoint(
+        output_dir, "Study", key={"fields": fields}, resume=resume
+    )
+    if output_format in STREAMING_OUTPUT_FORMATS:
+        filepath = stream_entities(
+            iter_studies(fields=fields, prefetch=True, checkpoint=checkpoint),
+            output_dir,
+            "Study",
+            output_format,
+        )
+        if checkpoint:
+            checkpoint.clear()
+        return filepath
+
+    data = paginate_studies(fields=fields, checkpoint=checkpoint)
 
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
         filepath = os.path.join(output_dir, "Study.json")
         write_json(data, filepath)
         logger.info("✏️  Wrote %s study to %s", len(data), filepath)
+        if checkpoint:
+            checkpoint.clear()
 
     if log_output:
         logger.info("🔬 Studies:\n%s", pformat(data))
@@ -207,9 +425,18 @@ def read_studies(
 def read_study(node_id: str) -> dict:
     """
     Fetch study by node id
+
+    The study is memoized for the rest of the run
+    """
+    study = node_loader(queries.study).load(node_id)
+
+    return _read_result({"node": study}, node_id)
+
+
+def _read_result(resp: dict, node_id: str) -> dict:
+    """
+    Log the response of a study node query and return the study
     """
-    variables = {"id": node_id}
-    resp = exec_query(queries.study, variables=variables)
     study = resp.get("node", {})
 
     if study:
@@ -224,67 +451,275 @@ def read_study(node_id: str) -> dict:
     return study
 
 
+def batch_read_studies(
+    node_ids: list[str], batch_size: int = DEWRANGLE_MAX_BATCH_SIZE
+) -> dict:
+    """
+    Fetch many studies by node id in ceil(len(node_ids) / batch_size)
+    requests
+
+    Returns:
+        dict of study dicts keyed by node ID
+    """
+    return read_nodes(queries.study, node_ids, batch_size=batch_size)
+
+
+def iter_studies(
+    organizations=None,
+    study_page_size=None,
+    fields=None,
+    prefetch=False,
+    checkpoint=None,
+) -> Iterator[dict]:
+    """
+    Lazily fetch the studies in all organizations that the viewer has
+    access to
+
+    Pages are fetched as the caller iterates, so stopping early (i.e. once
+    the wanted study is found) stops the pagination.
+    See d3b_api_client_cli.dewrangle.graphql.pagination
+
+    Set prefetch if the whole listing will be used, so that each next page
+    is requested while the current one is processed
+
+    Save each page to checkpoint if one is given and skip what it already
+    holds. See d3b_api_client_cli.dewrangle.graphql.checkpoint
+
+    Only fetch the given fields of each study if fields are provided.
+    See d3b_api_client_cli.dewrangle.graphql.projection
+    """
+    if not organizations:
+        organizations = iter_organizations(fields=ORGANIZATION_KEY_FIELDS)
+
+    query = project(
+        queries.org_studies,
+        fields,
+        path=queries.STUDIES_PATH,
+        required=queries.STUDY_KEY_FIELDS,
+    )
+
+    for org, page in paginate_each(
+        query,
+        queries.STUDIES_PATH,
+        organizations,
+        page_size=study_page_size,
+        prefetch=prefetch,
+        checkpoint=checkpoint,
+    ):
+        if not page.total_count:
+            continue
+
+        logger.info("******* Organization %s *******", org["name"])
+        logger.info(
+            "Collecting %s/%s studies for org %s",
+            page.count,
+            page.total_count,
+            org["name"],
+        )
+        for study in page.nodes:
+            yield _study_node(study, org)
+
+
 def paginate_studies(
-    organizations=None, study_page_size=DEWRANGLE_MAX_PAGE_SIZE
+    organizations=None, study_page_size=None, fields=None, checkpoint=None
 ):
     """
     Fetch all studies in all organizations that the viewer has access to
 
     Use Relay graphql pagination
-    """
-    if not organizations:
-        organizations = paginate_organizations()
 
+    Returns:
+        dict of study dicts keyed by study global ID
+
+    Only fetch the given fields of each study if fields are provided.
+    See d3b_api_client_cli.dewrangle.graphql.projection
+    """
     logger.info("📄 Paginating Dewrangle studies ...")
 
+    return {
+        study["globalId"]: study
+        for study in iter_studies(
+            organizations=organizations,
+            study_page_size=study_page_size,
+            fields=fields,
+            prefetch=True,
+            checkpoint=checkpoint,
+        )
+    }
+
+
+def _study_node(study: dict, org: dict) -> dict:
+    """
+    Add the organization and KF ID to a study from a page of studies
+    """
+    study["organization_id"] = org["id"]
+    study["kf_id"] = global_id_to_kf_id(study["globalId"])
+    logger.info("Found study %s", study["globalId"])
+
+    return study
+
+
+def find_study(study_global_id: str, organization_id: str = None) -> dict:
+    """
+    Find study using Dewrangle global ID or Kids First ID
+
+    Studies are looked up in the entity cache first (see
+    d3b_api_client_cli.dewrangle.graphql.cache). Otherwise they are queried
+    with Dewrangle's study filter, in the study's organization first if
+    organization_id is known and then in each of the viewer's other
+    organizations. Studies that are found are memoized for the rest of the
+    run
+
+    Arguments:
+        study_global_id - Dewrangle global ID or Kids First ID of the study
+        organization_id - Dewrangle ID of the study's organization, if known
+    """
+    global_id = study_global_id
+    if global_id.startswith("SD_"):
+        global_id = kf_id_to_global_id(global_id)
+
+    study = cache.get_entity("study", global_id)
+    if study:
+        return study
+    if not organization_id:
+        return study_global_id_loader.load(global_id)
+
+    study = _filter_studies([global_id], [organization_id]).get(global_id)
+    if study:
+        return study
+
+    studies = _load_studies_by_global_id(
+        [global_id], searched_organization_id=organization_id
+    )
+    return studies.get(global_id) or {}
+
+
+def _filter_studies(global_ids: list[str], organization_ids: list[str]) -> dict:
+    """
+    Query studies by global ID with Dewrangle's study filter, trying each
+    organization until the study is found
+
+    Returns:
+        The studies that were found, keyed by global ID
+    """
     studies = {}
-    for org in organizations:
-        variables = {"first": study_page_size, "id": org["id"]}
-        resp = exec_query(queries.org_studies, variables=variables)
-
-        count = 0
-        has_next_page = True
-        while has_next_page:
-            org_studies = resp["node"]["studies"]["edges"]
-            page_info = resp["node"]["studies"]["pageInfo"]
-
-            count += len(org_studies)
-            total = resp["node"]["studies"]["totalCount"]
-
-            if not total:
-                has_next_page = False
-                continue
-
-            logger.info("******* Organization %s *******", org["name"])
-            logger.info(
-                "Collecting %s/%s studies for org %s", count, total, org["name"]
+    for global_id in global_ids:
+        for organization_id in organization_ids:
+            resp = exec_query(
+                queries.study_by_global_id,
+                variables=_filter_variables(global_id, organization_id),
             )
-            # Add studies to ouput
-            for s in org_studies:
-                study = s["node"]
-                study["organization_id"] = org["id"]
-                kf_id = global_id_to_kf_id(study["globalId"])
-                study["kf_id"] = kf_id
-                studies[study["globalId"]] = study
-                logger.info("Found study %s", study["globalId"])
-
-            # Fetch next page if there is one
-            has_next_page = page_info["hasNextPage"]
-            end_cursor = page_info["endCursor"]
-            if has_next_page and end_cursor:
-                variables.update({"after": end_cursor})
-                resp = exec_query(queries.org_studies, variables=variables)
+            study = _filtered_study(resp, global_id, organization_id)
+            if study:
+                studies[global_id] = study
+                break
+
+    _memoize_studies(studies)
+
+    return studies
+
+
+def _filter_variables(global_id: str, organization_id: str) -> dict:
+    return {"id": organization_id, "filter": {"query": global_id}}
+
+
+def _filtered_study(
+    resp: dict, global_id: str, organization_id: str
+) -> Optional[dict]:
+    """
+    Pick the study with the global ID out of a filtered study query
+    """
+    connection = (resp.get("node") or {}).get("studies") or {}
+    study = next(
+        (
+            edge["node"]
+            for edge in connection.get("edges", [])
+            if edge["node"]["globalId"] == global_id
+        ),
+        None,
+    )
+    if study:
+        study = _study_node(study, {"id": organization_id})
+
+    return study
+
+
+def _memoize_studies(studies: dict):
+    """
+    Memoize and cache studies that were found by filter
+    """
+    for global_id, study in studies.items():
+        study_global_id_loader.prime(global_id, study)
+    cache.put_entities("study", studies)
+
+
+def _load_studies_by_global_id(
+    global_ids: list[str], searched_organization_id: str = None
+) -> dict:
+    """
+    Batch load function of study_global_id_loader
+
+    Serve the studies from the entity cache or find them with the study
+    filter in each of the viewer's organizations. Studies the filter does
+    not find do not exist. Only if filtering would take more than
+    MAX_FILTERED_STUDY_QUERIES queries, paginate all studies once and
+    memoize and cache every study that was found, not just the ones
+    requested
+
+    Arguments:
+        global_ids - Dewrangle global IDs of the studies
+        searched_organization_id - ID of an organization that was already
+        filtered for the studies and is skipped
+    """
+    studies = {
+        global_id: cache.get_entity("study", global_id)
+        for global_id in global_ids
+    }
+    missing = [global_id for global_id, study in studies.items() if not study]
+    if not missing:
+        return studies
+
+    organization_ids = [
+        org["id"]
+        for org in iter_organizations(fields=ORGANIZATION_KEY_FIELDS)
+        if org["id"] != searched_organization_id
+    ]
+    if len(missing) * len(organization_ids) <= MAX_FILTERED_STUDY_QUERIES:
+        studies.update(_filter_studies(missing, organization_ids))
+        return studies
+
+    logger.info(
+        "🔎 Too many studies %s to filter, paginating all studies", missing
+    )
+    studies = paginate_studies(fields=queries.STUDY_KEY_FIELDS)
+    _memoize_studies(studies)
 
     return studies
 
 
-def find_study(study_global_id: str) -> dict:
+study_global_id_loader = Loader(
+    _load_studies_by_global_id, name="study_global_id_loader"
+)
+
+
+def _remember_study(study: dict):
+    """
+    Write a created or updated study through to the loaders of the run and
+    the entity cache
+    """
+    remember_node(queries.study, study)
+    study_global_id_loader.prime(study["globalId"], study)
+    cache.put_entity("study", study["globalId"], study)
+
+
+def _forget_study(study: dict):
     """
-    Find study using Dewrangle global ID. Use this when you don't know the
-    org ID
+    Evict a deleted study from the loaders of the run and the entity cache
     """
-    studies = paginate_studies()
-    return studies.get(study_global_id, {})
+    forget_node(study["id"])
+    # Without the global ID there is no telling which lookup held the study
+    study_global_id_loader.clear(study.get("globalId"))
+    cache.delete_entity("study", study["id"])
 
 
 def get_study_by_id(study_id: str, org_node_id: str) -> dict:
@@ -299,6 +734,13 @@ def get_study_by_id(study_id: str, org_node_id: str) -> dict:
         variables={"id": org_node_id, "filter": {"query": study_id}},
     )
 
+    return _get_study_by_id_result(resp, study_id)
+
+
+def _get_study_by_id_result(resp: dict, study_id: str) -> dict:
+    """
+    Log the response of a filtered study query and return the study
+    """
     errors = resp.get("studyQuery", {}).get("errors")
     key = "Get"
     if errors:
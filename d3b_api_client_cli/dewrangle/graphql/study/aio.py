@@ -0,0 +1,272 @@
+"""
+Asyncio versions of the GraphQL methods to CRUD study in Dewrangle
+"""
+
+import asyncio
+import logging
+from typing import AsyncIterator, Optional
+
+from d3b_api_client_cli.dewrangle.graphql.batch import (
+    async_read_nodes,
+    DEWRANGLE_MAX_BATCH_SIZE,
+)
+from d3b_api_client_cli.dewrangle.graphql.common import (
+    async_exec_query,
+)
+from d3b_api_client_cli.dewrangle.graphql.pagination import (
+    async_paginate_each,
+)
+from d3b_api_client_cli.dewrangle.graphql.projection import project
+from d3b_api_client_cli.dewrangle.graphql.organization.queries import (
+    ORGANIZATION_KEY_FIELDS,
+)
+from d3b_api_client_cli.dewrangle.graphql.loader import node_loader
+from d3b_api_client_cli.dewrangle.graphql import cache
+from d3b_api_client_cli.dewrangle.graphql.study import (
+    queries,
+    mutations,
+    _upsert_global_descriptors_result,
+    _upsert_global_id,
+    _check_study_organization,
+    _upsert_result,
+    _delete_result,
+    _read_result,
+    _study_node,
+    _get_study_by_id_result,
+    _filter_variables,
+    _filtered_study,
+    _memoize_studies,
+    _load_studies_by_global_id,
+    study_global_id_loader,
+)
+from d3b_api_client_cli.dewrangle.graphql.organization.aio import (
+    paginate_organizations,
+)
+from d3b_api_client_cli.utils import kf_id_to_global_id
+
+logger = logging.getLogger(__name__)
+
+
+async def upsert_global_descriptors(
+    study_file_id: str, skip_unavailable_descriptors: Optional[bool] = True
+) -> dict:
+    """
+    Trigger the operation to upsert global descriptors in Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.study.upsert_global_descriptors
+    """
+    logger.info(
+        "🛸 Upsert global descriptors for study file: %s", study_file_id
+    )
+    variables = {
+        "input": {
+            "studyFileId": study_file_id,
+            "skipUnavailableDescriptors": skip_unavailable_descriptors,
+        }
+    }
+    resp = await async_exec_query(
+        mutations.upsert_global_descriptors, variables=variables
+    )
+
+    return _upsert_global_descriptors_result(resp)
+
+
+async def upsert_study(
+    variables: dict, organization_id: str, study_id: str = None
+) -> dict:
+    """
+    Upsert study in Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.study.upsert_study
+    """
+    global_id = _upsert_global_id(variables, study_id)
+
+    study = None
+    if global_id:
+        study = await find_study(global_id, organization_id=organization_id)
+
+    if study:
+        _check_study_organization(study, organization_id)
+
+    params = {"input": variables}
+
+    if study:
+        key = "Update"
+        params.update({"id": study["id"]})
+        dwid = study["id"]
+        resp = await async_exec_query(mutations.update_study, variables=params)
+    else:
+        key = "Create"
+        params["input"].update({"organizationId": organization_id})
+        params.pop("id", None)
+        resp = await async_exec_query(mutations.create_study, variables=params)
+        dwid = (resp["studyCreate"].get("study") or {}).get("id")
+
+    return _upsert_result(resp, key, dwid, organization_id)
+
+
+async def delete_study(
+    _id: str,
+    delete_safety_check: bool = True,
+) -> dict:
+    """
+    Delete study in Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.study.delete_study
+    """
+    node_id = _id
+    if _id.startswith("SD_"):
+        study = await find_study(kf_id_to_global_id(_id))
+        node_id = study.get("id")
+        if not node_id:
+            logger.warning(
+                "⚠️  Could not find associated dewrangle ID."
+                " Delete study %s ABORTED",
+                _id,
+            )
+            return
+
+    resp = await async_exec_query(
+        mutations.delete_study,
+        variables={"id": node_id},
+        delete_safety_check=delete_safety_check,
+    )
+
+    return _delete_result(resp, node_id)
+
+
+async def read_study(node_id: str) -> dict:
+    """
+    Fetch study by node id
+
+    The study is memoized for the rest of the run and concurrent reads are
+    merged into batched node queries
+    """
+    study = await node_loader(queries.study).load_async(node_id)
+
+    return _read_result({"node": study}, node_id)
+
+
+async def batch_read_studies(
+    node_ids: list[str], batch_size: int = DEWRANGLE_MAX_BATCH_SIZE
+) -> dict:
+    """
+    Fetch many studies by node id in ceil(len(node_ids) / batch_size)
+    requests
+
+    Returns:
+        dict of study dicts keyed by node ID
+    """
+    return await async_read_nodes(
+        queries.study, node_ids, batch_size=batch_size
+    )
+
+
+async def iter_studies(
+    organizations=None, study_page_size=None, fields=None, prefetch=False
+) -> AsyncIterator[dict]:
+    """
+    Lazily fetch the studies in all organizations that the viewer has
+    access to
+
+    See d3b_api_client_cli.dewrangle.graphql.study.iter_studies
+    """
+    if not organizations:
+        organizations = await paginate_organizations(
+            fields=ORGANIZATION_KEY_FIELDS
+        )
+
+    query = project(
+        queries.org_studies,
+        fields,
+        path=queries.STUDIES_PATH,
+        required=queries.STUDY_KEY_FIELDS,
+    )
+
+    async for org, page in async_paginate_each(
+        query,
+        queries.STUDIES_PATH,
+        organizations,
+        page_size=study_page_size,
+        prefetch=prefetch,
+    ):
+        if not page.total_count:
+            continue
+
+        logger.info(
+            "Collecting %s/%s studies for org %s",
+            page.count,
+            page.total_count,
+            org["name"],
+        )
+        for study in page.nodes:
+            yield _study_node(study, org)
+
+
+async def paginate_studies(
+    organizations=None, study_page_size=None, fields=None
+) -> dict:
+    """
+    Fetch all studies in all organizations that the viewer has access to
+
+    Use Relay graphql pagination
+    """
+    logger.info("📄 Paginating Dewrangle studies ...")
+
+    return {
+        study["globalId"]: study
+        async for study in iter_studies(
+            organizations=organizations,
+            study_page_size=study_page_size,
+            fields=fields,
+            prefetch=True,
+        )
+    }
+
+
+async def find_study(study_global_id: str, organization_id: str = None) -> dict:
+    """
+    Find study using Dewrangle global ID or Kids First ID
+
+    See d3b_api_client_cli.dewrangle.graphql.study.find_study
+    """
+    global_id = study_global_id
+    if global_id.startswith("SD_"):
+        global_id = kf_id_to_global_id(global_id)
+
+    study = cache.get_entity("study", global_id)
+    if study:
+        return study
+    if not organization_id:
+        return await study_global_id_loader.load_async(global_id)
+
+    resp = await async_exec_query(
+        queries.study_by_global_id,
+        variables=_filter_variables(global_id, organization_id),
+    )
+    study = _filtered_study(resp, global_id, organization_id)
+    if study:
+        _memoize_studies({global_id: study})
+        return study
+
+    studies = await asyncio.to_thread(
+        _load_studies_by_global_id,
+        [global_id],
+        searched_organization_id=organization_id,
+    )
+    return studies.get(global_id) or {}
+
+
+async def get_study_by_id(study_id: str, org_node_id: str) -> dict:
+    """
+    Fetch study from Dewrangle by KF ID or global ID
+    """
+    if study_id.startswith("SD_"):
+        study_id = kf_id_to_global_id(study_id)
+
+    resp = await async_exec_query(
+        queries.study_by_global_id,
+        variables={"id": org_node_id, "filter": {"query": study_id}},
+    )
+
+    return _get_study_by_id_result(resp, study_id)
@@ -20,6 +20,10 @@ create_study = gql(
           id
           name
           globalId
+          organization {
+            name
+            id
+          }
         }
       }
     }
@@ -40,6 +44,10 @@ update_study = gql(
           id
           name
           globalId
+          organization {
+            name
+            id
+          }
         }
       }
     }
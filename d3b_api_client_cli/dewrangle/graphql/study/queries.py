@@ -4,6 +4,7 @@ Dewrangle GraphQL query definitions
 
 from gql import gql
 
+
 study = gql(
     """
     query studyQuery($id: ID!) {
@@ -95,3 +96,8 @@ org_studies = gql(
     }
   """
 )
+
+# Path from the root of org_studies to each study and the fields that are
+# always needed to store a page of studies
+STUDIES_PATH = "node.studies.edges.node"
+STUDY_KEY_FIELDS = ["id", "globalId", "name"]
@@ -0,0 +1,242 @@
+"""
+aiohttp GraphQL transport used to talk to Dewrangle
+
+Registered operations are sent as Automatic Persisted Queries (APQ): the
+first attempt only sends the SHA-256 hash of the query text. If the server
+has not seen the hash yet it asks for the full text and caches it, so later
+requests for the same operation stay small. If the server rejects the first
+hash-only request for any other reason than an unknown hash, the transport
+assumes it does not support persisted queries and sends the full query text
+from then on.
+"""
+
+import json
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from aiohttp import ClientResponseError
+from gql.transport.aiohttp import AIOHTTPTransport
+from gql.transport.exceptions import (
+    TransportClosed,
+    TransportProtocolError,
+    TransportServerError,
+)
+from graphql import DocumentNode, ExecutionResult
+
+from d3b_api_client_cli.dewrangle.graphql.operations import get_operation
+from d3b_api_client_cli.utils.rate_limit import get_rate_limiter
+from d3b_api_client_cli.utils.retry import parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+PERSISTED_QUERY_VERSION = 1
+PERSISTED_QUERY_NOT_FOUND = "PERSISTED_QUERY_NOT_FOUND"
+PERSISTED_QUERY_NOT_SUPPORTED = "PERSISTED_QUERY_NOT_SUPPORTED"
+
+# Error codes and messages that servers use for APQ errors
+_PERSISTED_QUERY_ERRORS = {
+    PERSISTED_QUERY_NOT_FOUND: PERSISTED_QUERY_NOT_FOUND,
+    "PersistedQueryNotFound": PERSISTED_QUERY_NOT_FOUND,
+    PERSISTED_QUERY_NOT_SUPPORTED: PERSISTED_QUERY_NOT_SUPPORTED,
+    "PersistedQueryNotSupported": PERSISTED_QUERY_NOT_SUPPORTED,
+}
+
+
+class DewrangleServerError(TransportServerError):
+    """
+    TransportServerError that keeps the Retry-After delay of the response
+
+    Attributes:
+        retry_after - seconds the server asked us to wait before retrying or
+        None if it did not say
+    """
+
+    def __init__(
+        self,
+        msg: str,
+        code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(msg, code)
+        self.retry_after = retry_after
+
+
+def _persisted_query_error(result: ExecutionResult) -> Optional[str]:
+    """
+    Get the APQ error code of a result if there is one
+    """
+    for error in result.errors or []:
+        code = (error.get("extensions") or {}).get("code")
+        for value in [code, error.get("message")]:
+            if value in _PERSISTED_QUERY_ERRORS:
+                return _PERSISTED_QUERY_ERRORS[value]
+
+    return None
+
+
+def _is_client_error(status: Optional[int]) -> bool:
+    """
+    Whether an HTTP status is a 4xx error that is not worth retrying
+    """
+    return bool(status) and (400 <= status < 500) and (status != 429)
+
+
+class DewrangleTransport(AIOHTTPTransport):
+    """
+    AIOHTTPTransport that sends the registered query text and supports
+    Automatic Persisted Queries
+
+    Arguments:
+        persisted_queries - whether to try sending only the query hash
+        json_deserializer - function that parses the raw bytes of a response
+        body, i.e. orjson.loads. Defaults to json.loads
+        See gql.transport.aiohttp.AIOHTTPTransport for the rest
+    """
+
+    def __init__(
+        self,
+        *args,
+        persisted_queries: bool = True,
+        json_deserializer: Optional[Callable[[bytes], Any]] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.persisted_queries = persisted_queries
+        self.json_deserializer = json_deserializer or json.loads
+        # None until the server has either accepted or rejected a hash
+        self.persisted_queries_supported = None
+
+    async def execute(
+        self,
+        document: DocumentNode,
+        variable_values: Optional[Dict[str, Any]] = None,
+        operation_name: Optional[str] = None,
+        extra_args: Optional[Dict[str, Any]] = None,
+        upload_files: bool = False,
+    ) -> ExecutionResult:
+        """
+        Execute a document, sending only its hash if possible
+
+        See gql.transport.aiohttp.AIOHTTPTransport.execute
+        """
+        if upload_files:
+            return await super().execute(
+                document,
+                variable_values=variable_values,
+                operation_name=operation_name,
+                extra_args=extra_args,
+                upload_files=upload_files,
+            )
+
+        operation = get_operation(document)
+        payload = {}
+        if operation_name:
+            payload["operationName"] = operation_name
+        if variable_values:
+            payload["variables"] = variable_values
+
+        if self.persisted_queries and (
+            self.persisted_queries_supported is not False
+        ):
+            payload["extensions"] = {
+                "persistedQuery": {
+                    "version": PERSISTED_QUERY_VERSION,
+                    "sha256Hash": operation.sha256,
+                }
+            }
+            # Transient HTTP errors are raised here and retried like any other
+            # request. Other client errors may mean that the server did not
+            # understand a request without query text
+            try:
+                result = await self._post(payload, extra_args)
+            except DewrangleServerError as e:
+                if not _is_client_error(e.code):
+                    raise
+                result = None
+            error = _persisted_query_error(result) if result else None
+
+            # Errors without data mean nothing was executed. Unless we know
+            # the server supports persisted queries, they most likely mean
+            # that it did not understand a request without query text
+            if result and not error:
+                if (result.data is not None) or (
+                    self.persisted_queries_supported
+                ):
+                    self.persisted_queries_supported = True
+                    return result
+
+            if error == PERSISTED_QUERY_NOT_FOUND:
+                self.persisted_queries_supported = True
+            elif not self.persisted_queries_supported:
+                logger.info(
+                    "ℹ️  Dewrangle does not support persisted queries,"
+                    " sending full query text"
+                )
+                self.persisted_queries_supported = False
+                payload.pop("extensions")
+
+            logger.debug(
+                "Sending full query text of %s (%s)",
+                operation.name,
+                operation.sha256[:8],
+            )
+
+        payload["query"] = operation.query
+
+        return await self._post(payload, extra_args)
+
+    async def _post(
+        self,
+        payload: dict,
+        extra_args: Optional[Dict[str, Any]] = None,
+    ) -> ExecutionResult:
+        """
+        POST a GraphQL payload and parse the result
+
+        Raises:
+            DewrangleServerError if the server answered with an HTTP error
+            instead of a GraphQL result
+        """
+        if self.session is None:
+            raise TransportClosed("Transport is not connected")
+
+        post_args = {"json": payload}
+        if extra_args:
+            post_args.update(extra_args)
+
+        async with self.session.post(
+            self.url, ssl=self.ssl, **post_args
+        ) as resp:
+            self.response_headers = resp.headers
+            if resp.status == 429:
+                get_rate_limiter().pause(
+                    parse_retry_after(resp.headers.get("Retry-After"))
+                )
+            try:
+                result = self.json_deserializer(await resp.read())
+            except Exception:  # pylint: disable=broad-exception-caught
+                result = None
+
+            if not isinstance(result, dict) or not (
+                ("errors" in result) or ("data" in result)
+            ):
+                try:
+                    resp.raise_for_status()
+                except ClientResponseError as e:
+                    raise DewrangleServerError(
+                        str(e),
+                        e.status,
+                        retry_after=parse_retry_after(
+                            resp.headers.get("Retry-After")
+                        ),
+                    ) from e
+                raise TransportProtocolError(
+                    "Server did not return a GraphQL result: "
+                    f"{await resp.text()}"
+                )
+
+            return ExecutionResult(
+                errors=result.get("errors"),
+                data=result.get("data"),
+                extensions=result.get("extensions"),
+            )
@@ -6,15 +6,30 @@ import os
 import logging
 from pprint import pformat, pprint
 from collections import defaultdict
+from typing import Iterator, Optional
 
 import gql
 
 from d3b_api_client_cli.dewrangle.graphql.common import (
     exec_query,
 )
+from d3b_api_client_cli.dewrangle.graphql.pagination import paginate_each
+from d3b_api_client_cli.dewrangle.graphql.projection import project
+from d3b_api_client_cli.dewrangle.graphql.checkpoint import listing_checkpoint
+from d3b_api_client_cli.dewrangle.graphql import cache
+from d3b_api_client_cli.dewrangle.graphql.loader import (
+    Loader,
+    node_loader,
+    remember_node,
+    forget_node,
+)
+from d3b_api_client_cli.dewrangle.graphql.study.queries import (
+    STUDY_KEY_FIELDS,
+)
 from d3b_api_client_cli.dewrangle.graphql.study import (
-    paginate_studies,
+    iter_studies,
     find_study,
+    read_study,
 )
 from d3b_api_client_cli.dewrangle.graphql.volume import (
     queries,
@@ -22,15 +37,20 @@ from d3b_api_client_cli.dewrangle.graphql.volume import (
 )
 from d3b_api_client_cli.dewrangle.graphql.credential import find_credential
 from d3b_api_client_cli.dewrangle.graphql.job import poll_job
+from d3b_api_client_cli.dewrangle.graphql.batch import (
+    read_nodes,
+    DEWRANGLE_MAX_BATCH_SIZE,
+)
 from d3b_api_client_cli.config import config
 from d3b_api_client_cli.utils import (
     write_json,
+    stream_entities,
+    STREAMING_OUTPUT_FORMATS,
 )
 
 logger = logging.getLogger(__name__)
 
 DEWRANGLE_DIR = config["dewrangle"]["output_dir"]
-DEWRANGLE_MAX_PAGE_SIZE = config["dewrangle"]["pagination"]["max_page_size"]
 DELIMITER = "::"
 # Wait 30s between querying Dewrangle
 POLL_LIST_AND_HASH_INTERVAL_SECS = 30
@@ -73,6 +93,27 @@ def upsert_volume(
     else:
         volume = find_volume(bucket, path_prefix, study_id)
 
+    key, params = _upsert_params(variables, study_id, credential_id, volume)
+    if volume:
+        resp = exec_query(mutations.update_volume, variables=params)
+    else:
+        resp = exec_query(mutations.create_volume, variables=params)
+
+    return _upsert_result(resp, key)
+
+
+def _upsert_params(
+    variables: dict,
+    study_id: str,
+    credential_id: str,
+    volume: Optional[dict],
+) -> tuple[str, dict]:
+    """
+    Build the mutation variables for a volume create or update
+
+    Returns:
+        the mutation key (Create or Update) and the mutation variables
+    """
     params = {"input": variables}
 
     if volume:
@@ -80,13 +121,18 @@ def upsert_volume(
 
         params["input"] = {"credentialId": credential_id}
         params.update({"id": volume["id"]})
-        resp = exec_query(mutations.update_volume, variables=params)
     else:
         key = "Create"
         params["input"].update({"studyId": study_id})
         params.pop("id", None)
-        resp = exec_query(mutations.create_volume, variables=params)
 
+    return key, params
+
+
+def _upsert_result(resp: dict, key: str) -> dict:
+    """
+    Log the response of a volume create/update and return the volume
+    """
     errors = resp.get(f"volume{key}", {}).get("errors")
     entity = "volume"
     if errors:
@@ -98,6 +144,7 @@ def upsert_volume(
         result = resp[f"{entity}{key}"][entity]
         result["id"] = result["id"]
         result["study_id"] = result["study"]["id"]
+        _remember_volume(result)
 
     return result
 
@@ -145,6 +192,13 @@ def delete_volume(
         delete_safety_check=delete_safety_check,
     )
 
+    return _delete_result(resp, node_id)
+
+
+def _delete_result(resp: dict, node_id: str) -> dict:
+    """
+    Log the response of a volume delete and return the volume
+    """
     errors = resp.get("volumeDelete", {}).get("errors")
     key = "Delete"
     if errors:
@@ -154,6 +208,7 @@ def delete_volume(
         logger.info("✅ %s volume succeeded:\n%s", key, pformat(resp))
         result = resp["volumeDelete"]["volume"]
         result["id"] = node_id
+        _forget_volume(result)
 
     return result
 
@@ -161,15 +216,24 @@ def delete_volume(
 def read_volume(node_id: str) -> dict:
     """
     Fetch volume by node id
+
+    The volume is memoized for the rest of the run
+    """
+    volume = node_loader(queries.volume).load(node_id)
+
+    return _read_result({"node": volume}, node_id)
+
+
+def _read_result(resp: dict, node_id: str) -> dict:
+    """
+    Log the response of a volume node query and return the volume
     """
-    variables = {"id": node_id}
-    resp = exec_query(queries.volume, variables=variables)
     volume = resp.get("node", {})
 
     if volume:
         logger.info(
             "🔎  Found Dewrangle volume %s:\n%s",
-            volume["globalId"],
+            volume["id"],
             pformat(volume),
         )
     else:
@@ -178,10 +242,26 @@ def read_volume(node_id: str) -> dict:
     return volume
 
 
+def batch_read_volumes(
+    node_ids: list[str], batch_size: int = DEWRANGLE_MAX_BATCH_SIZE
+) -> dict:
+    """
+    Fetch many volumes by node id in ceil(len(node_ids) / batch_size)
+    requests
+
+    Returns:
+        dict of volume dicts keyed by node ID
+    """
+    return read_nodes(queries.volume, node_ids, batch_size=batch_size)
+
+
 def read_volumes(
     study_global_id=None,
     output_dir: str = DEWRANGLE_DIR,
     log_output: bool = True,
+    fields: list[str] = None,
+    resume: bool = False,
+    output_format: str = "json",
 ) -> list[dict]:
     """
     Fetch volumes that the client has access to
@@ -190,21 +270,53 @@ def read_volumes(
         study_global_id - Global ID of volume's study
         output_dir - directory where study metadata will be written
         log_output - whether to log study dicts
+        fields - only fetch these fields of each volume, i.e. id,name
+        resume - checkpoint the listing in output_dir and continue an
+        interrupted listing from its checkpoint instead of starting over
+        output_format - json writes the whole listing at once. ndjson and
+        csv write each entity to the output file as its page arrives
 
     Returns:
-        List of volume dicts
+        List of volume dicts, or the path to the output file if
+        output_format is ndjson or csv
     """
     study_id = None
     if study_global_id:
         study_id = find_study(study_global_id).get("id")
 
-    data = paginate_volumes(study_id=study_id)
+    checkpoint = listing_checkpoint(
+        output_dir,
+        "Volume",
+        key={"study_id": study_id, "fields": fields},
+        resume=resume,
+    )
+    if output_format in STREAMING_OUTPUT_FORMATS:
+        filepath = stream_entities(
+            iter_volumes(
+                study_id=study_id,
+                fields=fields,
+                prefetch=True,
+                checkpoint=checkpoint,
+            ),
+            output_dir,
+            "Volume",
+            output_format,
+        )
+        if checkpoint:
+            checkpoint.clear()
+        return filepath
+
+    data = paginate_volumes(
+        study_id=study_id, fields=fields, checkpoint=checkpoint
+    )
 
     if output_dir:
         os.makedirs(output_dir, exist_ok=True)
         filepath = os.path.join(output_dir, "Volume.json")
         write_json(data, filepath)
         logger.info("✏️  Wrote %s volume to %s", len(data), filepath)
+        if checkpoint:
+            checkpoint.clear()
 
     if log_output:
         logger.info("🔐 Volumes:\n%s", pformat(data))
@@ -223,26 +335,87 @@ def _volume_key(bucket: str, path_prefix: str) -> str:
     return f"{bucket}{DELIMITER}{path_prefix}"
 
 
-def _store_volumes(
-    study_volumes: list[dict], volumes: dict, study: dict
-) -> dict:
+def _volume_node(volume: dict, study: dict) -> dict:
     """
-    Storage page of volumes into volumes dict
+    Add the study to a volume from a page of volumes
+    """
+    volume["study_id"] = study["id"]
+    volume["study_global_id"] = study["globalId"]
+
+    return volume
+
+
+def iter_volumes(
+    studies=None,
+    study_id=None,
+    dewrangle_page_size=None,
+    fields=None,
+    prefetch=False,
+    checkpoint=None,
+) -> Iterator[dict]:
     """
-    for s in study_volumes:
-        volume = s["node"]
-        volume["study_id"] = study["id"]
-        volume["study_global_id"] = study["globalId"]
+    Lazily fetch the volumes in all studies that the viewer has access to
+
+    Optionally filter volumes by study. Pages are fetched as the caller
+    iterates, so stopping early (i.e. once the wanted volume is found)
+    stops the pagination.
+    See d3b_api_client_cli.dewrangle.graphql.pagination
 
-        bucket = volume["name"]
-        path_prefix = volume["pathPrefix"]
-        volumes[_volume_key(bucket, path_prefix)][study["id"]] = volume
+    Set prefetch if the whole listing will be used, so that each next page
+    is requested while the current one is processed
 
-    return volumes
+    Save each page to checkpoint if one is given and skip what it already
+    holds. See d3b_api_client_cli.dewrangle.graphql.checkpoint
+
+    Only fetch the given fields of each volume if fields are provided.
+    See d3b_api_client_cli.dewrangle.graphql.projection
+    """
+    if not studies and study_id:
+        study = read_study(study_id)
+        studies = [study] if study else []
+    elif not studies:
+        studies = iter_studies(fields=STUDY_KEY_FIELDS)
+    else:
+        studies = studies.values()
+
+    query = project(
+        queries.study_volumes,
+        fields,
+        path=queries.VOLUMES_PATH,
+        required=queries.VOLUME_KEY_FIELDS,
+    )
+
+    studies = [
+        study
+        for study in studies
+        if not study_id or (study.get("id") == study_id)
+    ]
+    for study, page in paginate_each(
+        query,
+        queries.VOLUMES_PATH,
+        studies,
+        page_size=dewrangle_page_size,
+        prefetch=prefetch,
+        checkpoint=checkpoint,
+    ):
+        if not page.total_count:
+            continue
+
+        logger.info(
+            "Collecting %s volumes for study %s",
+            f"{page.count}/{page.total_count}",
+            study["name"],
+        )
+        for volume in page.nodes:
+            yield _volume_node(volume, study)
 
 
 def paginate_volumes(
-    studies=None, study_id=None, dewrangle_page_size=DEWRANGLE_MAX_PAGE_SIZE
+    studies=None,
+    study_id=None,
+    dewrangle_page_size=None,
+    fields=None,
+    checkpoint=None,
 ) -> dict:
     """
     Fetch all volumes in all studies that the viewer has access to
@@ -263,46 +436,23 @@ def paginate_volumes(
            "bucket1::/path/to/another": ...,
            "bucket2::": ...
         }
-    """
-    if not studies:
-        studies = paginate_studies()
 
+    Only fetch the given fields of each volume if fields are provided.
+    See d3b_api_client_cli.dewrangle.graphql.projection
+    """
     logger.info("📄 Paginating Dewrangle volumes ...")
 
-    volumes = defaultdict(lambda: defaultdict(dict))
-    for study in studies.values():
-        if study_id and (study.get("id") != study_id):
-            continue
-        variables = {"first": dewrangle_page_size, "id": study["id"]}
-        resp = exec_query(queries.study_volumes, variables=variables)
-
-        count = 0
-        has_next_page = True
-        while has_next_page:
-            study_volumes = resp["node"]["volumes"]["edges"]
-            page_info = resp["node"]["volumes"]["pageInfo"]
-
-            count += len(study_volumes)
-            total = resp["node"]["volumes"]["totalCount"]
-
-            if not total:
-                has_next_page = False
-                continue
-
-            logger.info(
-                "Collecting %s volumes for study %s",
-                count / total,
-                study["name"],
-            )
-            # Add volumes in output
-            volumes = _store_volumes(study_volumes, volumes, study)
-
-            # Fetch next page if there is one
-            has_next_page = page_info["hasNextPage"]
-            end_cursor = page_info["endCursor"]
-            if has_next_page and end_cursor:
-                variables.update({"after": end_cursor})
-                resp = exec_query(queries.study_volumes, variables=variables)
+    volumes = defaultdict(dict)
+    for volume in iter_volumes(
+        studies=studies,
+        study_id=study_id,
+        dewrangle_page_size=dewrangle_page_size,
+        fields=fields,
+        prefetch=True,
+        checkpoint=checkpoint,
+    ):
+        key = _volume_key(volume["name"], volume["pathPrefix"])
+        volumes[key][volume["study_id"]] = volume
 
     return dict(volumes)
 
@@ -310,9 +460,96 @@ def paginate_volumes(
 def find_volume(bucket: str, path_prefix: str, study_id: str) -> dict:
     """
     Find volume using S3 bucket name, path prefix, and study id.
+
+    Volumes are looked up in the entity cache first, see
+    d3b_api_client_cli.dewrangle.graphql.cache. Otherwise the volumes of the
+    study are fetched once and indexed by bucket and path prefix for the
+    rest of the run, so finding other volumes in the study costs nothing
+
+    Nothing is found without a study, since volumes are only unique within
+    their study
+
+    Returns:
+        The volume with every field of a page of volumes and its study IDs,
+        or an empty dict if it was not found
+    """
+    if not study_id:
+        return {}
+
+    key = _volume_key(bucket, path_prefix)
+    volume = cache.get_entity("volume", cache.entity_key(study_id, key))
+    if volume:
+        return volume
+
+    return study_volume_index.load(study_id).get(key, {})
+
+
+def _load_study_volumes(study_ids: list[str]) -> dict:
+    """
+    Batch load function of study_volume_index
+
+    Fetch all volumes of each study and index them by volume key
     """
-    volumes = paginate_volumes(study_id=study_id)
-    return volumes.get(_volume_key(bucket, path_prefix), {}).get(study_id, {})
+    index = {}
+    for study_id in study_ids:
+        if not study_id:
+            # iter_volumes would list the volumes of every study
+            index[study_id] = {}
+            continue
+        index[study_id] = {
+            _volume_key(v["name"], v["pathPrefix"]): v
+            for v in iter_volumes(study_id=study_id, prefetch=True)
+        }
+        cache.put_entities(
+            "volume",
+            {
+                cache.entity_key(study_id, key): volume
+                for key, volume in index[study_id].items()
+            },
+        )
+
+    return index
+
+
+# Volumes of a study keyed by volume key, keyed by study ID
+study_volume_index = Loader(_load_study_volumes, name="study_volume_index")
+
+
+def _remember_volume(volume: dict):
+    """
+    Write a created or updated volume through to the loaders of the run, the
+    index of its study and the entity cache
+    """
+    if not volume.get("id"):
+        return
+
+    remember_node(queries.volume, volume)
+    key = _volume_key(volume["name"], volume["pathPrefix"])
+    study_volume_index.update(
+        volume["study_id"], lambda index: {**index, key: volume}
+    )
+    cache.put_entity(
+        "volume", cache.entity_key(volume["study_id"], key), volume
+    )
+
+
+def _forget_volume(volume: dict):
+    """
+    Evict a deleted volume from the loaders of the run, the index of its
+    study and the entity cache
+    """
+    forget_node(volume["id"])
+    study = volume.get("study") or {}
+    if study.get("id"):
+        study_volume_index.update(
+            study["id"],
+            lambda index: {
+                k: v for k, v in index.items() if v["id"] != volume["id"]
+            },
+        )
+    else:
+        study_volume_index.clear()
+    cache.delete_entity("volume", volume["id"])
 
 
 def list_and_hash(
@@ -372,6 +609,14 @@ def list_and_hash(
     }
     resp = exec_query(mutations.list_and_hash, variables=variables)
 
+    return _list_and_hash_result(resp)
+
+
+def _list_and_hash_result(resp: dict) -> dict:
+    """
+    Log the response of a volume list and hash and return the job
+    """
+    key = "ListAndHash"
     errors = resp.get(f"volume{key}", {}).get("errors")
     if errors:
         result = errors
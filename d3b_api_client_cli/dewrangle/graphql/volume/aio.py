@@ -0,0 +1,316 @@
+"""
+Asyncio versions of the GraphQL methods to crud Volumes in Dewrangle
+"""
+
+import logging
+from collections import defaultdict
+from typing import AsyncIterator
+
+from d3b_api_client_cli.dewrangle.graphql.batch import (
+    async_read_nodes,
+    DEWRANGLE_MAX_BATCH_SIZE,
+)
+from d3b_api_client_cli.dewrangle.graphql.common import (
+    async_exec_query,
+)
+from d3b_api_client_cli.dewrangle.graphql.pagination import (
+    async_paginate_each,
+)
+from d3b_api_client_cli.dewrangle.graphql.projection import project
+from d3b_api_client_cli.dewrangle.graphql import cache
+from d3b_api_client_cli.dewrangle.graphql.loader import node_loader
+from d3b_api_client_cli.dewrangle.graphql.study.queries import (
+    STUDY_KEY_FIELDS,
+)
+from d3b_api_client_cli.dewrangle.graphql.study.aio import (
+    paginate_studies,
+    find_study,
+    read_study,
+)
+from d3b_api_client_cli.dewrangle.graphql.volume import (
+    queries,
+    mutations,
+    POLL_LIST_AND_HASH_INTERVAL_SECS,
+    _upsert_params,
+    _upsert_result,
+    _delete_result,
+    _read_result,
+    _list_and_hash_result,
+    _volume_key,
+    _volume_node,
+    study_volume_index,
+)
+from d3b_api_client_cli.dewrangle.graphql.credential.aio import (
+    find_credential,
+)
+from d3b_api_client_cli.dewrangle.graphql.job.aio import poll_job
+
+logger = logging.getLogger(__name__)
+
+
+async def upsert_volume(
+    variables: dict, study_id=None, study_global_id=None, credential_key=None
+) -> dict:
+    """
+    Upsert volume in Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.volume.upsert_volume
+    """
+    if not (study_id or study_global_id):
+        raise ValueError(
+            "❌ Either the graphql node ID or global ID of the volume's"
+            " study must be provided to either create or update the volume"
+        )
+
+    # If no study id provided, try querying for it via global ID
+    if not study_id:
+        study_id = (await find_study(study_global_id)).get("id")
+
+    # If not credential provided, try querying for it
+    credential_id = variables.get("credentialId")
+    if not credential_id:
+        credential_id = (await find_credential(credential_key, study_id))["id"]
+        variables["credentialId"] = credential_id
+
+    # Try finding existing volume
+    bucket = variables.get("name")
+    path_prefix = variables.get("pathPrefix")
+    if not (bucket and path_prefix):
+        volume = None
+    else:
+        volume = await find_volume(bucket, path_prefix, study_id)
+
+    key, params = _upsert_params(variables, study_id, credential_id, volume)
+    if volume:
+        resp = await async_exec_query(mutations.update_volume, variables=params)
+    else:
+        resp = await async_exec_query(mutations.create_volume, variables=params)
+
+    return _upsert_result(resp, key)
+
+
+async def delete_volume(
+    node_id: str = None,
+    bucket: str = None,
+    path_prefix: str = None,
+    study_global_id: str = None,
+    delete_safety_check: bool = True,
+) -> dict:
+    """
+    Delete volume in Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.volume.delete_volume
+    """
+    if not (node_id or (bucket and study_global_id)):
+        raise ValueError(
+            "❌ You must provide either the volume graphql ID or"
+            " volume key and study global ID to look up the volume"
+        )
+    if bucket:
+        study_id = (await find_study(study_global_id)).get("id")
+        volume = await find_volume(bucket, path_prefix, study_id)
+        node_id = volume.get("id")
+        if not node_id:
+            logger.warning(
+                "⚠️  Could not find associated dewrangle ID."
+                " Delete volume %s ABORTED",
+                node_id,
+            )
+            return
+
+    resp = await async_exec_query(
+        mutations.delete_volume,
+        variables={"id": node_id},
+        delete_safety_check=delete_safety_check,
+    )
+
+    return _delete_result(resp, node_id)
+
+
+async def read_volume(node_id: str) -> dict:
+    """
+    Fetch volume by node id
+
+    The volume is memoized for the rest of the run and concurrent reads are
+    merged into batched node queries
+    """
+    volume = await node_loader(queries.volume).load_async(node_id)
+
+    return _read_result({"node": volume}, node_id)
+
+
+async def batch_read_volumes(
+    node_ids: list[str], batch_size: int = DEWRANGLE_MAX_BATCH_SIZE
+) -> dict:
+    """
+    Fetch many volumes by node id in ceil(len(node_ids) / batch_size)
+    requests
+
+    Returns:
+        dict of volume dicts keyed by node ID
+    """
+    return await async_read_nodes(
+        queries.volume, node_ids, batch_size=batch_size
+    )
+
+
+async def iter_volumes(
+    studies=None,
+    study_id=None,
+    dewrangle_page_size=None,
+    fields=None,
+    prefetch=False,
+) -> AsyncIterator[dict]:
+    """
+    Lazily fetch the volumes in all studies that the viewer has access to
+
+    See d3b_api_client_cli.dewrangle.graphql.volume.iter_volumes
+    """
+    if not studies and study_id:
+        study = await read_study(study_id)
+        studies = {study_id: study} if study else {}
+    elif not studies:
+        studies = await paginate_studies(fields=STUDY_KEY_FIELDS)
+
+    query = project(
+        queries.study_volumes,
+        fields,
+        path=queries.VOLUMES_PATH,
+        required=queries.VOLUME_KEY_FIELDS,
+    )
+
+    studies = [
+        study
+        for study in studies.values()
+        if not study_id or (study.get("id") == study_id)
+    ]
+    async for study, page in async_paginate_each(
+        query,
+        queries.VOLUMES_PATH,
+        studies,
+        page_size=dewrangle_page_size,
+        prefetch=prefetch,
+    ):
+        for volume in page.nodes:
+            yield _volume_node(volume, study)
+
+
+async def paginate_volumes(
+    studies=None,
+    study_id=None,
+    dewrangle_page_size=None,
+    fields=None,
+) -> dict:
+    """
+    Fetch all volumes in all studies that the viewer has access to
+
+    See d3b_api_client_cli.dewrangle.graphql.volume.paginate_volumes
+    """
+    logger.info("📄 Paginating Dewrangle volumes ...")
+
+    volumes = defaultdict(dict)
+    async for volume in iter_volumes(
+        studies=studies,
+        study_id=study_id,
+        dewrangle_page_size=dewrangle_page_size,
+        fields=fields,
+        prefetch=True,
+    ):
+        key = _volume_key(volume["name"], volume["pathPrefix"])
+        volumes[key][volume["study_id"]] = volume
+
+    return dict(volumes)
+
+
+async def find_volume(bucket: str, path_prefix: str, study_id: str) -> dict:
+    """
+    Find volume using S3 bucket name, path prefix, and study id.
+
+    See d3b_api_client_cli.dewrangle.graphql.volume.find_volume
+    """
+    if not study_id:
+        return {}
+
+    key = _volume_key(bucket, path_prefix)
+    volume = cache.get_entity("volume", cache.entity_key(study_id, key))
+    if volume:
+        return volume
+
+    return (await study_volume_index.load_async(study_id)).get(key, {})
+
+
+async def list_and_hash(
+    billing_group_id: str,
+    volume_id: str = None,
+    bucket: str = None,
+    path_prefix: str = None,
+    study_global_id: str = None,
+) -> dict:
+    """
+    Trigger a list and hash volume job in Dewrangle
+
+    See d3b_api_client_cli.dewrangle.graphql.volume.list_and_hash
+    """
+    key = "ListAndHash"
+
+    if not billing_group_id:
+        raise ValueError(
+            "❌ Billing group ID is missing and required to hash a volume!"
+        )
+
+    if not (volume_id or (bucket and study_global_id)):
+        raise ValueError(
+            "❌ You must provide either the volume graphql ID or"
+            " volume name and study global ID to look up the volume"
+        )
+    # Try querying for volume
+    if not volume_id:
+        study_id = (await find_study(study_global_id)).get("id")
+        if not study_id:
+            raise ValueError(
+                "❌ Could not find associated dewrangle ID for "
+                f" study with ID {study_global_id}."
+            )
+
+        volume_id = (await find_volume(bucket, path_prefix, study_id)).get("id")
+
+    if not volume_id:
+        raise ValueError(
+            "❌ Could not find associated dewrangle ID for "
+            f" {key} volume with ID {volume_id}."
+        )
+
+    variables = {
+        "input": {
+            "billingGroupId": billing_group_id,
+        },
+        "id": volume_id,
+    }
+    resp = await async_exec_query(mutations.list_and_hash, variables=variables)
+
+    return _list_and_hash_result(resp)
+
+
+async def hash_and_wait(
+    billing_group_id: str,
+    volume_id: str,
+    bucket: str = None,
+    path_prefix: str = None,
+    study_global_id: str = None,
+):
+    """
+    Trigger a list and hash volume job and poll for job status until the
+    job is complete or fails
+
+    See d3b_api_client_cli.dewrangle.graphql.volume.hash_and_wait
+    """
+    job = await list_and_hash(
+        volume_id=volume_id,
+        billing_group_id=billing_group_id,
+        bucket=bucket,
+        path_prefix=path_prefix,
+        study_global_id=study_global_id,
+    )
+    return await poll_job(
+        job["id"], interval_seconds=POLL_LIST_AND_HASH_INTERVAL_SECS
+    )
@@ -85,6 +85,10 @@ delete_volume = gql(
           region
           type
           pathPrefix
+          study {
+            id
+            globalId
+          }
         }
       }
     }
@@ -4,6 +4,7 @@ Dewrangle GraphQL query definitions
 
 from gql import gql
 
+
 volume = gql(
     """
     query volumeQuery($id: ID!) {
@@ -71,3 +72,8 @@ study_volumes = gql(
     }
   """
 )
+
+# Path from the root of study_volumes to each volume and the fields that are
+# always needed to store a page of volumes
+VOLUMES_PATH = "node.volumes.edges.node"
+VOLUME_KEY_FIELDS = ["id", "name", "pathPrefix"]
@@ -4,3 +4,5 @@ Top-level utilities module
 
 from d3b_api_client_cli.utils.misc import *
 from d3b_api_client_cli.utils.io import *
+from d3b_api_client_cli.utils.retry import *
+from d3b_api_client_cli.utils.rate_limit import *
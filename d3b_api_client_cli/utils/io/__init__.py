@@ -9,11 +9,15 @@ It is intended to be used as part of the data transfer pipeline for managing
 manifest files and other related resources.
 """
 
+import csv
+import dataclasses
+import importlib
+import importlib.util
 import logging
 import os
 from os import path, scandir
 from pprint import pformat
-from typing import Callable
+from typing import Any, Callable, Iterable, Optional
 from urllib.parse import urlparse
 
 import json
@@ -21,12 +25,24 @@ import pandas as pd
 import requests
 
 from d3b_api_client_cli.config import config
+from d3b_api_client_cli.utils.rate_limit import get_rate_limiter
+from d3b_api_client_cli.utils.retry import (
+    IDEMPOTENT_HTTP_METHODS,
+    call_with_retry,
+    default_retry_policy,
+    parse_retry_after,
+)
 
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_TABLE_BATCH_SIZE = 1000
 TIMEOUT_INFINITY = -1
+JSON_DESERIALIZERS = {"orjson", "json"}
+# Output formats of read_* listings. json builds the whole listing in memory,
+# the others are written one entity at a time
+OUTPUT_FORMATS = ["json", "ndjson", "csv"]
+STREAMING_OUTPUT_FORMATS = ["ndjson", "csv"]
 
 
 def get_file_extension(file_path: str) -> str:
@@ -65,6 +81,97 @@ def write_json(data: dict, filepath: str, **kwargs):
         json.dump(data, json_file, **kwargs)
 
 
+def flatten_dict(data: dict, prefix: str = "") -> dict:
+    """
+    Flatten nested dicts into one dict with dotted keys, i.e.
+    {"study": {"id": "1"}} -> {"study.id": "1"}. Lists are JSON encoded
+    """
+    flat = {}
+    for key, value in data.items():
+        key = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_dict(value, prefix=f"{key}."))
+        elif isinstance(value, list):
+            flat[key] = json.dumps(value)
+        else:
+            flat[key] = value
+
+    return flat
+
+
+def write_entities(
+    entities: Iterable[dict], filepath: str, output_format: str
+) -> int:
+    """
+    Write entities to an NDJSON or CSV file as they are iterated, so that
+    only one entity is in memory at a time
+
+    CSV columns are the flattened keys of the first entity. See flatten_dict
+
+    Returns:
+        Number of entities written
+    """
+    if output_format not in STREAMING_OUTPUT_FORMATS:
+        raise ValueError(
+            f"❌ Unknown streaming output format {output_format}. Must be one"
+            f" of {STREAMING_OUTPUT_FORMATS}"
+        )
+
+    count = 0
+    with open(filepath, "w", newline="") as out_file:
+        writer = None
+        dropped = set()
+        for entity in entities:
+            if output_format == "ndjson":
+                out_file.write(json.dumps(entity) + "\n")
+            else:
+                row = flatten_dict(entity)
+                if not writer:
+                    writer = csv.DictWriter(
+                        out_file, fieldnames=list(row), extrasaction="ignore"
+                    )
+                    writer.writeheader()
+                extra = set(row) - set(writer.fieldnames) - dropped
+                if extra:
+                    logger.warning(
+                        "⚠️  Dropping columns %s that are not in the CSV"
+                        " header of %s",
+                        sorted(extra),
+                        filepath,
+                    )
+                    dropped.update(extra)
+                writer.writerow(row)
+            count += 1
+
+    return count
+
+
+def stream_entities(
+    entities: Iterable[dict],
+    output_dir: str,
+    name: str,
+    output_format: str,
+) -> str:
+    """
+    Write the entities of a read_* listing to <output_dir>/<name>.<format>
+    as they arrive
+
+    Returns:
+        Path to the output file
+    """
+    if not output_dir:
+        raise ValueError(
+            f"❌ An output_dir is required to write {output_format} output"
+        )
+
+    os.makedirs(output_dir, exist_ok=True)
+    filepath = os.path.join(output_dir, f"{name}.{output_format}")
+    count = write_entities(entities, filepath, output_format)
+    logger.info("✏️  Wrote %s %s to %s", count, name.lower(), filepath)
+
+    return filepath
+
+
 def chunked_dataframe_reader(
     filepath, batch_size=DEFAULT_TABLE_BATCH_SIZE, **read_csv_kwargs
 ):
@@ -90,22 +197,124 @@ def chunked_dataframe_reader(
         yield chunk
 
 
+def _module_available(name: str) -> bool:
+    return importlib.util.find_spec(name) is not None
+
+
+def accept_encoding() -> str:
+    """
+    Value of the Accept-Encoding header sent to the Dewrangle GraphQL API
+
+    Ask for gzip or deflate compressed responses, and brotli if a brotli
+    decoder is installed (aiohttp uses brotli or brotlicffi). If
+    config["dewrangle"]["client"]["compression"] is off, ask for
+    uncompressed responses
+
+    REST requests are left to requests, which already asks for and decodes
+    gzip and deflate compressed responses
+    """
+    if not config["dewrangle"]["client"]["compression"]:
+        return "identity"
+
+    encodings = ["gzip", "deflate"]
+    if _module_available("brotli") or _module_available("brotlicffi"):
+        encodings.append("br")
+
+    return ", ".join(encodings)
+
+
+def get_json_deserializer(name: Optional[str] = None) -> Callable[[Any], Any]:
+    """
+    Get the function used to parse JSON response bodies
+
+    Arguments:
+        name - auto, orjson or json. Defaults to
+        config["dewrangle"]["client"]["json_deserializer"]. auto uses orjson
+        if it is installed and json otherwise
+
+    Returns:
+        Function that parses a str or bytes JSON document
+
+    Raises:
+        ValueError if the deserializer is unknown or not installed
+    """
+    name = name or config["dewrangle"]["client"]["json_deserializer"]
+    if name == "auto":
+        name = "orjson" if _module_available("orjson") else "json"
+
+    if name not in JSON_DESERIALIZERS:
+        raise ValueError(
+            f"❌ Unknown JSON deserializer {name}. Must be one of: auto, "
+            f"{', '.join(sorted(JSON_DESERIALIZERS))}"
+        )
+
+    try:
+        return importlib.import_module(name).loads
+    except ImportError as e:
+        raise ValueError(
+            f"❌ JSON deserializer {name} is not installed. Install it with"
+            " pip install d3b_api_client_cli[fast]"
+        ) from e
+
+
+def _classify_request_error(
+    status_codes: tuple,
+) -> Callable[[BaseException], tuple[bool, Optional[float]]]:
+    """
+    Build a function that decides whether a requests exception is transient
+
+    Connection errors, timeouts and responses with one of the status codes
+    are transient
+    """
+
+    def classify(e: BaseException) -> tuple[bool, Optional[float]]:
+        if isinstance(e, requests.exceptions.HTTPError):
+            resp = e.response
+            if (resp is not None) and (resp.status_code in status_codes):
+                return True, parse_retry_after(resp.headers.get("Retry-After"))
+            return False, None
+
+        return (
+            isinstance(
+                e,
+                (
+                    requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout,
+                ),
+            ),
+            None,
+        )
+
+    return classify
+
+
 def send_request(
     method: str,
     *args: any,
     ignore_status_codes: list[str] = None,
     timeout=TIMEOUT_INFINITY,
+    retry_safe: Optional[bool] = None,
     **kwargs: any,
 ) -> requests.Response:
     """
     Send http request. Ignore any status codes that the user provides. Any
     other status codes >300 will result in an HTTPError
 
+    Requests are rate limited by the token bucket shared by the process.
+    See d3b_api_client_cli.utils.rate_limit
+
+    Requests that fail with a transient error (connection error, timeout or
+    a status code in config["dewrangle"]["client"]["retry"]["status_codes"])
+    are retried with exponential backoff. See d3b_api_client_cli.utils.retry
+
     Arguments:
         method: name of HTTP request method (i.e. get, post, put)
         *args: positional arguments passed to request method
         ignore_status_codes: list of HTTP status codes to ignore in the
         response
+        retry_safe: whether the request may be sent more than once. Defaults
+        to True for safe methods (get, head, options) and False for the rest
+        (i.e. post, put, delete)
         **kwargs:
 
     Returns:
@@ -131,32 +340,51 @@ def send_request(
         "⌚️ Applying timeout: %s (connect, read)" " seconds to request", timeout
     )
 
+    if retry_safe is None:
+        retry_safe = method.lower() in IDEMPOTENT_HTTP_METHODS
+
     # Get http method
     requests_op = getattr(requests, method.lower())
-    status_code = 0
-    try:
+
+    def _send():
+        rate_limiter = get_rate_limiter()
+        rate_limiter.acquire()
         resp = requests_op(*args, **kwargs)
-        status_code = resp.status_code
-        resp.raise_for_status()
-    except requests.exceptions.HTTPError as e:
+        if resp.status_code == 429:
+            rate_limiter.pause(
+                parse_retry_after(resp.headers.get("Retry-After"))
+            )
         # User said to ignore this status code so pass
-        if ignore_status_codes and (status_code in ignore_status_codes):
-            pass
+        if not (
+            ignore_status_codes and (resp.status_code in ignore_status_codes)
+        ):
+            resp.raise_for_status()
+        return resp
 
-        # Error that we need to log and raise
-        else:
-            body = "No request body found"
-            try:
-                body = pformat(resp.json())
-            except json.JSONDecodeError:
-                body = resp.text
-
-            raise requests.exceptions.HTTPError(
-                f"❌ Problem sending {method} request to server\n"
-                f"{str(e)}\n"
-                f"args: {args}\n"
-                f"kwargs: {pformat(kwargs)}\n"
-                f"{body}\n"
-            ) from e
+    policy = default_retry_policy()
+    if not retry_safe:
+        policy = dataclasses.replace(policy, max_attempts=1)
+
+    try:
+        resp = call_with_retry(
+            _send, "rest", _classify_request_error(policy.status_codes), policy
+        )
+
+    # Error that we need to log and raise
+    except requests.exceptions.HTTPError as e:
+        resp = e.response
+        body = "No request body found"
+        try:
+            body = pformat(resp.json())
+        except json.JSONDecodeError:
+            body = resp.text
+
+        raise requests.exceptions.HTTPError(
+            f"❌ Problem sending {method} request to server\n"
+            f"{str(e)}\n"
+            f"args: {args}\n"
+            f"kwargs: {pformat(kwargs)}\n"
+            f"{body}\n"
+        ) from e
 
     return resp
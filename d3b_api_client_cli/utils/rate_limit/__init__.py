@@ -0,0 +1,134 @@
+"""
+Client-side rate limiting of Dewrangle GraphQL and REST requests
+
+Every request in the process takes a token from one shared token bucket
+before it is sent, whether it comes from a thread or an async task. Tokens
+refill at a steady rate and the bucket holds up to a burst of tokens, so
+short bursts go out at once while sustained traffic stays under the rate.
+
+When the server throttles us anyway (429 Too Many Requests), the bucket is
+paused for the Retry-After delay so that all callers back off together
+instead of each one finding out on its own.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+
+from d3b_api_client_cli.config import config
+
+logger = logging.getLogger(__name__)
+
+# Seconds to pause for a 429 response without a Retry-After header
+DEFAULT_THROTTLE_PAUSE = 1
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket usable from threads and event loops
+
+    Callers reserve a token and then wait until it is available, so waiting
+    callers are served in the order they arrived
+
+    Arguments:
+        rate - tokens added per second. None means unlimited
+        burst - max number of tokens in the bucket. Defaults to rate
+    """
+
+    def __init__(self, rate: Optional[float], burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate or 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """
+        Take a token from the bucket
+
+        Returns:
+            Seconds to wait before the token may be used
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if not self.rate:
+                return wait
+
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated) * self.rate,
+            )
+            self._updated = now
+            # Tokens go negative when callers are waiting for future tokens
+            self._tokens -= 1
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self.rate)
+
+            return wait
+
+    def acquire(self):
+        """
+        Block the current thread until a token is available
+        """
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """
+        Wait without blocking the event loop until a token is available
+        """
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: Optional[float] = None):
+        """
+        Stop handing out tokens for some time, i.e. after the server
+        throttled us
+
+        Arguments:
+            seconds - how long to pause. Defaults to DEFAULT_THROTTLE_PAUSE
+        """
+        if seconds is None:
+            seconds = DEFAULT_THROTTLE_PAUSE
+
+        logger.warning("⚠️  Dewrangle is throttling, pausing %.1fs", seconds)
+        with self._lock:
+            self._paused_until = max(
+                self._paused_until, time.monotonic() + seconds
+            )
+            self._tokens = min(self._tokens, 0)
+            self._updated = time.monotonic()
+
+
+def get_rate_limiter() -> TokenBucket:
+    """
+    Get the token bucket shared by every request in the process, creating
+    it from config["dewrangle"]["client"]["rate_limit"] if needed
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if not _rate_limiter:
+            rate_limit = config["dewrangle"]["client"]["rate_limit"]
+            _rate_limiter = TokenBucket(
+                rate_limit["requests_per_second"], burst=rate_limit["burst"]
+            )
+
+    return _rate_limiter
+
+
+def reset_rate_limiter():
+    """
+    Discard the shared token bucket so it is rebuilt from config on next use
+    """
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = None
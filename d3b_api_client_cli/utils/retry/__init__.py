@@ -0,0 +1,294 @@
+"""
+Retry policy shared by the Dewrangle GraphQL and REST clients
+
+Failed requests are retried with exponential backoff and full jitter. If the
+server sends a Retry-After header, we wait at least that long before trying
+again. Callers decide which failures are transient and which requests are
+safe to send more than once (idempotent reads and mutations explicitly
+marked retry-safe).
+
+Retries are counted per transport for the whole run and logged at the end
+of each dewrangle command. See retry_counters and log_retry_counters
+"""
+
+import asyncio
+import datetime
+import logging
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+
+from d3b_api_client_cli.config import config
+
+logger = logging.getLogger(__name__)
+
+# HTTP methods that are retried unless the caller says otherwise. PUT and
+# DELETE are only retried if the caller passes retry_safe=True
+IDEMPOTENT_HTTP_METHODS = {"get", "head", "options"}
+
+# Takes an exception and returns (is transient, seconds from Retry-After)
+Classifier = Callable[[BaseException], tuple[bool, Optional[float]]]
+
+_retry_counters = Counter()
+_retry_counters_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    How many times and how long to wait before retrying a failed request
+
+    Attributes:
+        max_attempts - total number of attempts including the first one
+        backoff_base - upper bound of the wait before the first retry. The
+        bound doubles on every retry
+        backoff_max - longest wait between two attempts
+        max_retry_after - give up if the server asks us to wait longer
+        status_codes - HTTP status codes that are considered transient
+    """
+
+    max_attempts: int = 5
+    backoff_base: float = 0.5
+    backoff_max: float = 30
+    max_retry_after: float = 120
+    status_codes: tuple = (429, 502, 503, 504)
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None):
+        """
+        Seconds to wait before the next attempt
+
+        Arguments:
+            attempt - number of the attempt that just failed, starting at 1
+            retry_after - seconds the server asked us to wait
+        """
+        bound = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        delay = random.uniform(0, bound)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        return delay
+
+
+def default_retry_policy() -> RetryPolicy:
+    """
+    Build the retry policy from config["dewrangle"]["client"]["retry"]
+    """
+    retry_config = config["dewrangle"]["client"]["retry"]
+
+    return RetryPolicy(
+        max_attempts=retry_config["max_attempts"],
+        backoff_base=retry_config["backoff_base"],
+        backoff_max=retry_config["backoff_max"],
+        max_retry_after=retry_config["max_retry_after"],
+        status_codes=tuple(retry_config["status_codes"]),
+    )
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse the value of a Retry-After header into seconds
+
+    The value is either a number of seconds or an HTTP date
+
+    Returns:
+        Seconds to wait or None if the value is missing or invalid
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    return max(0.0, (retry_at - now).total_seconds())
+
+
+def _count(transport: str, event: str, n: int = 1):
+    with _retry_counters_lock:
+        _retry_counters[(transport, event)] += n
+
+
+def retry_counters() -> dict:
+    """
+    Get the retry counters of the current run
+
+    Returns:
+        dict keyed by transport (i.e. graphql, rest) of dicts with the
+        number of retries, requests that succeeded after being retried
+        (recovered) and requests that failed after being retried (exhausted)
+    """
+    counters = {}
+    with _retry_counters_lock:
+        for (transport, event), n in _retry_counters.items():
+            counters.setdefault(
+                transport, {"retries": 0, "recovered": 0, "exhausted": 0}
+            )[event] = n
+
+    return counters
+
+
+def log_retry_counters():
+    """
+    Log the retry counters of the current run, if anything was retried
+    """
+    for transport, counters in sorted(retry_counters().items()):
+        logger.info(
+            "🔁 %s retries: %s, recovered: %s, exhausted: %s",
+            transport,
+            counters["retries"],
+            counters["recovered"],
+            counters["exhausted"],
+        )
+
+
+def reset_retry_counters():
+    """
+    Set all retry counters back to 0 and start a new run
+    """
+    with _retry_counters_lock:
+        _retry_counters.clear()
+
+
+def _next_delay(
+    e: BaseException,
+    attempt: int,
+    transport: str,
+    classify: Classifier,
+    policy: RetryPolicy,
+) -> Optional[float]:
+    """
+    Decide whether to retry after a failed attempt
+
+    Returns:
+        Seconds to wait before retrying or None to give up
+    """
+    transient, retry_after = classify(e)
+    if not transient:
+        if attempt > 1:
+            _count(transport, "exhausted")
+        return None
+
+    if attempt >= policy.max_attempts:
+        # Not retried at all
+        if attempt == 1:
+            return None
+        logger.error(
+            "❌ %s request failed after %s attempts: %s",
+            transport,
+            attempt,
+            e,
+        )
+        _count(transport, "exhausted")
+        return None
+
+    if (retry_after is not None) and (retry_after > policy.max_retry_after):
+        logger.error(
+            "❌ %s request failed and the server asked to retry in %ss,"
+            " longer than the max of %ss: %s",
+            transport,
+            retry_after,
+            policy.max_retry_after,
+            e,
+        )
+        _count(transport, "exhausted")
+        return None
+
+    delay = policy.delay(attempt, retry_after=retry_after)
+    logger.warning(
+        "⚠️  %s request failed (%s). Retrying in %.1fs (attempt %s of %s)",
+        transport,
+        e,
+        delay,
+        attempt + 1,
+        policy.max_attempts,
+    )
+    _count(transport, "retries")
+
+    return delay
+
+
+def call_with_retry(
+    fn: Callable[[], Any],
+    transport: str,
+    classify: Classifier,
+    policy: Optional[RetryPolicy] = None,
+) -> Any:
+    """
+    Call a function and retry it if it fails with a transient error
+
+    Arguments:
+        fn - function that sends the request. It must be safe to call more
+        than once
+        transport - name of the transport, used in logs and counters
+        classify - function that decides whether an exception is transient
+        and extracts the Retry-After delay from it
+        policy - retry policy. Defaults to default_retry_policy()
+
+    Returns:
+        The return value of fn
+
+    Raises:
+        The exception raised by the last attempt
+    """
+    policy = policy or default_retry_policy()
+    attempt = 1
+    while True:
+        try:
+            result = fn()
+        except Exception as e:
+            delay = _next_delay(e, attempt, transport, classify, policy)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        if attempt > 1:
+            _count(transport, "recovered")
+
+        return result
+
+
+async def async_call_with_retry(
+    fn: Callable[[], Awaitable[Any]],
+    transport: str,
+    classify: Classifier,
+    policy: Optional[RetryPolicy] = None,
+) -> Any:
+    """
+    Await a coroutine function and retry it if it fails with a transient
+    error
+
+    See call_with_retry
+    """
+    policy = policy or default_retry_policy()
+    attempt = 1
+    while True:
+        try:
+            result = await fn()
+        except Exception as e:
+            delay = _next_delay(e, attempt, transport, classify, policy)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+
+        if attempt > 1:
+            _count(transport, "recovered")
+
+        return result
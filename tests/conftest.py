@@ -15,6 +15,8 @@ from d3b_api_client_cli.dewrangle.graphql import (
     study,
     credential,
 )
+from d3b_api_client_cli.dewrangle.graphql.loader import reset_loaders
+from d3b_api_client_cli.dewrangle.graphql.cache import close_cache
 from d3b_api_client_cli.config import config
 
 AWS_ACCESS_KEY_ID = config["aws"]["s3"]["aws_access_key_id"]
@@ -25,6 +27,29 @@ POSTGRES_DB_IMAGE = "postgres:16-alpine"
 ORG_NAME = "Integration Tests d3b-api-client-cli"
 
 
+@pytest.fixture(autouse=True)
+def reset_dewrangle_loaders():
+    """
+    Start every test with nothing memoized by the Dewrangle loaders
+    """
+    reset_loaders()
+    yield
+    reset_loaders()
+
+
+@pytest.fixture(autouse=True)
+def dewrangle_cache(mocker, tmp_path):
+    """
+    Give every test its own empty Dewrangle entity cache
+    """
+    mocker.patch.dict(
+        config["dewrangle"]["cache"],
+        {"path": os.path.join(tmp_path, "entities.sqlite3")},
+    )
+    yield config["dewrangle"]["cache"]["path"]
+    close_cache()
+
+
 @pytest.fixture(scope="session")
 def organization_file(tmp_path_factory):
     """
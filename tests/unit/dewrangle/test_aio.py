@@ -0,0 +1,85 @@
+"""
+Test the asyncio Dewrangle GraphQL API
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from d3b_api_client_cli.dewrangle.graphql import aio, common
+from d3b_api_client_cli.dewrangle.graphql.volume import queries
+
+
+@pytest.fixture
+def mock_session(mocker):
+    """
+    Replace the process-wide GraphQL session's connection with a fake
+    that records how many requests are in flight at once
+    """
+    stats = {"in_flight": 0, "max_in_flight": 0, "calls": 0}
+
+    async def execute(gql_query, variable_values=None):
+        stats["calls"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        await asyncio.sleep(0.01)
+        stats["in_flight"] -= 1
+        node_id = variable_values["id"]
+        return {
+            "node": {"id": node_id, "globalId": f"sd-{node_id}", "name": "s"}
+        }
+
+    async def close_async():
+        pass
+
+    async def ensure_connected(self):
+        self.client = SimpleNamespace(schema=None, close_async=close_async)
+        self.session = SimpleNamespace(execute=execute)
+
+    common.close_graphql_session()
+    mocker.patch.object(
+        common.GraphQLSession, "_ensure_connected", ensure_connected
+    )
+    mocker.patch.dict(
+        common.config["dewrangle"]["client"], {"max_concurrency": 3}
+    )
+    yield stats
+    common.close_graphql_session()
+
+
+def test_async_reads_run_concurrently(mock_session):
+    """
+    Test that independent async queries share the session and run
+    concurrently up to the configured limit
+    """
+
+    async def read_all():
+        return await asyncio.gather(
+            *[
+                common.async_exec_query(
+                    queries.volume, variables={"id": str(i)}
+                )
+                for i in range(12)
+            ]
+        )
+
+    volumes = asyncio.run(read_all())
+
+    assert [v["node"]["id"] for v in volumes] == [str(i) for i in range(12)]
+    assert mock_session["calls"] == 12
+    assert mock_session["max_in_flight"] == 3
+
+
+def test_async_delete_safety_check(mock_session):
+    """
+    Test that async deletes are subject to the delete safety check
+    """
+    common.config["dewrangle"]["base_url"] = "https://dewrangle.com"
+    try:
+        with pytest.raises(ValueError) as e:
+            asyncio.run(aio.delete_study("foo"))
+        assert "Cannot delete" in str(e)
+    finally:
+        common.config["dewrangle"]["base_url"] = common.DEWRANGLE_BASE_URL
+    assert mock_session["calls"] == 0
@@ -0,0 +1,126 @@
+"""
+Test batched node queries
+"""
+
+import asyncio
+
+import pytest
+from gql import gql
+from graphql import build_schema, validate
+
+from d3b_api_client_cli.dewrangle.graphql import batch, study
+
+SDL = """
+type Query { node(id: ID!): Node }
+interface Node { id: ID! }
+type Organization implements Node { id: ID!, name: String }
+type Study implements Node {
+  id: ID!
+  name: String
+  globalId: String
+  organization: Organization
+}
+"""
+SCHEMA = build_schema(SDL)
+SCHEMA_WITH_NODES = build_schema(
+    SDL.replace(
+        "type Query { node(id: ID!): Node }",
+        "type Query { node(id: ID!): Node, nodes(ids: [ID!]!): [Node]! }",
+    )
+)
+
+
+def test_batch_node_query():
+    """
+    Test building a document with aliased node fields
+    """
+    document = batch.batch_node_query(study.queries.study, 3)
+
+    assert not validate(SCHEMA, document)
+    assert batch.batch_node_query(study.queries.study, 3) is document
+    assert batch.batch_node_query(study.queries.study, 2) is not document
+
+
+@pytest.mark.parametrize("schema", [SCHEMA, SCHEMA_WITH_NODES])
+def test_batch_read_studies(mocker, schema):
+    """
+    Test that N studies are read in ceil(N / batch_size) requests
+    """
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.batch.get_graphql_schema",
+        return_value=schema,
+    )
+
+    def mock_exec_query(document, variables=None):
+        assert not validate(schema, document)
+        if "ids" in variables:
+            return {"nodes": [{"id": i} for i in variables["ids"]]}
+        return {
+            f"n{k[2:]}": ({"id": v} if v != "missing" else None)
+            for k, v in variables.items()
+        }
+
+    mock_exec = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.batch.exec_query",
+        side_effect=mock_exec_query,
+    )
+    node_ids = [f"study-{i}" for i in range(7)]
+    if schema is SCHEMA:
+        node_ids.append("missing")
+
+    studies = study.batch_read_studies(node_ids + node_ids[:2], batch_size=4)
+
+    assert mock_exec.call_count == 2
+    assert list(studies) == node_ids
+    for node_id in node_ids:
+        expected = {} if node_id == "missing" else {"id": node_id}
+        assert studies[node_id] == expected
+
+
+def test_batch_node_query_invalid():
+    """
+    Test that batches can only be built from single node queries
+    """
+    with pytest.raises(ValueError) as e:
+        batch.batch_node_query(gql("query { viewer { id } }"), 2)
+    assert "single node" in str(e)
+
+
+def test_async_read_nodes(mocker):
+    """
+    Test that async batches get the schema without blocking the event loop
+    """
+    mock_get_schema = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.batch.get_graphql_schema"
+    )
+
+    async def get_schema():
+        return SCHEMA_WITH_NODES
+
+    async def exec_query(document, variables=None):
+        return {"nodes": [{"id": i} for i in variables["ids"]]}
+
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.batch.async_get_graphql_schema",
+        side_effect=get_schema,
+    )
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.batch.async_exec_query",
+        side_effect=exec_query,
+    )
+
+    nodes = asyncio.run(
+        batch.async_read_nodes(study.queries.study, ["a", "b"], batch_size=1)
+    )
+
+    assert nodes == {"a": {"id": "a"}, "b": {"id": "b"}}
+    mock_get_schema.assert_not_called()
+
+
+def test_batch_size_invalid():
+    """
+    Test that batch sizes below 1 are rejected
+    """
+    with pytest.raises(ValueError) as e:
+        batch.read_nodes(study.queries.study, ["a"], batch_size=0)
+    assert "at least 1" in str(e)
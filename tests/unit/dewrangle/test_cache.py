@@ -0,0 +1,160 @@
+"""
+Test the persistent cache of Dewrangle entities
+"""
+
+import pytest
+from click.testing import CliRunner
+
+from d3b_api_client_cli.cli import cache as cache_cli
+from d3b_api_client_cli.config import config
+from d3b_api_client_cli.dewrangle.graphql import (
+    cache,
+    credential,
+    pagination,
+    snapshot,
+)
+
+from tests.unit.dewrangle.test_pagination import mock_pages, STUDY
+
+CREDENTIAL = {"id": "c1", "key": "key1", "study_id": "s1"}
+
+
+@pytest.fixture(autouse=True)
+def enable_cache(mocker, dewrangle_cache):
+    """
+    Turn on the entity cache, which is opt-in
+    """
+    mocker.patch.dict(config["dewrangle"]["cache"], {"enabled": True})
+
+
+def test_get_put_delete():
+    """
+    Test entities are cached by lookup key and removed by node ID
+    """
+    assert cache.get_entity("credential", "s1::key1") is None
+
+    cache.put_entity("credential", "s1::key1", CREDENTIAL)
+    assert cache.get_entity("credential", "s1::key1") == CREDENTIAL
+    assert cache.get_entity("volume", "s1::key1") is None
+
+    cache.delete_entity("credential", "c1")
+    assert cache.get_entity("credential", "s1::key1") is None
+
+    with pytest.raises(ValueError) as e:
+        cache.get_entity("project", "p1")
+    assert "Unknown entity type" in str(e.value)
+
+
+def test_keyed_by_base_url(mocker):
+    """
+    Test entities cached for one Dewrangle are not used for another
+    """
+    cache.put_entity("credential", "s1::key1", CREDENTIAL)
+
+    mocker.patch.dict(
+        config["dewrangle"], {"base_url": "https://other.dewrangle.com"}
+    )
+    assert cache.get_entity("credential", "s1::key1") is None
+    assert cache.clear_cache() == 0
+
+
+def test_ttl_and_disabled(mocker):
+    """
+    Test expired entities are not used and nothing is cached when the
+    cache is disabled
+    """
+    cache.put_entity("credential", "s1::key1", CREDENTIAL)
+
+    mocker.patch.dict(config["dewrangle"]["cache"]["ttls"], {"credential": 0})
+    mocker.patch.object(cache.time, "time", return_value=1e12)
+    assert cache.get_entity("credential", "s1::key1") is None
+
+    mocker.patch.dict(config["dewrangle"]["cache"], {"enabled": False})
+    cache.put_entity("study", "sd-1", STUDY)
+    mocker.patch.dict(config["dewrangle"]["cache"], {"enabled": True})
+    assert cache.get_entity("study", "sd-1") is None
+
+
+def test_find_credential_cached(mocker):
+    """
+    Test a credential is only looked up in Dewrangle on a cache miss and
+    mutations write through to the cache
+    """
+    calls, exec_query, _ = mock_pages(3)
+    mocker.patch.object(pagination, "exec_query", exec_query)
+    mocker.patch.object(credential, "read_study", return_value=STUDY)
+
+    found = credential.find_credential("key10", "s1")
+    assert found["id"] == "c10"
+    assert len(calls) == 3
+
+    # Every credential in the study was cached
+    credential.study_credential_index.clear()
+    assert credential.find_credential("key21", "s1")["id"] == "c21"
+    assert len(calls) == 3
+
+    created = {
+        "credentialCreate": {
+            "credential": {"id": "c99", "key": "new", "study": {"id": "s1"}}
+        }
+    }
+    mocker.patch.object(credential, "exec_query", return_value=created)
+    credential.upsert_credential({"key": "new"}, study_id="s1")
+    assert credential.find_credential("new", "s1")["id"] == "c99"
+    assert len(calls) == 6
+
+    deleted = {"credentialDelete": {"credential": {"key": "new"}}}
+    mocker.patch.object(credential, "exec_query", return_value=deleted)
+    credential.delete_credential(node_id="c99")
+    assert cache.get_entity("credential", "s1::new") is None
+
+
+def test_sync_and_clear(mocker):
+    """
+    Test syncing replaces the cache with a snapshot and clearing empties it
+    """
+    cache.put_entity("credential", "s1::stale", CREDENTIAL)
+    mocker.patch.object(
+        snapshot,
+        "fetch_snapshot",
+        return_value={
+            "organizations": [{"id": "o1", "name": "org1"}],
+            "studies": {"sd-1": STUDY},
+            "volumes": {"bucket::prefix": {"s1": {"id": "v1"}}},
+            "credentials": {"key1": {"s1": CREDENTIAL}},
+            "billing_groups": {"b": {"id": "b1"}},
+        },
+    )
+
+    counts = snapshot.sync_cache()
+    assert set(counts.values()) == {1}
+    assert cache.get_entity("credential", "s1::stale") is None
+    assert cache.get_entity("volume", "s1::bucket::prefix") == {"id": "v1"}
+    assert cache.get_entity("organization", "org1")["id"] == "o1"
+
+    result = CliRunner().invoke(cache_cli, ["clear", "--entity-type", "volume"])
+    assert result.exit_code == 0
+    assert cache.get_entity("volume", "s1::bucket::prefix") is None
+    assert cache.get_entity("study", "sd-1") == STUDY
+
+    assert cache.clear_cache() == 4
+
+
+def test_sync_and_clear_disabled(mocker):
+    """
+    Test syncing fails and clearing keeps the cache when the cache is
+    disabled, while the cache commands enable it
+    """
+    cache.put_entity("credential", "s1::key1", CREDENTIAL)
+    mock_fetch = mocker.patch.object(snapshot, "fetch_snapshot")
+
+    mocker.patch.dict(config["dewrangle"]["cache"], {"enabled": False})
+    with pytest.raises(ValueError) as e:
+        snapshot.sync_cache()
+    assert "disabled" in str(e.value)
+    mock_fetch.assert_not_called()
+    assert cache.clear_cache() == 0
+
+    result = CliRunner().invoke(cache_cli, ["clear"])
+    assert result.exit_code == 0
+    assert cache.get_entity("credential", "s1::key1") is None
@@ -0,0 +1,145 @@
+"""
+Test resuming interrupted listings from on-disk pagination checkpoints
+"""
+
+import os
+
+import pytest
+
+from d3b_api_client_cli.config import config
+from d3b_api_client_cli.dewrangle.graphql import credential, pagination
+from d3b_api_client_cli.dewrangle.graphql.checkpoint import (
+    Checkpoint,
+    CHECKPOINT_DIR_NAME,
+)
+
+STUDIES = [
+    {"id": study_id, "globalId": f"sd-{study_id}", "name": study_id}
+    for study_id in ["s1", "s2", "s3"]
+]
+
+
+@pytest.fixture
+def server(mocker):
+    """
+    Serve 2 pages of credentials per study and fail once on a given page
+    """
+    calls = []
+    fail = {}
+
+    def exec_query(document, variables=None):
+        study_id = variables["id"]
+        number = int(variables.get("after") or 0)
+        calls.append((study_id, number))
+        if fail.pop((study_id, number), False):
+            raise ConnectionError("connection lost")
+
+        return {
+            "node": {
+                "credentials": {
+                    "edges": [
+                        {"node": {"id": f"{study_id}-{number}", "key": f"k{n}"}}
+                        for n in [number]
+                    ],
+                    "pageInfo": {
+                        "hasNextPage": number == 0,
+                        "endCursor": str(number + 1),
+                    },
+                    "totalCount": 2,
+                }
+            }
+        }
+
+    mocker.patch.object(pagination, "exec_query", exec_query)
+    mocker.patch.object(credential, "iter_studies", lambda **kw: STUDIES)
+    mocker.patch.dict(
+        config["dewrangle"]["client"], {"persistent_session": False}
+    )
+
+    return calls, fail
+
+
+def test_resume_listing(server, tmp_path):
+    """
+    Test an interrupted listing continues from the last checkpointed page
+    """
+    calls, fail = server
+    output_dir = str(tmp_path)
+    fail[("s2", 1)] = True
+
+    with pytest.raises(ConnectionError):
+        credential.read_credentials(
+            output_dir=output_dir, log_output=False, resume=True
+        )
+    assert calls == [("s1", 0), ("s1", 1), ("s2", 0), ("s2", 1)]
+    assert os.listdir(tmp_path / CHECKPOINT_DIR_NAME)
+
+    del calls[:]
+    data = credential.read_credentials(
+        output_dir=output_dir, log_output=False, resume=True
+    )
+
+    # s1 is finished and s2 continues after its first page
+    assert calls == [("s2", 1), ("s3", 0), ("s3", 1)]
+    assert sorted(data["k0"]) == ["s1", "s2", "s3"]
+    assert sorted(data["k1"]) == ["s1", "s2", "s3"]
+    assert data["k0"]["s2"]["study_global_id"] == "sd-s2"
+
+    # The checkpoint is removed once the listing is written
+    assert not os.listdir(tmp_path / CHECKPOINT_DIR_NAME)
+
+
+def test_no_resume_starts_over(server, tmp_path):
+    """
+    Test a listing without resume neither reads nor writes checkpoints
+    """
+    calls, fail = server
+    output_dir = str(tmp_path)
+    fail[("s3", 0)] = True
+
+    with pytest.raises(ConnectionError):
+        credential.read_credentials(
+            output_dir=output_dir, log_output=False, resume=True
+        )
+    checkpoints = os.listdir(tmp_path / CHECKPOINT_DIR_NAME)
+
+    del calls[:]
+    credential.read_credentials(output_dir=output_dir, log_output=False)
+    assert len(calls) == 6
+    assert os.listdir(tmp_path / CHECKPOINT_DIR_NAME) == checkpoints
+
+
+@pytest.mark.parametrize("output_format", ["json", "ndjson"])
+def test_no_checkpoint_without_resume(server, tmp_path, output_format):
+    """
+    Test listings are only checkpointed if resume is requested and there is
+    an output dir
+    """
+    calls, _ = server
+
+    credential.read_credentials(
+        output_dir=str(tmp_path), log_output=False, output_format=output_format
+    )
+    assert not os.path.exists(tmp_path / CHECKPOINT_DIR_NAME)
+
+    credential.read_credentials(output_dir=None, log_output=False, resume=True)
+    assert len(calls) == 12
+
+
+def test_checkpoint_truncated_line(tmp_path):
+    """
+    Test a line cut off by a crash is ignored
+    """
+    checkpoint = Checkpoint(str(tmp_path), "Credential")
+    checkpoint.save(
+        {"id": "s1"},
+        pagination.Page(1, [{"id": "c1"}], 1, 2, True, "1", 0.1),
+    )
+    with open(checkpoint.filepath, "a") as f:
+        f.write('{"parent": "s1", "nod')
+
+    checkpoint.load()
+    assert checkpoint.cursors() == {"s1": "1"}
+    assert not checkpoint.finished("s1")
+    assert checkpoint.page("s1").nodes == [{"id": "c1"}]
+    assert checkpoint.page("s2") is None
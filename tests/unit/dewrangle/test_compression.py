@@ -0,0 +1,70 @@
+"""
+Test negotiating compressed responses and choosing the JSON deserializer
+"""
+
+import json
+
+import pytest
+
+from d3b_api_client_cli.config import config
+from d3b_api_client_cli.dewrangle.graphql.common import create_graphql_client
+from d3b_api_client_cli.utils import io
+
+
+def test_accept_encoding(mocker):
+    """
+    Test brotli is only requested if a decoder is installed
+    """
+    mocker.patch.object(io, "_module_available", lambda name: name == "brotli")
+    assert io.accept_encoding() == "gzip, deflate, br"
+
+    mocker.patch.object(io, "_module_available", lambda name: False)
+    assert io.accept_encoding() == "gzip, deflate"
+
+    mocker.patch.dict(config["dewrangle"]["client"], {"compression": False})
+    assert io.accept_encoding() == "identity"
+
+
+@pytest.mark.parametrize(
+    "name,installed,expected",
+    [
+        ("json", True, json.loads),
+        ("auto", False, json.loads),
+        ("orjson", False, "not installed"),
+        ("ujson", True, "Unknown JSON deserializer"),
+    ],
+)
+def test_get_json_deserializer(mocker, name, installed, expected):
+    """
+    Test choosing the JSON deserializer
+    """
+    mocker.patch.object(io, "_module_available", lambda _: installed)
+    if not installed:
+
+        def import_module(n):
+            if n == "orjson":
+                raise ImportError(n)
+            return json
+
+        mocker.patch.object(io.importlib, "import_module", import_module)
+
+    if isinstance(expected, str):
+        with pytest.raises(ValueError) as e:
+            io.get_json_deserializer(name)
+        assert expected in str(e.value)
+    else:
+        assert io.get_json_deserializer(name) is expected
+
+
+def test_transport_json_deserializer(mocker):
+    """
+    Test the GraphQL transport uses the configured deserializer and asks
+    for compressed responses
+    """
+    mocker.patch.dict(
+        config["dewrangle"]["client"], {"json_deserializer": "json"}
+    )
+    client = create_graphql_client()
+
+    assert client.transport.json_deserializer is json.loads
+    assert client.transport.headers["Accept-Encoding"] == io.accept_encoding()
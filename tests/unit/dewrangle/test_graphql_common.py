@@ -1,3 +1,6 @@
+import threading
+import time
+
 import pytest
 
 from d3b_api_client_cli.dewrangle.graphql.common import create_graphql_client
@@ -25,3 +28,64 @@ def test_missing_configuration(mocker, token, url, expected_msg):
         assert expected_msg in str(e)
     else:
         assert create_graphql_client()
+
+
+def test_persistent_session_reused(mocker):
+    """
+    Test exec_query reuses one long-lived GraphQL session across calls
+    """
+    from gql import gql
+    from d3b_api_client_cli.dewrangle.graphql import common
+
+    calls = []
+
+    async def mock_execute(self, gql_query, variables=None):
+        calls.append((id(self), threading.current_thread().name))
+        return {"viewer": {"name": "foo"}}
+
+    mocker.patch.object(common.GraphQLSession, "_execute", mock_execute)
+    common.close_graphql_session()
+
+    query = gql("query { viewer { name } }")
+    for _ in range(3):
+        assert common.exec_query(query) == {"viewer": {"name": "foo"}}
+
+    session = common.get_graphql_session()
+    assert len({c[0] for c in calls}) == 1
+    assert all(c[1] == "dewrangle-graphql-session" for c in calls)
+
+    common.close_graphql_session()
+    assert not session.thread.is_alive()
+    assert session.loop.is_closed()
+
+
+def test_get_graphql_session_threads(mocker):
+    """
+    Test threads that need the session at the same time share one session
+    """
+    from d3b_api_client_cli.dewrangle.graphql import common
+
+    class MockSession:
+        def __init__(self):
+            time.sleep(0.05)
+
+        def close(self):
+            pass
+
+    common.close_graphql_session()
+    mocker.patch.object(common, "GraphQLSession", MockSession)
+
+    sessions = []
+    threads = [
+        threading.Thread(
+            target=lambda: sessions.append(common.get_graphql_session())
+        )
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len({id(s) for s in sessions}) == 1
+    common.close_graphql_session()
@@ -0,0 +1,110 @@
+"""
+Test the on-disk GraphQL schema cache and local variable validation
+"""
+
+import pytest
+from gql import gql
+from graphql import build_schema, get_introspection_query, graphql_sync
+
+from d3b_api_client_cli.dewrangle.graphql import schema
+
+SCHEMA = build_schema(
+    """
+    type Query { node(id: ID!): Node }
+    interface Node { id: ID! }
+    """
+)
+BASE_URL = "https://dewrangle.com"
+
+
+def test_schema_cache_roundtrip(tmp_path):
+    """
+    Test writing, reading, and clearing the cached schema
+    """
+    cache_dir = str(tmp_path / "cache")
+    introspection = graphql_sync(SCHEMA, get_introspection_query()).data
+
+    assert not schema.read_cached_introspection(BASE_URL, cache_dir=cache_dir)
+
+    schema.write_cached_introspection(
+        BASE_URL, introspection, cache_dir=cache_dir
+    )
+    # Trailing slash resolves to the same cache entry
+    assert (
+        schema.read_cached_introspection(f"{BASE_URL}/", cache_dir=cache_dir)
+        == introspection
+    )
+    assert not schema.read_cached_introspection(
+        "http://localhost:3000", cache_dir=cache_dir
+    )
+
+    schema.clear_cached_introspection(BASE_URL, cache_dir=cache_dir)
+    assert not schema.read_cached_introspection(BASE_URL, cache_dir=cache_dir)
+
+
+def test_schema_cache_expired(tmp_path, mocker):
+    """
+    Test that cached schemas older than the TTL are ignored
+    """
+    cache_dir = str(tmp_path / "cache")
+    schema.write_cached_introspection(BASE_URL, {}, cache_dir=cache_dir)
+
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.schema.time.time",
+        return_value=10**12,
+    )
+    assert (
+        schema.read_cached_introspection(BASE_URL, cache_dir=cache_dir, ttl=60)
+        is None
+    )
+
+
+@pytest.mark.parametrize(
+    "variables,expected_msg",
+    [
+        ({"id": "foo"}, None),
+        ({}, "was not provided"),
+        ({"id": ["foo"]}, "ID cannot represent"),
+    ],
+)
+def test_validate_variables(variables, expected_msg):
+    """
+    Test local validation of GraphQL variables
+    """
+    query = gql("query nodeQuery($id: ID!) { node(id: $id) { id } }")
+
+    if expected_msg:
+        with pytest.raises(ValueError) as e:
+            schema.validate_variables(SCHEMA, query, variables)
+        assert "nodeQuery" in str(e)
+        assert expected_msg in str(e)
+    else:
+        schema.validate_variables(SCHEMA, query, variables)
+
+
+def test_refresh_schema_without_persistent_session(mocker):
+    """
+    Test the schema is refreshed with a one-off client when the persistent
+    session is disabled
+    """
+    from d3b_api_client_cli.config import config
+    from d3b_api_client_cli.dewrangle.graphql import common
+
+    mocker.patch.dict(
+        config["dewrangle"]["client"], {"persistent_session": False}
+    )
+    client = mocker.MagicMock(introspection={"__schema": {}})
+    mocker.patch.object(common, "create_graphql_client", return_value=client)
+    mock_get_session = mocker.patch.object(common, "get_graphql_session")
+    mocker.patch.object(schema, "clear_cached_introspection")
+    mock_write = mocker.patch.object(schema, "write_cached_introspection")
+
+    common.refresh_graphql_schema()
+
+    client.connect_sync.assert_called_once()
+    client.close_sync.assert_called_once()
+    mock_write.assert_called_once_with(
+        config["dewrangle"]["base_url"], {"__schema": {}}
+    )
+    mock_get_session.assert_not_called()
+    common.graphql_client = None
@@ -0,0 +1,485 @@
+"""
+Test per-run coalescing and memoization of Dewrangle lookups
+"""
+
+import asyncio
+
+import pytest
+from graphql import FieldNode
+
+from d3b_api_client_cli.dewrangle.graphql import (
+    billing_group,
+    credential,
+    organization,
+    study,
+    volume,
+)
+from d3b_api_client_cli.dewrangle.graphql.organization import (
+    aio as organization_aio,
+)
+from d3b_api_client_cli.dewrangle.graphql.loader import (
+    Loader,
+    loader_scope,
+    reset_loaders,
+)
+
+
+@pytest.fixture
+def batches():
+    """
+    Batch load function that records the keys of each call
+    """
+    calls = []
+
+    def batch_load_fn(keys):
+        calls.append(keys)
+        return {k: {"id": k} for k in keys if k != "missing"}
+
+    return calls, batch_load_fn
+
+
+def test_load_memoized(batches):
+    """
+    Test that each key is loaded at most once per run
+    """
+    calls, batch_load_fn = batches
+    loader = Loader(batch_load_fn)
+
+    assert loader.load("a") == {"id": "a"}
+    assert loader.load_many(["a", "b", "missing", "b"]) == {
+        "a": {"id": "a"},
+        "b": {"id": "b"},
+        "missing": {},
+    }
+    assert calls == [["a"], ["b", "missing"]]
+
+    # Misses are not memoized
+    assert loader.load("missing") == {}
+    assert calls[2:] == [["missing"]]
+
+    loader.clear("a")
+    loader.load("a")
+    reset_loaders()
+    loader.load("b")
+    assert calls[3:] == [["a"], ["b"]]
+
+
+def test_load_expires(mocker, batches):
+    """
+    Test memoized values and prime_all expire after the TTL and the least
+    recently used values are evicted over max_size
+    """
+    calls, batch_load_fn = batches
+    mock_time = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.loader.time.monotonic",
+        return_value=0,
+    )
+    loader = Loader(batch_load_fn, ttl=10, max_size=2)
+
+    loader.prime_all({"a": {"id": "a"}})
+    assert loader.load("missing") == {}
+    assert not calls
+
+    # a is evicted first, which also ends prime_all
+    loader.prime("b", {"id": "b"})
+    loader.prime("c", {"id": "c"})
+    assert loader.load_many(["a", "c", "missing"])["missing"] == {}
+    assert calls == [["a", "missing"]]
+    assert loader.peek("b") is None
+
+    mock_time.return_value = 11
+    assert loader.peek("c") is None
+    loader.load("c")
+    assert calls[1:] == [["c"]]
+
+
+def test_loader_scope(batches):
+    """
+    Test each loader scope memoizes its own values and forgets them on exit
+    """
+    calls, batch_load_fn = batches
+    loader = Loader(batch_load_fn)
+    loader.load("a")
+
+    async def load_in_scope(key):
+        with loader_scope():
+            await loader.load_async(key)
+            await loader.load_async(key)
+            return loader.peek("a")
+
+    async def load():
+        return await asyncio.gather(load_in_scope("b"), load_in_scope("b"))
+
+    assert asyncio.run(load()) == [None, None]
+    assert calls == [["a"], ["b"], ["b"]]
+
+    assert loader.peek("a") == {"id": "a"}
+    assert loader.peek("b") is None
+
+
+def test_load_async_coalesced(batches):
+    """
+    Test that async lookups queued in the same tick are merged into one batch
+    """
+    calls, batch_load_fn = batches
+
+    async def async_batch_load_fn(keys):
+        return batch_load_fn(keys)
+
+    loader = Loader(batch_load_fn, async_batch_load_fn)
+
+    async def load():
+        first = await asyncio.gather(
+            *[loader.load_async(k) for k in ["a", "b", "a", "missing"]]
+        )
+        second = await loader.load_many_async(["b", "c"])
+        return first, second
+
+    first, second = asyncio.run(load())
+
+    assert first == [{"id": "a"}, {"id": "b"}, {"id": "a"}, {}]
+    assert second == {"b": {"id": "b"}, "c": {"id": "c"}}
+    assert calls == [["a", "b", "missing"], ["c"]]
+
+
+def test_load_async_errors():
+    """
+    Test that errors in the batch load function reach every waiting caller
+    """
+
+    def batch_load_fn(keys):
+        raise ValueError("❌ boom")
+
+    loader = Loader(batch_load_fn)
+
+    async def load():
+        return await asyncio.gather(
+            loader.load_async("a"),
+            loader.load_async("b"),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(load())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_find_study_memoized(mocker):
+    """
+    Test that repeated study lookups only paginate studies once until a
+    study is mutated
+    """
+    mock_paginate = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.study.paginate_studies",
+        return_value={
+            "sd-1": {"id": "s1", "globalId": "sd-1", "organization_id": "o"}
+        },
+    )
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.study.exec_query",
+        return_value={"studyDelete": {"study": {}}},
+    )
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.study.iter_organizations",
+        return_value=[{"id": "o"}],
+    )
+    mocker.patch.object(study, "MAX_FILTERED_STUDY_QUERIES", 0)
+
+    assert study.find_study("sd-1")["id"] == "s1"
+    assert study.find_study("sd-1")["id"] == "s1"
+    assert mock_paginate.call_count == 1
+
+    # Studies that were not found are not memoized
+    assert study.find_study("sd-2") == {}
+    assert study.find_study("sd-2") == {}
+    assert mock_paginate.call_count == 3
+
+    study.delete_study("s1", delete_safety_check=False)
+    study.find_study("sd-1")
+    assert mock_paginate.call_count == 4
+
+
+def test_find_study_by_filter(mocker):
+    """
+    Test studies are found with the study filter, each organization is
+    filtered at most once and studies the filter misses are not paginated
+    """
+
+    def exec_query(document, variables=None):
+        global_id = variables["filter"]["query"]
+        edges = []
+        if (variables["id"], global_id) in [("o1", "sd-1"), ("o2", "sd-2")]:
+            edges = [{"node": {"id": global_id, "globalId": global_id}}]
+        return {"node": {"studies": {"edges": edges}}}
+
+    mock_exec = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.study.exec_query",
+        side_effect=exec_query,
+    )
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.study.iter_organizations",
+        return_value=[{"id": "o1"}, {"id": "o2"}],
+    )
+    mock_paginate = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.study.paginate_studies",
+        return_value={},
+    )
+
+    found = study.find_study("sd-1", organization_id="o1")
+    assert found["organization_id"] == "o1"
+    assert mock_exec.call_count == 1
+
+    # Organization unknown, try each one
+    found = study.find_study("SD_2")
+    assert found["organization_id"] == "o2"
+    assert found["kf_id"] == "SD_2"
+    assert mock_exec.call_count == 3
+
+    # Organization known but wrong, try the other ones
+    found = study.find_study("sd-4", organization_id="o2")
+    assert found == {}
+    assert mock_exec.call_count == 5
+
+    assert study.find_study("sd-3") == {}
+    assert mock_exec.call_count == 7
+    mock_paginate.assert_not_called()
+
+
+def test_read_organization_indexed(mocker):
+    """
+    Test organizations are paginated once and indexed by ID and name
+    without writing anything to disk
+    """
+    mock_paginate = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.organization"
+        ".paginate_organizations",
+        return_value=[{"id": "o1", "name": "org1"}],
+    )
+    mock_write = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.organization.write_json"
+    )
+
+    assert organization.read_organization(dewrangle_org_id="o1")["id"] == "o1"
+    assert organization.get_org_by_name("org1")["id"] == "o1"
+    assert organization.read_organization(dewrangle_org_id="o2") is None
+    assert organization.read_organization(dewrangle_org_name="org2") is None
+    assert organization.get_org_by_name("org2") == {}
+    assert asyncio.run(organization_aio.get_org_by_name("org2")) == {}
+    assert mock_paginate.call_count == 1
+    mock_write.assert_not_called()
+
+
+def test_delete_organization_not_found(mocker):
+    """
+    Test no delete is sent for an organization name that is not found
+    """
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.organization"
+        ".paginate_organizations",
+        return_value=[{"id": "o1", "name": "org1"}],
+    )
+    mock_exec = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.organization.exec_query"
+    )
+    mock_async_exec = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.organization.aio"
+        ".async_exec_query"
+    )
+
+    assert organization.delete_organization(dewrangle_org_name="org2") is None
+    assert (
+        asyncio.run(
+            organization_aio.delete_organization(dewrangle_org_name="org2")
+        )
+        is None
+    )
+    mock_exec.assert_not_called()
+    mock_async_exec.assert_not_called()
+
+
+def test_delete_organization_errors(mocker):
+    """
+    Test a failed organization delete returns without forgetting anything
+    """
+    mock_reset = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.organization.reset_loaders"
+    )
+    resp = {
+        "organizationDelete": {
+            "errors": [{"message": "not allowed"}],
+            "organization": None,
+        }
+    }
+
+    assert organization._delete_result(resp, "o1") is None
+    mock_reset.assert_not_called()
+
+
+def test_create_or_find_billing_group_indexed(mocker):
+    """
+    Test billing groups are only paginated once a create fails, return
+    every listed field and are added to the index when created
+    """
+    listed = {"id": "bg1", "cavaticaBillingGroupId": "b1", "name": "bg"}
+    mock_paginate = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.billing_group"
+        ".paginate_billing_groups",
+        return_value={"b1": {**listed, "organization_id": "o1"}},
+    )
+    mock_exec = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.billing_group.exec_query",
+        side_effect=[
+            {
+                "billingGroupCreate": {
+                    "errors": [{"message": "already exists"}],
+                    "billingGroup": None,
+                }
+            },
+            {
+                "billingGroupCreate": {
+                    "billingGroup": {
+                        "id": "bg2",
+                        "cavaticaBillingGroupId": "b2",
+                    }
+                }
+            },
+        ],
+    )
+
+    for _ in range(2):
+        found = billing_group.create_or_find_billing_group("o1", "b1")
+        assert found == {**listed, "organization_id": "o1"}
+        created = billing_group.create_or_find_billing_group("o1", "b2")
+        assert created["id"] == "bg2"
+
+    # Only the create that failed needs the listing, which is not projected
+    mock_paginate.assert_called_once_with()
+    assert mock_exec.call_count == 2
+
+
+def test_identity_map_write_through(mocker):
+    """
+    Test created entities are served from the loaders of the run and
+    deleted entities are evicted without fetching anything again
+    """
+    node = {
+        "id": "c1",
+        "name": "cred",
+        "key": "k1",
+        "study": {"id": "s1", "name": "study", "globalId": "sd-1"},
+    }
+    mock_iter = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.credential.iter_credentials",
+        return_value=[],
+    )
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.credential.exec_query",
+        side_effect=[
+            {"credentialCreate": {"credential": dict(node)}},
+            {"credentialDelete": {"credential": dict(node)}},
+        ],
+    )
+    mock_read_nodes = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.loader.read_nodes"
+    )
+
+    credential.upsert_credential({"key": "k1", "name": "cred"}, study_id="s1")
+    assert credential.find_credential("k1", "s1")["id"] == "c1"
+    assert credential.read_credential("c1")["id"] == "c1"
+
+    credential.delete_credential("c1", delete_safety_check=False)
+    assert credential.find_credential("k1", "s1") == {}
+
+    assert mock_iter.call_count == 1
+    mock_read_nodes.assert_not_called()
+
+
+def _selected_fields(selection_set) -> dict:
+    """
+    Nested names of the fields selected by a selection set
+    """
+    fields = {}
+    for selection in selection_set.selections:
+        subfields = None
+        if selection.selection_set:
+            subfields = _selected_fields(selection.selection_set)
+        if isinstance(selection, FieldNode):
+            fields[selection.name.value] = subfields
+        else:
+            fields.update(subfields)
+    return fields
+
+
+@pytest.mark.parametrize(
+    "node_query,entity,mutations",
+    [
+        (
+            study.queries.study,
+            "study",
+            [study.mutations.create_study, study.mutations.update_study],
+        ),
+        (
+            billing_group.queries.billing_group,
+            "billingGroup",
+            [billing_group.mutations.create_billing_group],
+        ),
+        (
+            credential.queries.credential,
+            "credential",
+            [
+                credential.mutations.create_credential,
+                credential.mutations.update_credential,
+            ],
+        ),
+        (
+            volume.queries.volume,
+            "volume",
+            [volume.mutations.create_volume, volume.mutations.update_volume],
+        ),
+    ],
+)
+def test_mutations_select_node_fields(node_query, entity, mutations):
+    """
+    Test the payloads that mutations remember in the node loaders have every
+    field that reading the node by ID would return
+    """
+    expected = _selected_fields(node_query.definitions[0].selection_set)
+
+    for mutation in mutations:
+        (payload,) = _selected_fields(
+            mutation.definitions[0].selection_set
+        ).values()
+        assert payload[entity] == expected["node"]
+
+
+def test_find_volume_and_credential_full(mocker):
+    """
+    Test volumes and credentials found in the index of their study have
+    every field of a page of volumes or credentials
+    """
+    listed_volume = {
+        "id": "v1",
+        "name": "bucket",
+        "pathPrefix": "prefix",
+        "region": "us-east-1",
+        "type": "S3",
+        "study_id": "s1",
+    }
+    listed_credential = {
+        "id": "c1",
+        "name": "cred",
+        "key": "k1",
+        "study_id": "s1",
+    }
+    mock_iter_volumes = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.volume.iter_volumes",
+        return_value=[listed_volume],
+    )
+    mock_iter_credentials = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.credential.iter_credentials",
+        return_value=[listed_credential],
+    )
+
+    assert volume.find_volume("bucket", "prefix", "s1") == listed_volume
+    assert credential.find_credential("k1", "s1") == listed_credential
+    mock_iter_volumes.assert_called_once_with(study_id="s1", prefetch=True)
+    mock_iter_credentials.assert_called_once_with(study_id="s1", prefetch=True)
@@ -0,0 +1,151 @@
+"""
+Test the GraphQL operation registry and persisted queries
+"""
+
+import asyncio
+import gc
+import hashlib
+
+import pytest
+from gql import gql
+from graphql import ExecutionResult, print_ast
+
+from d3b_api_client_cli.dewrangle.graphql import operations, study, volume
+from d3b_api_client_cli.dewrangle.graphql.transport import (
+    DewrangleServerError,
+    DewrangleTransport,
+)
+
+
+def test_register_operations():
+    """
+    Test that documents are registered with precomputed metadata
+    """
+    registered = operations.register_operations()
+
+    assert "study.queries.org_studies" in registered
+    assert "volume.mutations.delete_volume" in registered
+
+    operation = operations.get_operation(study.mutations.delete_study)
+    assert operation is registered["study.mutations.delete_study"]
+    assert operation.name == "studyDeleteMutation"
+    assert operation.operation_type == "mutation"
+    assert operation.destructive
+    assert operation.query == print_ast(study.mutations.delete_study)
+    assert (
+        operation.sha256
+        == hashlib.sha256(operation.query.encode("utf-8")).hexdigest()
+    )
+
+    for document in [volume.mutations.list_and_hash, study.queries.study]:
+        assert not operations.get_operation(document).destructive
+
+
+def transport_with_responses(mocker, responses):
+    """
+    Create a transport whose POSTs return canned results and record the
+    payloads that were sent
+    """
+    transport = DewrangleTransport(url="http://localhost:3000/api/graphql")
+    payloads = []
+
+    async def post(payload, extra_args=None):
+        payloads.append(dict(payload))
+        result = responses.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return ExecutionResult(**result)
+
+    mocker.patch.object(transport, "_post", side_effect=post)
+
+    return transport, payloads
+
+
+def execute(transport, document):
+    return asyncio.run(transport.execute(document, variable_values={"id": 1}))
+
+
+@pytest.mark.parametrize(
+    "first,supported",
+    [
+        (
+            {
+                "errors": [
+                    {
+                        "message": "PersistedQueryNotFound",
+                        "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"},
+                    }
+                ]
+            },
+            True,
+        ),
+        (
+            {
+                "errors": [
+                    {
+                        "message": "PersistedQueryNotSupported",
+                        "extensions": {"code": "PERSISTED_QUERY_NOT_SUPPORTED"},
+                    }
+                ]
+            },
+            False,
+        ),
+        ({"errors": [{"message": "Must provide query string"}]}, False),
+        (DewrangleServerError("Bad Request", 400), False),
+    ],
+)
+def test_persisted_query_fallback(mocker, first, supported):
+    """
+    Test that the transport sends the full query text if the server does
+    not know the query hash or does not support persisted queries
+    """
+    data = {"data": {"node": {"id": 1}}}
+    transport, payloads = transport_with_responses(mocker, [first, data, data])
+    operation = operations.get_operation(study.queries.study)
+
+    assert execute(transport, study.queries.study).data == data["data"]
+    assert transport.persisted_queries_supported is supported
+    assert "query" not in payloads[0]
+    assert payloads[0]["extensions"]["persistedQuery"]["sha256Hash"] == (
+        operation.sha256
+    )
+    assert payloads[1]["query"] == operation.query
+    assert ("extensions" in payloads[1]) is supported
+
+    # Later requests only send the hash if the server supports it
+    execute(transport, study.queries.study)
+    assert ("query" in payloads[2]) is not supported
+    assert len(payloads) == 3
+
+
+def test_persisted_query_transient_errors(mocker):
+    """
+    Test that transient HTTP errors are raised for the retry policy without
+    turning off persisted queries
+    """
+    data = {"data": {"node": {"id": 1}}}
+    transport, payloads = transport_with_responses(
+        mocker, [DewrangleServerError("Bad Gateway", 502), data]
+    )
+
+    with pytest.raises(DewrangleServerError):
+        execute(transport, study.queries.study)
+    assert transport.persisted_queries_supported is None
+
+    assert execute(transport, study.queries.study).data == data["data"]
+    assert "query" not in payloads[1]
+    assert transport.persisted_queries_supported is True
+
+
+def test_operations_garbage_collected():
+    """
+    Test documents built on the fly do not stay in the registry
+    """
+    document = gql("query Temporary { viewer { id } }")
+    operation = operations.get_operation(document)
+    assert operations.get_operation(document) is operation
+    size = len(operations._registry)
+
+    del document
+    gc.collect()
+    assert len(operations._registry) == size - 1
@@ -0,0 +1,94 @@
+"""
+Test streaming read_* listings to NDJSON and CSV files
+"""
+
+import csv
+import json
+
+import pytest
+
+from d3b_api_client_cli.dewrangle.graphql import volume
+from d3b_api_client_cli.utils import io
+
+VOLUMES = [
+    {
+        "id": "v1",
+        "name": "bucket",
+        "pathPrefix": "a",
+        "study": {"id": "s1", "globalId": "sd-1"},
+        "tags": ["x"],
+    },
+    {
+        "id": "v2",
+        "name": "bucket",
+        "pathPrefix": None,
+        "study": {"id": "s1", "globalId": "sd-1"},
+        "tags": [],
+        "extra": 1,
+    },
+]
+
+
+def test_write_entities_ndjson(tmp_path):
+    """
+    Test each entity is written to its own line
+    """
+    filepath = str(tmp_path / "Volume.ndjson")
+    assert io.write_entities(iter(VOLUMES), filepath, "ndjson") == 2
+
+    with open(filepath) as f:
+        assert [json.loads(line) for line in f] == VOLUMES
+
+
+def test_write_entities_csv(tmp_path):
+    """
+    Test nested entities are flattened into CSV columns
+    """
+    filepath = str(tmp_path / "Volume.csv")
+    assert io.write_entities(iter(VOLUMES), filepath, "csv") == 2
+
+    with open(filepath) as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == [
+        "id",
+        "name",
+        "pathPrefix",
+        "study.id",
+        "study.globalId",
+        "tags",
+    ]
+    assert rows[0]["study.globalId"] == "sd-1"
+    assert rows[0]["tags"] == '["x"]'
+    assert rows[1]["pathPrefix"] == ""
+
+    with pytest.raises(ValueError) as e:
+        io.write_entities(iter(VOLUMES), filepath, "xml")
+    assert "Unknown streaming output format" in str(e.value)
+
+
+def test_read_volumes_streams(mocker, tmp_path):
+    """
+    Test read_volumes writes volumes as they are iterated instead of
+    collecting them
+    """
+    written = []
+
+    def iter_volumes(**kwargs):
+        for v in VOLUMES:
+            yield v
+            written.append(v["id"])
+
+    mocker.patch.object(volume, "iter_volumes", iter_volumes)
+    paginate = mocker.patch.object(volume, "paginate_volumes")
+
+    filepath = volume.read_volumes(
+        output_dir=str(tmp_path), output_format="ndjson"
+    )
+
+    assert filepath == str(tmp_path / "Volume.ndjson")
+    assert written == ["v1", "v2"]
+    paginate.assert_not_called()
+
+    with pytest.raises(ValueError) as e:
+        volume.read_volumes(output_dir=None, output_format="csv")
+    assert "output_dir is required" in str(e.value)
@@ -0,0 +1,421 @@
+"""
+Test streaming Relay pagination of Dewrangle connections
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from gql import gql
+
+from d3b_api_client_cli.dewrangle.graphql import credential, pagination
+from d3b_api_client_cli.dewrangle.graphql.credential import aio
+from d3b_api_client_cli.config import config
+
+QUERY = gql("query { viewer { id } }")
+PATH = "node.credentials.edges.node"
+STUDY = {"id": "s1", "globalId": "sd-1", "name": "Study"}
+
+
+def mock_pages(n_pages, page_size=2):
+    """
+    Build a fake exec_query that serves n_pages of credentials
+    """
+    calls = []
+
+    def page(variables):
+        calls.append(dict(variables))
+        number = int(variables.get("after") or 0)
+        edges = [
+            {"node": {"id": f"c{number}{i}", "key": f"key{number}{i}"}}
+            for i in range(page_size)
+        ]
+        return {
+            "node": {
+                "credentials": {
+                    "edges": edges,
+                    "pageInfo": {
+                        "hasNextPage": number + 1 < n_pages,
+                        "endCursor": str(number + 1),
+                    },
+                    "totalCount": n_pages * page_size,
+                }
+            }
+        }
+
+    def exec_query(document, variables=None):
+        return page(variables)
+
+    async def async_exec_query(document, variables=None):
+        return page(variables)
+
+    return calls, exec_query, async_exec_query
+
+
+@pytest.fixture
+def pages(mocker):
+    calls, exec_query, async_exec_query = mock_pages(3)
+    mocker.patch.object(pagination, "exec_query", exec_query)
+    mocker.patch.object(pagination, "async_exec_query", async_exec_query)
+
+    return calls
+
+
+def test_paginate_pages(pages):
+    """
+    Test pages are fetched with the cursor of the previous page
+    """
+    result = list(
+        pagination.paginate_pages(QUERY, PATH, {"id": "s1"}, page_size=2)
+    )
+
+    assert [p.number for p in result] == [1, 2, 3]
+    assert [p.count for p in result] == [2, 4, 6]
+    assert result[-1].total_count == 6
+    assert not result[-1].has_next_page
+    assert all(p.elapsed >= 0 for p in result)
+    assert pages == [
+        {"id": "s1", "first": 2},
+        {"id": "s1", "first": 2, "after": "1"},
+        {"id": "s1", "first": 2, "after": "2"},
+    ]
+
+
+def test_paginate_nodes_early_exit(pages):
+    """
+    Test the next page is not fetched if the caller stops iterating
+    """
+    nodes = pagination.paginate_nodes(QUERY, PATH, page_size=2)
+    assert next(nodes)["id"] == "c00"
+    assert len(pages) == 1
+
+    assert [n["id"] for n in nodes] == ["c01", "c10", "c11", "c20", "c21"]
+    assert len(pages) == 3
+
+
+def test_invalid_path():
+    """
+    Test paths must go through the edges of a connection
+    """
+    with pytest.raises(ValueError) as e:
+        list(pagination.paginate_pages(QUERY, "node.credentials"))
+    assert "does not go through a connection" in str(e.value)
+
+
+def test_find_credential_indexed(mocker, pages):
+    """
+    Test find_credential fetches the credentials of the study once and
+    finds the others in the index
+    """
+    mocker.patch.object(credential, "read_study", return_value=STUDY)
+
+    found = credential.find_credential("key10", "s1")
+    assert found["id"] == "c10"
+    assert found["study_id"] == "s1"
+    assert len(pages) == 3
+
+    assert credential.find_credential("key21", "s1")["id"] == "c21"
+    assert credential.find_credential("missing", "s1") == {}
+    assert len(pages) == 3
+
+
+def test_paginate_credentials(mocker, pages):
+    """
+    Test paginate_credentials collects every page
+    """
+    credentials = credential.paginate_credentials(studies={"sd-1": STUDY})
+
+    assert len(credentials) == 6
+    assert credentials["key21"]["s1"]["study_global_id"] == "sd-1"
+
+
+def test_async_find_credential_indexed(mocker, pages):
+    """
+    Test the async find_credential uses the index of the study's
+    credentials
+    """
+
+    async def read_study(study_id):
+        return STUDY
+
+    mocker.patch.object(credential, "read_study", return_value=STUDY)
+    mocker.patch.object(aio, "read_study", read_study)
+
+    found = asyncio.run(aio.find_credential("key01", "s1"))
+    assert found["id"] == "c01"
+    assert len(pages) == 3
+
+    credentials = asyncio.run(aio.paginate_credentials(study_id="s1"))
+    assert len(credentials) == 6
+
+
+def test_page_size_per_connection(mocker, pages):
+    """
+    Test the page size is configured per connection
+    """
+    mocker.patch.dict(
+        config["dewrangle"]["pagination"],
+        {"page_sizes": {"credentials": 3}, "max_page_size": 7},
+    )
+
+    assert pagination.page_size_for(PATH) == 3
+    assert pagination.page_size_for("node.volumes.edges.node") == 7
+
+    list(pagination.paginate_pages(QUERY, PATH))
+    assert pages[0]["first"] == 3
+
+
+@pytest.mark.parametrize(
+    "elapsed,expected",
+    [
+        # Fast full pages double the page size up to the max
+        ([0.1, 0.1, 0.1, 0.1], [10, 20, 40, 50]),
+        # Slow pages shrink it in proportion down to the min
+        ([20, 20, 20, 20], [10, 5, 2, 2]),
+        # Pages close to the target keep it
+        ([6, 6, 6, 6], [10, 10, 10, 10]),
+    ],
+)
+def test_adaptive_page_size(mocker, elapsed, expected):
+    """
+    Test the adaptive mode grows and shrinks the page size with latency
+    """
+    mocker.patch.dict(
+        config["dewrangle"]["pagination"],
+        {
+            "page_sizes": {"credentials": 10},
+            "adaptive": {
+                "enabled": True,
+                "min_page_size": 2,
+                "max_page_size": 50,
+                "target_latency": 10,
+            },
+        },
+    )
+    pagination.reset_page_sizes()
+    sizes = []
+    clock = [0.0]
+
+    def exec_query(document, variables=None):
+        page_size = variables["first"]
+        sizes.append(page_size)
+        clock[0] += elapsed[len(sizes) - 1]
+        return {
+            "node": {
+                "credentials": {
+                    "edges": [{"node": {"id": i}} for i in range(page_size)],
+                    "pageInfo": {
+                        "hasNextPage": len(sizes) < len(elapsed),
+                        "endCursor": str(len(sizes)),
+                    },
+                    "totalCount": 1000,
+                }
+            }
+        }
+
+    mocker.patch.object(pagination, "exec_query", exec_query)
+    mocker.patch.object(pagination.time, "monotonic", lambda: clock[0])
+
+    list(pagination.paginate_pages(QUERY, PATH))
+    assert sizes == expected
+
+    # The learned page size is reused for the next listing
+    assert pagination.page_size_for(PATH) == expected[-1]
+    pagination.reset_page_sizes()
+
+
+def mock_parents(delays):
+    """
+    Build a fake exec_query that serves 2 pages of credentials per study
+    and takes a different amount of time for each study
+    """
+    active = []
+    max_active = [0]
+    lock = threading.Lock()
+
+    def page(variables):
+        number = int(variables.get("after") or 0)
+        study_id = variables["id"]
+        return {
+            "node": {
+                "credentials": {
+                    "edges": [{"node": {"id": f"{study_id}-{number}"}}],
+                    "pageInfo": {
+                        "hasNextPage": number == 0,
+                        "endCursor": str(number + 1),
+                    },
+                    "totalCount": 2,
+                }
+            }
+        }
+
+    def track(study_id, delta):
+        with lock:
+            if delta > 0:
+                active.append(study_id)
+            else:
+                active.remove(study_id)
+            max_active[0] = max(max_active[0], len(active))
+
+    def exec_query(document, variables=None):
+        track(variables["id"], 1)
+        time.sleep(delays[variables["id"]])
+        track(variables["id"], -1)
+        return page(variables)
+
+    async def async_exec_query(document, variables=None):
+        track(variables["id"], 1)
+        await asyncio.sleep(delays[variables["id"]])
+        track(variables["id"], -1)
+        return page(variables)
+
+    return max_active, exec_query, async_exec_query
+
+
+def test_paginate_each(mocker):
+    """
+    Test parents are paginated concurrently but yielded in order
+    """
+    delays = {"s1": 0.05, "s2": 0, "s3": 0.02, "s4": 0}
+    max_active, exec_query, async_exec_query = mock_parents(delays)
+    mocker.patch.object(pagination, "exec_query", exec_query)
+    mocker.patch.object(pagination, "async_exec_query", async_exec_query)
+    mocker.patch.dict(
+        config["dewrangle"]["client"], {"persistent_session": True}
+    )
+    parents = [{"id": study_id} for study_id in delays]
+    expected = [
+        (study_id, f"{study_id}-{n}") for study_id in delays for n in range(2)
+    ]
+
+    result = [
+        (parent["id"], node["id"])
+        for parent, page in pagination.paginate_each(
+            QUERY, PATH, parents, max_concurrency=2
+        )
+        for node in page.nodes
+    ]
+    assert result == expected
+    assert max_active[0] == 2
+
+    async def run():
+        return [
+            (parent["id"], node["id"])
+            async for parent, page in pagination.async_paginate_each(
+                QUERY, PATH, parents, max_concurrency=3
+            )
+            for node in page.nodes
+        ]
+
+    max_active[0] = 0
+    assert asyncio.run(run()) == expected
+    assert max_active[0] == 3
+
+
+def test_paginate_each_early_exit(mocker):
+    """
+    Test concurrent parents only fetch a few pages ahead and stop when the
+    caller stops
+    """
+    calls, exec_query, async_exec_query = mock_pages(50)
+    mocker.patch.object(pagination, "exec_query", exec_query)
+    mocker.patch.object(pagination, "async_exec_query", async_exec_query)
+    mocker.patch.dict(
+        config["dewrangle"]["client"], {"persistent_session": True}
+    )
+    mocker.patch.dict(
+        config["dewrangle"]["pagination"], {"max_buffered_pages": 2}
+    )
+    started = []
+
+    def parents():
+        for i in range(10):
+            started.append(i)
+            yield {"id": f"s{i}"}
+
+    each = pagination.paginate_each(QUERY, PATH, parents(), max_concurrency=2)
+    parent, page = next(each)
+    assert (parent["id"], page.number) == ("s0", 1)
+    each.close()
+    time.sleep(0.3)
+
+    # Each of the running parents fetched at most 3 pages past the buffer
+    fetched = len(calls)
+    assert fetched <= 3 * (2 + 2)
+    assert len(started) <= 3
+    time.sleep(0.2)
+    assert len(calls) == fetched
+
+    async def run():
+        each = pagination.async_paginate_each(
+            QUERY, PATH, parents(), max_concurrency=2
+        )
+        await each.__anext__()
+        await each.aclose()
+        await asyncio.sleep(0.1)
+
+    del calls[:]
+    del started[:]
+    asyncio.run(run())
+    assert len(calls) <= 3 * (2 + 2)
+    assert len(started) <= 3
+
+
+def test_paginate_each_sequential(mocker, pages):
+    """
+    Test parents are paginated lazily one at a time without the persistent
+    session
+    """
+    mocker.patch.dict(
+        config["dewrangle"]["client"], {"persistent_session": False}
+    )
+    each = pagination.paginate_each(
+        QUERY, PATH, [{"id": "s1"}, {"id": "s2"}], max_concurrency=5
+    )
+    parent, page = next(each)
+    assert parent["id"] == "s1"
+    assert len(pages) == 1
+
+
+def test_prefetch(mocker):
+    """
+    Test the next page is requested before the caller asks for it
+    """
+    calls, exec_query, async_exec_query = mock_pages(3)
+    requested = [threading.Event() for _ in range(3)]
+
+    def prefetched_exec_query(document, variables=None):
+        resp = exec_query(document, variables=variables)
+        requested[len(calls) - 1].set()
+        return resp
+
+    mocker.patch.object(pagination, "exec_query", prefetched_exec_query)
+    mocker.patch.object(pagination, "async_exec_query", async_exec_query)
+    mocker.patch.dict(
+        config["dewrangle"]["client"], {"persistent_session": True}
+    )
+
+    pages = pagination.paginate_pages(QUERY, PATH, page_size=2, prefetch=True)
+    assert next(pages).number == 1
+    assert requested[1].wait(5)
+    assert [p.number for p in pages] == [2, 3]
+    assert calls[-1]["after"] == "2"
+
+    async def run():
+        pages = pagination.async_paginate_pages(
+            QUERY, PATH, page_size=2, prefetch=True
+        )
+        numbers = [(await pages.__anext__()).number]
+        await asyncio.sleep(0)
+        numbers.append(len(calls))
+        numbers.extend([p.number async for p in pages])
+        return numbers
+
+    del calls[:]
+    assert asyncio.run(run()) == [1, 2, 2, 3]
+
+    # Lookups that stop early do not prefetch
+    del calls[:]
+    assert next(pagination.paginate_nodes(QUERY, PATH))["id"] == "c00"
+    assert len(calls) == 1
@@ -0,0 +1,152 @@
+"""
+Test field projection of GraphQL query documents
+"""
+
+import pytest
+from click.testing import CliRunner
+from graphql import build_schema, print_ast, validate
+
+from d3b_api_client_cli.cli import read_volumes
+from d3b_api_client_cli.dewrangle.graphql import volume
+from d3b_api_client_cli.dewrangle.graphql.projection import (
+    project,
+    parse_fields,
+)
+
+SCHEMA = build_schema(
+    """
+    type Query { node(id: ID!): Node }
+    interface Node { id: ID! }
+    type PageInfo { hasNextPage: Boolean!, endCursor: ID }
+    type Credential implements Node { id: ID!, type: String, key: String }
+    type Study implements Node {
+      id: ID!
+      name: String
+      globalId: String
+      volumes(first: Int, after: ID): VolumeConnection
+    }
+    type VolumeConnection {
+      totalCount: Int
+      pageInfo: PageInfo!
+      edges: [VolumeEdge]
+    }
+    type VolumeEdge { cursor: ID!, node: Volume }
+    type Volume implements Node {
+      id: ID!
+      name: String
+      region: String
+      type: String
+      pathPrefix: String
+      study: Study
+      credential: Credential
+    }
+    """
+)
+
+
+def test_project():
+    """
+    Test that only the requested and required fields are selected
+    """
+    document = project(
+        volume.queries.study_volumes,
+        ["region", "study.globalId"],
+        path=volume.queries.VOLUMES_PATH,
+        required=volume.queries.VOLUME_KEY_FIELDS,
+    )
+    query = print_ast(document)
+
+    assert not validate(SCHEMA, document)
+    assert "region" in query
+    assert "credential" not in query
+    assert "type" not in query
+    assert "study {\n              globalId\n            }" in query
+    # Fields outside of the projected entity are untouched
+    assert "hasNextPage" in query
+
+    assert document is project(
+        volume.queries.study_volumes,
+        ["study.globalId", "region"],
+        path=volume.queries.VOLUMES_PATH,
+        required=volume.queries.VOLUME_KEY_FIELDS,
+    )
+    assert project(volume.queries.study_volumes, None) is (
+        volume.queries.study_volumes
+    )
+    assert not validate(
+        SCHEMA,
+        project(
+            volume.queries.study_volumes,
+            volume.queries.VOLUME_KEY_FIELDS,
+            path=volume.queries.VOLUMES_PATH,
+        ),
+    )
+
+
+@pytest.mark.parametrize("fields", [["foo"], ["study.foo"], ["name.foo"]])
+def test_project_unknown_fields(fields):
+    """
+    Test that fields must be selected by the full document
+    """
+    with pytest.raises(ValueError) as e:
+        project(volume.queries.volume, fields)
+    assert "Unknown field" in str(e)
+
+
+def test_parse_fields():
+    """
+    Test parsing fields from the command line
+    """
+    assert parse_fields(None) is None
+    assert parse_fields(" id, name,,study.globalId ") == [
+        "id",
+        "name",
+        "study.globalId",
+    ]
+
+
+def test_read_volumes_fields(mocker, tmp_path):
+    """
+    Test that read-volumes only fetches the requested fields
+    """
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.volume.iter_studies",
+        return_value=iter([{"id": "s1", "globalId": "sd-1", "name": "Study"}]),
+    )
+    documents = []
+
+    def mock_exec_query(document, variables=None):
+        documents.append(document)
+        return {
+            "node": {
+                "volumes": {
+                    "edges": [
+                        {"node": {"id": "v1", "name": "b", "pathPrefix": "p"}}
+                    ],
+                    "pageInfo": {"hasNextPage": False, "endCursor": None},
+                    "totalCount": 1,
+                }
+            }
+        }
+
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.pagination.exec_query",
+        side_effect=mock_exec_query,
+    )
+    runner = CliRunner()
+    result = runner.invoke(
+        read_volumes,
+        ["--output-dir", str(tmp_path), "--fields", "name,pathPrefix"],
+        standalone_mode=False,
+    )
+
+    assert result.exit_code == 0, result.exception
+    assert documents == [
+        project(
+            volume.queries.study_volumes,
+            volume.queries.VOLUME_KEY_FIELDS,
+            path=volume.queries.VOLUMES_PATH,
+            required=volume.queries.VOLUME_KEY_FIELDS,
+        )
+    ]
+    assert result.return_value["b::p"]["s1"]["id"] == "v1"
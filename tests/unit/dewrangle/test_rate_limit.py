@@ -0,0 +1,157 @@
+"""
+Test the token bucket shared by Dewrangle GraphQL and REST requests
+"""
+
+import asyncio
+import threading
+
+import pytest
+import requests
+import requests_mock
+
+from d3b_api_client_cli.config import config
+from d3b_api_client_cli.utils import rate_limit, retry
+from d3b_api_client_cli.utils import send_request
+
+
+@pytest.fixture
+def clock(mocker):
+    """
+    Fake monotonic clock that only moves when callers sleep
+    """
+    now = [0.0]
+
+    def sleep(seconds):
+        now[0] += seconds
+
+    async def async_sleep(seconds):
+        now[0] += seconds
+
+    mocker.patch.object(rate_limit.time, "monotonic", lambda: now[0])
+    mocker.patch.object(rate_limit.time, "sleep", sleep)
+    mocker.patch.object(rate_limit.asyncio, "sleep", async_sleep)
+
+    return now
+
+
+def test_token_bucket_rate(clock):
+    """
+    Test a burst goes out at once and the rest at the steady rate
+    """
+    bucket = rate_limit.TokenBucket(10, burst=5)
+    for _ in range(5):
+        bucket.acquire()
+    assert clock[0] == 0
+
+    for _ in range(10):
+        bucket.acquire()
+    assert clock[0] == pytest.approx(1.0)
+
+
+def test_token_bucket_async(clock):
+    """
+    Test async callers share the bucket without blocking the event loop
+    """
+    bucket = rate_limit.TokenBucket(2, burst=1)
+
+    async def run():
+        await asyncio.gather(*[bucket.acquire_async() for _ in range(5)])
+
+    asyncio.run(run())
+    assert clock[0] == pytest.approx(2.0)
+
+
+def test_token_bucket_threads(clock):
+    """
+    Test concurrent threads never take more tokens than the bucket allows
+    """
+    bucket = rate_limit.TokenBucket(1000, burst=10)
+    waits = []
+    lock = threading.Lock()
+
+    def take():
+        for _ in range(20):
+            wait = bucket._reserve()
+            with lock:
+                waits.append(wait)
+
+    threads = [threading.Thread(target=take) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # 10 from the burst, the other 90 spread out at 1ms each
+    assert sorted(waits) == pytest.approx(
+        [0] * 10 + [(i + 1) / 1000 for i in range(90)]
+    )
+
+
+def test_token_bucket_pause(clock):
+    """
+    Test pausing the bucket makes every caller wait
+    """
+    bucket = rate_limit.TokenBucket(None)
+    bucket.acquire()
+    assert clock[0] == 0
+
+    bucket.pause(5)
+    bucket.acquire()
+    assert clock[0] == 5
+
+
+def test_send_request_throttled(mocker):
+    """
+    Test a 429 response pauses the shared bucket for Retry-After seconds
+    """
+    mocker.patch.object(retry.time, "sleep")
+    pause = mocker.patch.object(rate_limit.TokenBucket, "pause")
+    rate_limit.reset_rate_limiter()
+
+    url = "https://dewrangle.com/files"
+    with requests_mock.Mocker() as m:
+        m.get(
+            url,
+            [
+                {"status_code": 429, "headers": {"Retry-After": "4"}},
+                {"status_code": 200},
+            ],
+        )
+        assert send_request("get", url).ok
+
+    pause.assert_called_once_with(4)
+    rate_limit.reset_rate_limiter()
+
+
+def test_send_request_throttled_post(mocker):
+    """
+    Test a throttled POST is not retried but still pauses the bucket
+    """
+    pause = mocker.patch.object(rate_limit.TokenBucket, "pause")
+    rate_limit.reset_rate_limiter()
+
+    url = "https://dewrangle.com/files"
+    with requests_mock.Mocker() as m:
+        m.post(url, status_code=429)
+        with pytest.raises(requests.exceptions.HTTPError):
+            send_request("post", url)
+
+    pause.assert_called_once_with(None)
+    rate_limit.reset_rate_limiter()
+
+
+def test_rate_limiter_default(mocker):
+    """
+    Test the shared bucket is unlimited unless a rate is configured
+    """
+    rate_limit.reset_rate_limiter()
+    assert rate_limit.get_rate_limiter().rate is None
+
+    mocker.patch.dict(
+        config["dewrangle"]["client"]["rate_limit"],
+        {"requests_per_second": 5, "burst": None},
+    )
+    rate_limit.reset_rate_limiter()
+    bucket = rate_limit.get_rate_limiter()
+    assert (bucket.rate, bucket.capacity) == (5, 5)
+    rate_limit.reset_rate_limiter()
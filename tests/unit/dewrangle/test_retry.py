@@ -0,0 +1,209 @@
+"""
+Test retrying transient failures of Dewrangle GraphQL and REST requests
+"""
+
+import asyncio
+import datetime
+from email.utils import format_datetime
+
+import aiohttp
+import pytest
+import requests
+import requests_mock
+from gql import gql
+
+from d3b_api_client_cli.dewrangle.graphql import common
+from d3b_api_client_cli.dewrangle.graphql.transport import (
+    DewrangleServerError,
+)
+from d3b_api_client_cli.utils import retry
+from d3b_api_client_cli.utils import send_request
+
+URL = "https://dewrangle.com/files"
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(mocker):
+    """
+    Don't actually wait between attempts and start with fresh counters
+    """
+    sleeps = []
+
+    async def mock_async_sleep(delay):
+        sleeps.append(delay)
+
+    mocker.patch.object(retry.time, "sleep", sleeps.append)
+    mocker.patch.object(retry.asyncio, "sleep", mock_async_sleep)
+    retry.reset_retry_counters()
+    yield sleeps
+    retry.reset_retry_counters()
+
+
+def test_parse_retry_after():
+    """
+    Test parsing Retry-After as seconds or an HTTP date
+    """
+    assert retry.parse_retry_after("7") == 7
+    assert retry.parse_retry_after(None) is None
+    assert retry.parse_retry_after("soon") is None
+
+    later = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+        seconds=60
+    )
+    assert 55 < retry.parse_retry_after(format_datetime(later, usegmt=True))
+
+
+def test_backoff_delay():
+    """
+    Test exponential backoff is bounded and honors Retry-After
+    """
+    policy = retry.RetryPolicy(backoff_base=1, backoff_max=4)
+    for attempt, bound in [(1, 1), (2, 2), (3, 4), (10, 4)]:
+        assert 0 <= policy.delay(attempt) <= bound
+    assert policy.delay(1, retry_after=10) == 10
+
+
+def test_send_request_retries_get(no_sleep):
+    """
+    Test idempotent requests are retried and Retry-After is honored
+    """
+    with requests_mock.Mocker() as m:
+        m.get(
+            URL,
+            [
+                {"status_code": 503, "headers": {"Retry-After": "3"}},
+                {"exc": requests.exceptions.ConnectionError},
+                {"status_code": 200, "content": b"foo"},
+            ],
+        )
+        resp = send_request("get", URL)
+
+        assert resp.content == b"foo"
+        assert m.call_count == 3
+
+    assert no_sleep[0] == 3
+    assert retry.retry_counters() == {
+        "rest": {"retries": 2, "recovered": 1, "exhausted": 0}
+    }
+
+
+def test_send_request_no_retry(no_sleep):
+    """
+    Test unsafe requests and non-transient errors are not retried
+    """
+    with requests_mock.Mocker() as m:
+        m.post(URL, status_code=503)
+        with pytest.raises(requests.exceptions.HTTPError):
+            send_request("post", URL)
+        assert m.call_count == 1
+
+        # PUT and DELETE are only retried if the caller opts in
+        m.delete(URL, status_code=503)
+        with pytest.raises(requests.exceptions.HTTPError):
+            send_request("delete", URL)
+        assert m.call_count == 2
+        m.put(URL, [{"status_code": 503}, {"status_code": 200}])
+        assert send_request("put", URL, retry_safe=True).ok
+        m.reset_mock()
+
+        m.get(URL, status_code=404)
+        with pytest.raises(requests.exceptions.HTTPError) as e:
+            send_request("get", URL)
+        assert "Problem sending" in str(e.value)
+        assert m.call_count == 1
+
+        # Explicitly marked retry-safe
+        m.post(URL, [{"status_code": 502}, {"status_code": 200}])
+        assert send_request("post", URL, retry_safe=True).ok
+
+    assert len(no_sleep) == 2
+
+
+def test_log_retry_counters(caplog, no_sleep):
+    """
+    Test the retry counters of the run are logged at the end of a command
+    """
+    with requests_mock.Mocker() as m:
+        m.get(URL, [{"status_code": 502}, {"status_code": 200}])
+        send_request("get", URL)
+
+    with caplog.at_level("INFO"):
+        retry.log_retry_counters()
+    assert "rest retries: 1, recovered: 1, exhausted: 0" in caplog.text
+
+
+def test_send_request_exhausted(no_sleep):
+    """
+    Test requests fail once the max number of attempts is reached
+    """
+    max_attempts = retry.default_retry_policy().max_attempts
+    with requests_mock.Mocker() as m:
+        m.get(URL, status_code=502)
+        with pytest.raises(requests.exceptions.HTTPError):
+            send_request("get", URL)
+        assert m.call_count == max_attempts
+
+    assert retry.retry_counters()["rest"]["exhausted"] == 1
+
+
+def test_exec_query_retries(mocker, no_sleep):
+    """
+    Test queries are retried on transient errors but mutations are not
+    unless they are marked retry-safe
+    """
+    errors = [
+        DewrangleServerError("bad gateway", 502, retry_after=2),
+        aiohttp.ServerDisconnectedError(),
+    ]
+
+    async def mock_execute(self, gql_query, variables=None):
+        if errors:
+            raise errors.pop(0)
+        return {"viewer": {"name": "foo"}}
+
+    mocker.patch.object(common.GraphQLSession, "_execute", mock_execute)
+
+    query = gql("query { viewer { name } }")
+    assert common.exec_query(query) == {"viewer": {"name": "foo"}}
+    assert no_sleep[0] == 2
+
+    mutation = gql("mutation { studyDelete(id: 1) { errors { message } } }")
+    errors.append(DewrangleServerError("unavailable", 503))
+    with pytest.raises(DewrangleServerError):
+        common.exec_query(mutation, delete_safety_check=False)
+
+    errors.append(DewrangleServerError("unavailable", 503))
+    assert common.exec_query(
+        mutation, delete_safety_check=False, retry_safe=True
+    )
+
+    # Not transient
+    errors.append(DewrangleServerError("bad request", 400))
+    with pytest.raises(DewrangleServerError):
+        common.exec_query(query)
+
+    assert retry.retry_counters() == {
+        "graphql": {"retries": 3, "recovered": 2, "exhausted": 0}
+    }
+    common.close_graphql_session()
+
+
+def test_async_exec_query_retries(mocker, no_sleep):
+    """
+    Test async queries are retried on timeouts
+    """
+    errors = [asyncio.TimeoutError()]
+
+    async def mock_execute(self, gql_query, variables=None):
+        if errors:
+            raise errors.pop(0)
+        return {"viewer": {"name": "foo"}}
+
+    mocker.patch.object(common.GraphQLSession, "_execute", mock_execute)
+
+    query = gql("query { viewer { name } }")
+    resp = asyncio.run(common.async_exec_query(query))
+
+    assert resp == {"viewer": {"name": "foo"}}
+    assert retry.retry_counters()["graphql"]["recovered"] == 1
+    common.close_graphql_session()
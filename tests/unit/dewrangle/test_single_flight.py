@@ -0,0 +1,125 @@
+"""
+Test single-flight collapsing of identical in-flight GraphQL queries
+"""
+
+import asyncio
+import threading
+import time
+
+from gql import gql
+
+from d3b_api_client_cli.dewrangle.graphql import common
+from d3b_api_client_cli.dewrangle.graphql.single_flight import (
+    SingleFlight,
+    flight_key,
+)
+
+
+def test_single_flight_threads():
+    """
+    Test identical calls from many threads share one call and one result
+    """
+    group = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fn():
+        calls.append(1)
+        release.wait()
+        return {"node": {"id": "s1"}}
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(group.do("k", fn)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(r is results[0] for r in results)
+
+    # The flight has landed, so the next call sends a new request
+    group.do("k", fn)
+    assert len(calls) == 2
+
+
+def test_single_flight_async_errors():
+    """
+    Test identical async calls share one call and its error, while other
+    keys get their own call
+    """
+    group = SingleFlight()
+    calls = []
+
+    async def fail():
+        calls.append("fail")
+        await asyncio.sleep(0.01)
+        raise ValueError("❌ boom")
+
+    async def succeed():
+        calls.append("succeed")
+        return {}
+
+    async def run():
+        return await asyncio.gather(
+            *[group.do_async("a", fail) for _ in range(3)],
+            group.do_async("b", succeed),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(r, ValueError) for r in results[:3])
+    assert results[3] == {}
+    assert calls == ["fail", "succeed"]
+
+
+def test_flight_key():
+    """
+    Test flight keys ignore the order of variables
+    """
+    query = gql("query($id: ID!) { node(id: $id) { id } }")
+
+    assert flight_key(query, {"id": "a", "first": 1}) == flight_key(
+        query, {"first": 1, "id": "a"}
+    )
+    assert flight_key(query, {"id": "a"}) != flight_key(query, {"id": "b"})
+
+
+def test_exec_query_collapses_queries_not_mutations(mocker):
+    """
+    Test concurrent identical queries share one request but identical
+    mutations are all sent
+    """
+    calls = []
+
+    async def mock_execute(self, gql_query, variables=None):
+        calls.append(gql_query)
+        await asyncio.sleep(0.1)
+        return {"viewer": {"name": "foo"}}
+
+    mocker.patch.object(common.GraphQLSession, "_execute", mock_execute)
+    common.close_graphql_session()
+
+    query = gql("query { viewer { name } }")
+    mutation = gql("mutation { viewerUpdate { name } }")
+
+    for document, expected in [(query, 1), (mutation, 4)]:
+        calls.clear()
+        threads = [
+            threading.Thread(target=common.exec_query, args=(document,))
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == expected
+
+    common.close_graphql_session()
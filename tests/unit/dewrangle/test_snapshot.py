@@ -0,0 +1,144 @@
+"""
+Test fetching the whole Dewrangle entity tree with nested queries
+"""
+
+import pytest
+from graphql import get_operation_ast
+
+from d3b_api_client_cli.config import config
+from d3b_api_client_cli.dewrangle.graphql import pagination, snapshot
+
+
+def connection(nodes, cursor=None):
+    return {
+        "totalCount": len(nodes),
+        "pageInfo": {"hasNextPage": bool(cursor), "endCursor": cursor},
+        "edges": [{"node": node} for node in nodes],
+    }
+
+
+def study(study_id, volumes_cursor=None):
+    return {
+        "id": study_id,
+        "globalId": f"sd-{study_id}",
+        "name": study_id,
+        "volumes": connection(
+            [{"id": f"v-{study_id}", "name": "bucket", "pathPrefix": study_id}],
+            volumes_cursor,
+        ),
+        "credentials": connection([{"id": f"c-{study_id}", "key": "key"}]),
+    }
+
+
+@pytest.fixture
+def requests(mocker):
+    """
+    Serve a tenant where only some connections have more pages
+    """
+    calls = []
+    responses = {
+        "snapshot": {
+            "viewer": {
+                "organizationUsers": connection(
+                    [
+                        {
+                            "organization": {
+                                "id": "o1",
+                                "name": "org1",
+                                "studies": connection(
+                                    [study("s1", volumes_cursor="v1")], "s1"
+                                ),
+                                "billingGroups": connection([]),
+                            }
+                        },
+                        {
+                            "organization": {
+                                "id": "o2",
+                                "name": "org2",
+                                "studies": connection([study("s3")]),
+                                "billingGroups": connection(
+                                    [
+                                        {
+                                            "id": "b1",
+                                            "cavaticaBillingGroupId": "b",
+                                        }
+                                    ]
+                                ),
+                            }
+                        },
+                    ]
+                )
+            }
+        },
+        "orgStudyTrees": {"node": {"studies": connection([study("s2")])}},
+        "studyVolumes": {
+            "node": {
+                "volumes": connection(
+                    [{"id": "v-s1-2", "name": "bucket", "pathPrefix": "more"}]
+                )
+            }
+        },
+    }
+
+    def exec_query(document, variables=None):
+        name = get_operation_ast(document).name.value
+        calls.append((name, dict(variables)))
+        return responses[name]
+
+    mocker.patch.object(pagination, "exec_query", exec_query)
+    mocker.patch.dict(
+        config["dewrangle"]["client"], {"persistent_session": False}
+    )
+
+    return calls
+
+
+def test_fetch_snapshot(requests):
+    """
+    Test the tree is fetched in one query plus one per connection with more
+    pages
+    """
+    result = snapshot.fetch_snapshot()
+
+    assert [name for name, _ in requests] == [
+        "snapshot",
+        "orgStudyTrees",
+        "studyVolumes",
+    ]
+    variables = requests[0][1]
+    assert variables["studiesFirst"] and variables["volumesFirst"]
+    assert requests[1][1]["id"] == "o1"
+    assert requests[1][1]["after"] == "s1"
+    assert requests[2][1]["id"] == "s1"
+    assert requests[2][1]["after"] == "v1"
+
+    assert [o["id"] for o in result["organizations"]] == ["o1", "o2"]
+    assert result["organizations"][0]["studies"] == {"totalCount": 1}
+    assert "billingGroups" not in result["organizations"][0]
+
+    assert sorted(result["studies"]) == ["sd-s1", "sd-s2", "sd-s3"]
+    assert result["studies"]["sd-s2"]["organization_id"] == "o1"
+    assert "volumes" not in result["studies"]["sd-s1"]
+
+    assert sorted(result["volumes"]) == [
+        "bucket::more",
+        "bucket::s1",
+        "bucket::s2",
+        "bucket::s3",
+    ]
+    assert result["volumes"]["bucket::more"]["s1"]["study_global_id"] == (
+        "sd-s1"
+    )
+    assert sorted(result["credentials"]["key"]) == ["s1", "s2", "s3"]
+    assert result["billing_groups"]["b"]["organization_id"] == "o2"
+
+
+def test_read_snapshot(requests, tmp_path):
+    """
+    Test each entity type is written to the file of its read_* function
+    """
+    snapshot.read_snapshot(str(tmp_path))
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        snapshot.SNAPSHOT_FILES.values()
+    )
@@ -0,0 +1,96 @@
+"""
+Test bulk upsert of studies from a manifest
+"""
+
+import csv
+import os
+
+from click.testing import CliRunner
+
+from d3b_api_client_cli.cli.dewrangle.study_commands import upsert_studies
+from d3b_api_client_cli.dewrangle.graphql import study
+from d3b_api_client_cli.dewrangle.graphql.study import mutations
+
+
+def test_upsert_studies(mocker, tmp_path):
+    """
+    Test existing studies are resolved with one pagination, each row is
+    created or updated and failed rows are reported without stopping the
+    others
+    """
+    mock_paginate = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.study.paginate_studies",
+        return_value={
+            "sd-0": {"id": "s0", "globalId": "sd-0", "organization_id": "o1"},
+            "sd-x": {"id": "sx", "globalId": "sd-x", "organization_id": "o2"},
+        },
+    )
+    mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.study.iter_organizations",
+        return_value=[{"id": "o1"}],
+    )
+
+    def exec_query(document, variables=None):
+        if document is mutations.update_study:
+            return {
+                "studyUpdate": {
+                    "study": {"id": variables["id"], "globalId": "sd-0"}
+                }
+            }
+        global_id = variables["input"]["globalId"]
+        if global_id == "sd-bad":
+            errors = [{"message": "name is invalid", "field": "name"}]
+            return {"studyCreate": {"errors": errors, "study": None}}
+        created = {"id": f"s-{global_id}", "globalId": global_id}
+        return {"studyCreate": {"study": created}}
+
+    mock_exec = mocker.patch(
+        "d3b_api_client_cli.dewrangle.graphql.study.exec_query",
+        side_effect=exec_query,
+    )
+
+    manifest = os.path.join(tmp_path, "studies.csv")
+    with open(manifest, "w", newline="") as csv_file:
+        writer = csv.DictWriter(
+            csv_file, fieldnames=["globalId", "name", "organization_id"]
+        )
+        writer.writeheader()
+        for i in range(11):
+            writer.writerow({"globalId": f"sd-{i}", "name": f"study {i}"})
+        writer.writerow(
+            {"globalId": "sd-0", "name": "again", "organization_id": "o2"}
+        )
+        writer.writerow({"globalId": "sd-x", "name": "moved"})
+        writer.writerow({"globalId": "sd-bad", "name": ""})
+
+    result = CliRunner().invoke(
+        upsert_studies,
+        [
+            manifest,
+            "--organization-id",
+            "o1",
+            "--output-dir",
+            str(tmp_path),
+        ],
+        standalone_mode=False,
+    )
+    assert result.exit_code == 0, result.exception
+
+    with open(result.return_value, newline="") as csv_file:
+        rows = list(csv.DictReader(csv_file))
+
+    assert [r["row"] for r in rows] == [str(i) for i in range(1, 15)]
+    assert rows[0]["action"] == "Update"
+    assert rows[0]["id"] == "s0"
+    assert {r["action"] for r in rows[1:11]} == {"Create"}
+    assert rows[5]["id"] == "s-sd-5"
+    assert not any(r["error"] for r in rows[:11])
+    assert rows[11]["error"] == "Duplicate of row 1"
+    assert "another organization" in rows[12]["error"]
+    assert rows[13]["error"] == "name is invalid"
+    assert not rows[13]["id"]
+
+    assert mock_paginate.call_count == 1
+    # The duplicate and the study in another organization are not sent
+    assert mock_exec.call_count == 12
+    assert study.find_study("sd-5")["id"] == "s-sd-5"
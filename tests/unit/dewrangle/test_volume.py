@@ -2,7 +2,10 @@
 Test Dewrangle volume related functionality
 """
 
+import asyncio
+
 import pytest
+from d3b_api_client_cli.dewrangle.graphql import aio, credential, volume
 from d3b_api_client_cli.dewrangle.graphql.volume import list_and_hash
 
 
@@ -79,3 +82,34 @@ def test_list_and_hash_no_volume(mocker):
     with pytest.raises(ValueError) as e:
         list_and_hash("billing", bucket="vol", study_global_id="study")
     assert "volume with ID" in str(e)
+
+
+def test_find_without_study(mocker):
+    """
+    Test volumes and credentials are not found without a study, instead of
+    matching the volume or credential of any other study
+    """
+    other_study = {"id": "S2", "globalId": "sd-2", "name": "other"}
+    mocker.patch.object(
+        volume,
+        "iter_volumes",
+        return_value=[
+            {"id": "V-S2", "name": "bucket", "pathPrefix": "p", **other_study}
+        ],
+    )
+    mocker.patch.object(
+        credential,
+        "iter_credentials",
+        return_value=[{"id": "C-S2", "key": "key", "study_id": "S2"}],
+    )
+
+    assert volume.find_volume("bucket", "p", None) == {}
+    assert credential.find_credential("key", None) == {}
+    assert asyncio.run(aio.find_volume("bucket", "p", None)) == {}
+    assert asyncio.run(aio.find_credential("key", None)) == {}
+
+    # Indexes are only built from the study's own volumes and credentials
+    assert volume.study_volume_index.load(None) == {}
+    assert credential.study_credential_index.load(None) == {}
+    volume.iter_volumes.assert_not_called()
+    credential.iter_credentials.assert_not_called()